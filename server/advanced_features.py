@@ -1,6 +1,42 @@
 import random
 
+import numpy as np
+
+from genre_index import GenreIndex
+
 class AdvancedFeatureEngine:
+    # Location Priors - Mapped to VALID Spotify Genres
+    LOCATION_GENRES = {
+        "Tokyo": ["j-pop", "j-rock", "anime"], 
+        "London": ["british", "indie-pop", "house"], 
+        "Paris": ["french", "electro", "chanson"], 
+        "NYC": ["hip-hop", "jazz", "punk"], 
+        "Rio": ["bossa-nova", "samba", "mpb"], 
+        "Berlin": ["techno", "minimal-techno", "industrial"],
+        "Mumbai": ["indian", "world-music"], 
+    }
+
+    AESTHETIC_PRESETS = {
+        "Vaporwave": {"target_tempo": 90, "target_danceability": 0.6, "seed_genres": ["synth-pop", "funk"]},
+        "Dark Academia": {"target_acousticness": 0.8, "target_instrumentalness": 0.7, "seed_genres": ["classical", "piano"]},
+        "Cyberpunk": {"target_energy": 0.9, "target_distortion": 0.8, "target_tempo": 140, "seed_genres": ["industrial", "techno"]},
+        "Cottagecore": {"target_acousticness": 0.9, "target_valence": 0.6, "seed_genres": ["folk", "acoustic", "country"]},
+        "Neo-Noir": {"target_valence": 0.2, "target_tempo": 70, "seed_genres": ["jazz", "trip-hop"]}
+    }
+
+    # Distinct genres Alternate You picks from when they are far from the user's
+    ALTERNATE_GENRES = ["classical", "metal", "country", "jazz", "techno", "reggae", "k-pop", "opera", "blues", "dubstep"]
+
+    @classmethod
+    def preset_genres(cls):
+        """Every seed genre the static presets can produce (for materialized candidate pools)."""
+        genres = []
+        for loc_genres in cls.LOCATION_GENRES.values():
+            genres.extend(loc_genres[:2])
+        for preset in cls.AESTHETIC_PRESETS.values():
+            genres.extend(preset['seed_genres'])
+        return list(dict.fromkeys(genres))
+
     def __init__(self, spotify_client):
         self.client = spotify_client
 
@@ -12,18 +48,8 @@ class AdvancedFeatureEngine:
         params = {}
         seed_genres = []
 
-        # Location Priors - Mapped to VALID Spotify Genres
-        loc_map = {
-            "Tokyo": ["j-pop", "j-rock", "anime"], 
-            "London": ["british", "indie-pop", "house"], 
-            "Paris": ["french", "electro", "chanson"], 
-            "NYC": ["hip-hop", "jazz", "punk"], 
-            "Rio": ["bossa-nova", "samba", "mpb"], 
-            "Berlin": ["techno", "minimal-techno", "industrial"],
-            "Mumbai": ["indian", "world-music"], 
-        }
-        if location in loc_map:
-            seed_genres.extend(loc_map[location][:2])
+        if location in self.LOCATION_GENRES:
+            seed_genres.extend(self.LOCATION_GENRES[location][:2])
 
         # Weather -> Audio Features
         if weather == "Rain":
@@ -56,32 +82,29 @@ class AdvancedFeatureEngine:
         """
         Maps aesthetic names to musical attributes and SEED GENRES.
         """
-        presets = {
-            "Vaporwave": {"target_tempo": 90, "target_danceability": 0.6, "seed_genres": ["synth-pop", "funk"]},
-            "Dark Academia": {"target_acousticness": 0.8, "target_instrumentalness": 0.7, "seed_genres": ["classical", "piano"]},
-            "Cyberpunk": {"target_energy": 0.9, "target_distortion": 0.8, "target_tempo": 140, "seed_genres": ["industrial", "techno"]},
-            "Cottagecore": {"target_acousticness": 0.9, "target_valence": 0.6, "seed_genres": ["folk", "acoustic", "country"]},
-            "Neo-Noir": {"target_valence": 0.2, "target_tempo": 70, "seed_genres": ["jazz", "trip-hop"]}
-        }
-        data = presets.get(aesthetic, {})
+        # Copy: the presets are shared class data
+        data = dict(self.AESTHETIC_PRESETS.get(aesthetic, {}))
         seed_genres = data.pop('seed_genres', [])
         return data, seed_genres
 
     # 🪞 4. Alternate You
-    def alternate_you(self, top_genres):
+    def alternate_you(self, top_genres, genre_index=None):
         """
         Recommends opposite of user's taste using SEED GENRES.
+        genre_index (the user's artists) also counts genres that co-occur with theirs.
         """
-        # List of distinct genres to pick from if they are NOT in top_genres
-        all_genres = ["classical", "metal", "country", "jazz", "techno", "reggae", "k-pop", "opera", "blues", "dubstep"]
-        
-        # Find genres the user DOESN'T listen to
-        user_genres_str = " ".join([g[0] for g in top_genres]).lower()
-        anti_genres = [g for g in all_genres if g not in user_genres_str]
-        
-        if not anti_genres:
-            anti_genres = all_genres # Fallback
-            
+        if genre_index is None:
+            genre_index = GenreIndex([[g] for g, _ in top_genres])
+
+        # Find genres the user DOESN'T listen to: no shared word with (or artist-level neighbour of) theirs
+        affinity = genre_index.affinity(self.ALTERNATE_GENRES, genre_index.profile(top_genres))
+        anti_genres = [g for g, a in zip(self.ALTERNATE_GENRES, affinity) if a == 0]
+
+        if len(anti_genres) < 2:
+            # Everything overlaps somewhat: the farthest half
+            order = np.argsort(affinity, kind='stable')
+            anti_genres = [self.ALTERNATE_GENRES[i] for i in order[:len(order) // 2]]
+
         # Pick 2 random anti-genres
         seed_genres = random.sample(anti_genres, min(2, len(anti_genres)))
         
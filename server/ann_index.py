@@ -0,0 +1,288 @@
+import os
+import threading
+
+import numpy as np
+
+from feature_store import DATA_DIR
+from normalizer import RunningNormalizer
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'ann_index.npz')
+
+
+def _l2_normalize(X):
+    X = np.asarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first (partial selection, then sort only k)."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _spherical_kmeans(X, n_clusters, iters=10, seed=0):
+    """k-means on unit vectors (assignment by inner product); returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), n_clusters, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(X @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, X)
+        counts = np.bincount(assign, minlength=n_clusters)
+        # Empty clusters keep their previous centroid
+        nonempty = counts > 0
+        centroids[nonempty] = _l2_normalize(sums[nonempty])
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over L2-normalized vectors
+    (so inner product == cosine similarity), in pure numpy.
+
+    - Below min_train vectors it is an exact brute-force index.
+    - Once trained, vectors are bucketed under ~4*sqrt(n) centroids and a query
+      only scans the nprobe closest buckets, so latency grows sub-linearly.
+    - add() assigns new vectors to the existing centroids (no rebuild); the
+      centroids are retrained only when the index has grown retrain_factor times.
+    - With a normalizer set, add() takes raw feature vectors and scales them
+      with that frozen copy of the statistics; the raw vectors are kept so
+      set_normalizer() can rescale everything when the global stats move on.
+      Queries must be scaled with index.normalizer too.
+    """
+    def __init__(self, dim, nprobe=8, min_train=2048, retrain_factor=8, max_lists=4096):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.retrain_factor = retrain_factor
+        self.max_lists = max_lists
+
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._raw = np.zeros((0, dim), dtype=np.float32)
+        self.normalizer = None  # frozen RunningNormalizer the vectors were scaled with
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._ids = []
+        self._rows = {}  # id -> row
+        self._n = 0
+        self.centroids = None
+        self._trained_at = 0
+        self._lists = []        # per-centroid Python lists of rows (append-friendly)
+        self._list_arrays = []  # cached np views of _lists, None when dirty
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    # --- Building ---
+
+    def add(self, ids, X):
+        """Adds (or replaces) vectors. X: (len(ids), dim), raw when a normalizer is set."""
+        raw = np.asarray(X, dtype=np.float32).reshape(len(ids), self.dim)
+        with self._lock:
+            X = self._scale(raw)
+            new_rows = []
+            for item_id, vec, raw_vec in zip(ids, X, raw):
+                row = self._rows.get(item_id)
+                if row is not None:
+                    self._vectors[row] = vec
+                    self._raw[row] = raw_vec
+                    if self.is_trained:
+                        self._move(row, vec)
+                    continue
+                row = self._append(item_id, vec, raw_vec)
+                new_rows.append(row)
+
+            if not self.is_trained:
+                if self._n >= self.min_train:
+                    self.train()
+            elif self._n >= self._trained_at * self.retrain_factor:
+                self.train()
+            elif new_rows:
+                self._assign_rows(np.asarray(new_rows))
+
+    def set_normalizer(self, normalizer):
+        """Freezes normalizer's current statistics for this index and rescales every stored vector."""
+        with self._lock:
+            self.normalizer = normalizer.frozen()
+            n = self._n
+            if n:
+                self._vectors[:n] = self._scale(self._raw[:n])
+                if self.is_trained:
+                    self.train()
+
+    def _scale(self, raw):
+        if self.normalizer is not None:
+            raw = self.normalizer.transform(raw)
+        return _l2_normalize(raw)
+
+    def train(self):
+        """(Re)computes centroids from the current vectors and rebuilds the inverted lists."""
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return
+            X = self._vectors[:n]
+            n_lists = max(1, min(self.max_lists, int(4 * np.sqrt(n)), n))
+            sample = X
+            if n > 64 * n_lists:
+                rows = np.random.default_rng(0).choice(n, 64 * n_lists, replace=False)
+                sample = X[rows]
+            self.centroids = _spherical_kmeans(sample, n_lists)
+            self._trained_at = n
+            self._lists = [[] for _ in range(n_lists)]
+            self._list_arrays = [None] * n_lists
+            self._assign_rows(np.arange(n))
+
+    def _append(self, item_id, vec, raw_vec):
+        if self._n == len(self._vectors):
+            capacity = max(1024, 2 * len(self._vectors))
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            vectors[:self._n] = self._vectors[:self._n]
+            raw = np.zeros((capacity, self.dim), dtype=np.float32)
+            raw[:self._n] = self._raw[:self._n]
+            assign = np.full(capacity, -1, dtype=np.int32)
+            assign[:self._n] = self._assign[:self._n]
+            self._vectors, self._raw, self._assign = vectors, raw, assign
+        row = self._n
+        self._vectors[row] = vec
+        self._raw[row] = raw_vec
+        self._assign[row] = -1
+        self._ids.append(item_id)
+        self._rows[item_id] = row
+        self._n += 1
+        return row
+
+    def _assign_rows(self, rows):
+        nearest = np.argmax(self._vectors[rows] @ self.centroids.T, axis=1)
+        for row, c in zip(rows.tolist(), nearest.tolist()):
+            self._assign[row] = c
+            self._lists[c].append(row)
+            self._list_arrays[c] = None
+
+    def _move(self, row, vec):
+        c_new = int(np.argmax(self.centroids @ vec))
+        c_old = int(self._assign[row])
+        if c_new == c_old:
+            return
+        if c_old >= 0:
+            self._lists[c_old].remove(row)
+            self._list_arrays[c_old] = None
+        self._assign[row] = c_new
+        self._lists[c_new].append(row)
+        self._list_arrays[c_new] = None
+
+    def _list_rows(self, c):
+        arr = self._list_arrays[c]
+        if arr is None:
+            arr = np.asarray(self._lists[c], dtype=np.int64)
+            self._list_arrays[c] = arr
+        return arr
+
+    # --- Querying ---
+
+    def search(self, query, k=10, nprobe=None, exclude=None):
+        """
+        Returns [(id, cosine similarity)] for the approximate top-k, best first.
+        exclude: optional set of ids to skip.
+        """
+        q = _l2_normalize(np.asarray(query).reshape(self.dim))
+        exclude = exclude or set()
+        with self._lock:
+            if self._n == 0:
+                return []
+            if not self.is_trained:
+                rows = np.arange(self._n)
+            else:
+                probe = _top_k(self.centroids @ q, nprobe or self.nprobe)
+                rows = np.concatenate([self._list_rows(c) for c in probe.tolist()])
+            scores = self._vectors[rows] @ q
+            # Over-select so excluded ids can be dropped without a second pass
+            top = _top_k(scores, k + len(exclude))
+            results = []
+            for i in top.tolist():
+                item_id = self._ids[rows[i]]
+                if item_id in exclude:
+                    continue
+                results.append((item_id, float(scores[i])))
+                if len(results) >= k:
+                    break
+            return results
+
+    # --- Persistence ---
+
+    def save(self, path=DEFAULT_PATH):
+        """Atomic write, so other workers never load a half-written index."""
+        with self._lock:
+            n = self._n
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp.npz'
+            stats = self.normalizer
+            np.savez(
+                tmp,
+                vectors=self._vectors[:n],
+                raw=self._raw[:n],
+                norm_state=np.asarray([stats.count, stats.version] if stats is not None else [], dtype=np.int64),
+                norm_mean=stats.mean if stats is not None else np.zeros(0),
+                norm_m2=stats._m2 if stats is not None else np.zeros(0),
+                ids=np.asarray(self._ids, dtype=str),
+                centroids=self.centroids if self.is_trained else np.zeros((0, self.dim), dtype=np.float32),
+                meta=np.asarray([self.nprobe, self.min_train, self.retrain_factor, self.max_lists, self._trained_at]),
+            )
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        data = np.load(path)
+        if 'raw' not in data:
+            raise ValueError("snapshot predates raw vectors (scaling stats unknown)")
+        vectors = data['vectors']
+        nprobe, min_train, retrain_factor, max_lists, trained_at = data['meta'].tolist()
+        index = cls(vectors.shape[1], nprobe=nprobe, min_train=min_train,
+                    retrain_factor=retrain_factor, max_lists=max_lists)
+        index._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index._raw = np.ascontiguousarray(data['raw'], dtype=np.float32)
+        if len(data['norm_state']):
+            stats = RunningNormalizer(index.dim)
+            stats.count, stats.version = data['norm_state'].tolist()
+            stats.mean, stats._m2 = data['norm_mean'], data['norm_m2']
+            index.normalizer = stats
+        index._n = len(vectors)
+        index._assign = np.full(index._n, -1, dtype=np.int32)
+        index._ids = data['ids'].tolist()
+        index._rows = {item_id: row for row, item_id in enumerate(index._ids)}
+        if len(data['centroids']):
+            index.centroids = data['centroids']
+            index._trained_at = trained_at
+            index._lists = [[] for _ in range(len(index.centroids))]
+            index._list_arrays = [None] * len(index.centroids)
+            index._assign_rows(np.arange(index._n))
+        return index
+
+
+_index = None
+
+
+def get_ann_index(dim, path=DEFAULT_PATH):
+    """Process-wide index, loaded from data/ when a snapshot exists."""
+    global _index
+    if _index is None:
+        if os.path.exists(path):
+            try:
+                _index = IVFIndex.load(path)
+            except Exception as e:
+                print(f"Failed to load ANN index, starting empty: {e}")
+        if _index is None or _index.dim != dim:
+            _index = IVFIndex(dim)
+    return _index
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from feature_store import DATA_DIR, FAILURE_TTL, NEGATIVE_TTL, _SQL_CHUNK
+from track import Track
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'artists.sqlite')
+
+# Spotify's several-artists endpoint accepts at most 50 IDs per call
+ARTISTS_BATCH = 50
+# Names, genres and images change rarely
+ARTIST_TTL = int(os.getenv('ARTIST_TTL_SECONDS', str(7 * 24 * 3600)))
+TOP_TRACKS_TTL = 24 * 3600
+
+
+def compact_artist(a):
+    """The fields of a Spotify artist object we read (name, genres, images, link)."""
+    images = a.get('images') or []
+    return {
+        'id': a['id'],
+        'name': a['name'],
+        'genres': a.get('genres', []),
+        'images': images[:1],
+        'external_urls': a.get('external_urls', {}),
+    }
+
+
+class ArtistStore:
+    """
+    Persistent artist metadata shared across users and processes (SQLite, WAL
+    mode like the FeatureStore):
+    - artists: compacted artist objects, refetched after ARTIST_TTL
+    - artist_top_tracks: each artist's top tracks per country
+    - track_artists: track ID -> artist IDs, recorded from every track object
+      we see, so track seeds resolve to artists without a sp.tracks call
+    """
+    def __init__(self, path=DEFAULT_PATH, ttl=ARTIST_TTL):
+        self.path = path
+        self.ttl = ttl
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS artists ("
+                " artist_id TEXT PRIMARY KEY, data TEXT, fetched_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS artist_top_tracks ("
+                " artist_id TEXT, country TEXT, tracks TEXT, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (artist_id, country));"
+                "CREATE TABLE IF NOT EXISTS track_artists ("
+                " track_id TEXT PRIMARY KEY, artist_ids TEXT NOT NULL);"
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM artists WHERE data IS NOT NULL").fetchone()[0]
+
+    def _select(self, sql, ids):
+        rows = []
+        with self._lock:
+            for i in range(0, len(ids), _SQL_CHUNK):
+                chunk = ids[i:i + _SQL_CHUNK]
+                rows.extend(self._conn.execute(sql.format(','.join('?' * len(chunk))), chunk))
+        return rows
+
+    # --- Artists ---
+
+    def get_many(self, artist_ids):
+        """Returns (artists, missing): {artist_id: compact artist} for fresh entries, IDs to fetch."""
+        unique_ids = [a for a in dict.fromkeys(artist_ids) if a]
+        rows = self._select("SELECT artist_id, data, fetched_at FROM artists WHERE artist_id IN ({})", unique_ids)
+
+        now = time.time()
+        artists, fresh = {}, set()
+        for artist_id, data, fetched_at in rows:
+            if now - fetched_at <= (self.ttl if data is not None else NEGATIVE_TTL):
+                fresh.add(artist_id)
+                if data is not None:
+                    artists[artist_id] = json.loads(data)
+        return artists, [a for a in unique_ids if a not in fresh]
+
+    def put_many(self, items, negative_ttl=NEGATIVE_TTL):
+        """items: {artist_id: Spotify artist object | None (unknown to Spotify, retried after negative_ttl)}."""
+        now = time.time()
+        # Negative entries expire NEGATIVE_TTL after fetched_at: backdate shorter ones
+        negative_at = now - (NEGATIVE_TTL - min(negative_ttl, NEGATIVE_TTL))
+        records = [
+            (aid, json.dumps(compact_artist(a)), now) if a else (aid, None, negative_at)
+            for aid, a in items.items() if aid
+        ]
+        if records:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO artists (artist_id, data, fetched_at) VALUES (?, ?, ?)", records
+                )
+
+    async def ensure(self, artist_ids, fetch, batch_size=ARTISTS_BATCH):
+        """
+        Same as get_many, but fills misses first. fetch(batch) is awaited for
+        batches of up to batch_size IDs and must return a list aligned with the
+        batch (artist object or None), like sp.artists(batch)['artists'].
+        Returns {artist_id: compact artist}.
+        """
+        artists, missing = self.get_many(artist_ids)
+        if not missing:
+            return artists
+
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        results = await asyncio.gather(*(fetch(b) for b in batches), return_exceptions=True)
+
+        fetched, failed = {}, {}
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                # Short negative entries: requests don't re-send calls that just failed
+                print(f"Artists fetch failed: {result}")
+                failed.update((aid, None) for aid in batch)
+                continue
+            for aid, artist in zip(batch, result or []):
+                fetched[aid] = artist
+        self.put_many(fetched)
+        self.put_many(failed, negative_ttl=FAILURE_TTL)
+        artists.update((aid, compact_artist(a)) for aid, a in fetched.items() if a)
+        return artists
+
+    # --- Top tracks ---
+
+    def top_tracks(self, artist_id, country, ttl=TOP_TRACKS_TTL):
+        """The artist's stored top tracks ([Track]), or None when unknown or older than ttl."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tracks, fetched_at FROM artist_top_tracks WHERE artist_id = ? AND country = ?",
+                (artist_id, country)
+            ).fetchone()
+        if row is None or time.time() - row[1] > ttl:
+            return None
+        return [Track(**d) for d in json.loads(row[0])]
+
+    def put_top_tracks(self, artist_id, country, tracks):
+        data = json.dumps([dict(t.to_dict(), popularity=t.popularity) for t in tracks])
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artist_top_tracks (artist_id, country, tracks, fetched_at)"
+                " VALUES (?, ?, ?, ?)", (artist_id, country, data, time.time())
+            )
+
+    # --- Track -> artists ---
+
+    def record_tracks(self, tracks):
+        """Remembers the artists of Spotify track objects (any shape with id and artists[].id)."""
+        records = []
+        for t in tracks:
+            if not t or not t.get('id'):
+                continue
+            artist_ids = [a['id'] for a in t.get('artists', []) if a.get('id')]
+            if artist_ids:
+                records.append((t['id'], ','.join(artist_ids)))
+        if records:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO track_artists (track_id, artist_ids) VALUES (?, ?)", records
+                )
+
+    def track_artists(self, track_ids):
+        """{track_id: [artist_id, ...]} for the tracks we have seen (main artist first)."""
+        rows = self._select(
+            "SELECT track_id, artist_ids FROM track_artists WHERE track_id IN ({})", list(dict.fromkeys(track_ids))
+        )
+        return {tid: ids.split(',') for tid, ids in rows}
+
+
+_store = None
+
+
+def get_artist_store():
+    """Process-wide store instance (one SQLite connection per worker)."""
+    global _store
+    if _store is None:
+        _store = ArtistStore()
+    return _store
@@ -0,0 +1,313 @@
+import asyncio
+import functools
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+from spotipy.exceptions import SpotifyException
+
+from rate_limiter import INTERACTIVE, current_priority, get_scheduler
+from metrics import SPOTIFY_CALL_SECONDS, SPOTIFY_CALL_ERRORS, SPOTIFY_RATE_LIMITED
+
+API_BASE = "https://api.spotify.com/v1/"
+# How many times a call re-queues after a 429 before giving up
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Tunable attributes accepted by the recommendations endpoint (same list spotipy filters on)
+TUNABLE_ATTRIBUTES = [
+    'acousticness', 'danceability', 'duration_ms', 'energy', 'instrumentalness',
+    'key', 'liveness', 'loudness', 'mode', 'popularity', 'speechiness',
+    'tempo', 'time_signature', 'valence'
+]
+
+# Per-token AsyncSpotify objects kept for reuse, and how long an unused one is kept
+CLIENT_POOL_SIZE = int(os.getenv('SPOTIFY_CLIENT_POOL_SIZE', '5000'))
+CLIENT_IDLE_TTL = int(os.getenv('SPOTIFY_CLIENT_IDLE_SECONDS', str(15 * 60)))
+
+_http_client = None
+
+
+def get_http_client():
+    """
+    Returns the worker-wide keep-alive HTTP client.
+    Every AsyncSpotify instance shares this pool, so connections (and TLS sessions)
+    to api.spotify.com are reused across requests and users.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=API_BASE,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60.0),
+        )
+    return _http_client
+
+
+async def warm_http_client():
+    """Opens a keep-alive connection to api.spotify.com so the first request skips the TLS handshake."""
+    try:
+        await get_http_client().head('')
+    except httpx.HTTPError as e:
+        print(f"HTTP pool warm-up failed: {e}")
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def instrumented(method):
+    """Records latency and failures of an AsyncSpotify method under its spotipy name."""
+    latency = SPOTIFY_CALL_SECONDS.labels(method.__name__)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        except SpotifyException as e:
+            SPOTIFY_CALL_ERRORS.labels(method.__name__, str(e.http_status)).inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def token_key(token):
+    """Stable, non-reversible key for an access token."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+class ClientPool:
+    """
+    AsyncSpotify objects by token hash, LRU-bounded, dropped after CLIENT_IDLE_TTL
+    without use. All of them share the worker's keep-alive HTTP pool, and they
+    hold no per-request state, so one object serves concurrent requests of a
+    session (SpotifyClient, with its request memo, stays per request).
+    """
+    def __init__(self, max_size=CLIENT_POOL_SIZE, idle_ttl=CLIENT_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()  # token_key -> (AsyncSpotify, last_used)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, token):
+        key = token_key(token)
+        now = time.time()
+        entry = self._clients.get(key)
+        if entry is not None:
+            self.hits += 1
+            sp = entry[0]
+            self._clients.move_to_end(key)
+        else:
+            self.misses += 1
+            sp = AsyncSpotify(auth=token)
+        self._clients[key] = (sp, now)
+        self._evict(now)
+        return sp
+
+    def discard(self, token):
+        """Logout: stop handing out the token's client."""
+        self._clients.pop(token_key(token), None)
+
+    def _evict(self, now):
+        # Least recently used first, so only the front needs checking
+        while self._clients:
+            _, last_used = next(iter(self._clients.values()))
+            if len(self._clients) <= self.max_size and now - last_used <= self.idle_ttl:
+                break
+            self._clients.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {'size': len(self._clients), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+_client_pool = None
+
+
+def get_client_pool():
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = ClientPool()
+    return _client_pool
+
+
+class AppToken:
+    """
+    Client-credentials token for background jobs that act for no particular user
+    (catalogue prefetch). Cached until shortly before it expires.
+    """
+    TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+    def __init__(self, client_id=None, client_secret=None):
+        self.client_id = client_id or os.getenv('SPOTIPY_CLIENT_ID')
+        self.client_secret = client_secret or os.getenv('SPOTIPY_CLIENT_SECRET')
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        async with self._lock:
+            if self._token is None or time.time() > self._expires_at - 60:
+                if not self.client_id or not self.client_secret:
+                    raise ValueError("Missing Spotify credentials in .env file")
+                response = await get_http_client().post(
+                    self.TOKEN_URL,
+                    data={'grant_type': 'client_credentials'},
+                    auth=(self.client_id, self.client_secret),
+                )
+                response.raise_for_status()
+                info = response.json()
+                self._token = info['access_token']
+                self._expires_at = time.time() + info.get('expires_in', 3600)
+            return self._token
+
+    async def client(self):
+        """AsyncSpotify authenticated as the app."""
+        return AsyncSpotify(auth=await self.get())
+
+
+class AsyncSpotify:
+    """
+    Async replacement for the subset of spotipy.Spotify used by SpotifyClient.
+    Method names and arguments mirror spotipy so the calling code reads the same;
+    errors are raised as SpotifyException, like spotipy does.
+    """
+    def __init__(self, auth, http_client=None, scheduler=None):
+        self.auth = auth
+        self._http = http_client
+        self._scheduler = scheduler
+
+    @property
+    def http(self):
+        return self._http or get_http_client()
+
+    @property
+    def scheduler(self):
+        return self._scheduler or get_scheduler()
+
+    async def _get(self, path, **params):
+        params = {k: v for k, v in params.items() if v is not None}
+        headers = {'Authorization': f'Bearer {self.auth}'}
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            # Every call waits for a slot from the process-wide scheduler
+            await self.scheduler.acquire()
+            try:
+                response = await self.http.get(path, params=params, headers=headers)
+            except httpx.HTTPError as e:
+                raise SpotifyException(599, -1, f"{path}: {e}")
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                break
+            # Pause everyone (up to the scheduler's max_pause), then re-queue behind the pause
+            SPOTIFY_RATE_LIMITED.inc()
+            try:
+                retry_after = float(response.headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1.0
+            self.scheduler.pause(retry_after)
+            if retry_after > self.scheduler.max_pause and current_priority() == INTERACTIVE:
+                # A user is waiting: fail with the 429 now rather than after minutes
+                break
+
+        if response.status_code >= 400:
+            try:
+                msg = response.json()['error']['message']
+            except Exception:
+                msg = response.text or 'error'
+            raise SpotifyException(
+                response.status_code, -1, f"{response.url}:\n {msg}",
+                reason=response.reason_phrase, headers=response.headers
+            )
+        if not response.content:
+            return None
+        return response.json()
+
+    # --- Current user ---
+
+    @instrumented
+    async def current_user(self):
+        return await self._get('me')
+
+    @instrumented
+    async def current_user_saved_tracks(self, limit=20, offset=0, market=None):
+        return await self._get('me/tracks', limit=limit, offset=offset, market=market)
+
+    @instrumented
+    async def current_user_playlists(self, limit=50, offset=0):
+        return await self._get('me/playlists', limit=limit, offset=offset)
+
+    @instrumented
+    async def current_user_top_artists(self, limit=20, offset=0, time_range='medium_term'):
+        return await self._get('me/top/artists', limit=limit, offset=offset, time_range=time_range)
+
+    @instrumented
+    async def current_user_top_tracks(self, limit=20, offset=0, time_range='medium_term'):
+        return await self._get('me/top/tracks', limit=limit, offset=offset, time_range=time_range)
+
+    @instrumented
+    async def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None, additional_types=('track',)):
+        return await self._get(
+            f'playlists/{playlist_id}/tracks', fields=fields, limit=limit, offset=offset, market=market,
+            additional_types=','.join(additional_types)
+        )
+
+    # --- Catalogue ---
+
+    @instrumented
+    async def new_releases(self, country=None, limit=20, offset=0):
+        return await self._get('browse/new-releases', country=country, limit=limit, offset=offset)
+
+    @instrumented
+    async def search(self, q, limit=10, offset=0, type='track', market=None):
+        return await self._get('search', q=q, limit=limit, offset=offset, type=type, market=market)
+
+    @instrumented
+    async def artist(self, artist_id):
+        return await self._get(f'artists/{artist_id}')
+
+    @instrumented
+    async def artists(self, artist_ids):
+        return await self._get('artists', ids=','.join(artist_ids))
+
+    @instrumented
+    async def artist_top_tracks(self, artist_id, country='US'):
+        return await self._get(f'artists/{artist_id}/top-tracks', country=country)
+
+    @instrumented
+    async def tracks(self, track_ids, market=None):
+        return await self._get('tracks', ids=','.join(track_ids), market=market)
+
+    @instrumented
+    async def audio_features(self, tracks=[]):
+        results = await self._get('audio-features', ids=','.join(tracks))
+        if results and 'audio_features' in results:
+            return results['audio_features']
+        return results
+
+    @instrumented
+    async def recommendations(self, seed_artists=None, seed_genres=None, seed_tracks=None, limit=20, country=None, **kwargs):
+        params = {'limit': limit}
+        if seed_artists:
+            params['seed_artists'] = ','.join(seed_artists)
+        if seed_genres:
+            params['seed_genres'] = ','.join(seed_genres)
+        if seed_tracks:
+            params['seed_tracks'] = ','.join(seed_tracks)
+        if country:
+            params['market'] = country
+        for attribute in TUNABLE_ATTRIBUTES:
+            for prefix in ('min_', 'max_', 'target_'):
+                param = prefix + attribute
+                if param in kwargs:
+                    params[param] = kwargs[param]
+        return await self._get('recommendations', **params)
@@ -0,0 +1,215 @@
+import os
+import shutil
+import subprocess
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from functools import lru_cache
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+ROLLOFF_PERCENT = 0.85
+# 13 MFCC + 1 Centroid + 1 Rolloff (same layout as FeatureExtractor.LIBROSA_FEATURES)
+FEATURE_DIM = N_MFCC + 2
+
+
+# --- Decoding ---
+
+def decode_audio(path, sr=SAMPLE_RATE):
+    """
+    Decodes an audio file to mono float32 samples at `sr`.
+    MP3 previews are decoded with ffmpeg (must be on PATH); plain PCM WAV files
+    are read directly.
+    """
+    if path.lower().endswith('.wav'):
+        return _read_wav(path, sr)
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg is required to decode compressed previews")
+    proc = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', path, '-f', 'f32le', '-ac', '1', '-ar', str(sr), '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=60,
+    )
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+
+def _read_wav(path, sr):
+    with wave.open(path, 'rb') as w:
+        n_channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width == 2:
+        y = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 4:
+        y = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    elif width == 1:
+        y = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+    y = y.reshape(-1, n_channels).mean(axis=1)
+    if rate != sr:
+        # Linear resampling is enough for summary statistics
+        t_out = np.arange(int(len(y) * sr / rate)) * (rate / sr)
+        y = np.interp(t_out, np.arange(len(y)), y).astype(np.float32)
+    return y
+
+
+# --- DSP building blocks (numpy only: framed STFT -> mel filterbank -> DCT) ---
+
+def frame_signal(y, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """Centered (reflect-padded) frames as a strided (n_frames, n_fft) view."""
+    y = np.pad(y, n_fft // 2, mode='reflect') if len(y) > n_fft // 2 else np.pad(y, (n_fft // 2, n_fft // 2))
+    if len(y) < n_fft:
+        y = np.pad(y, (0, n_fft - len(y)))
+    n_frames = 1 + (len(y) - n_fft) // hop_length
+    return np.lib.stride_tricks.as_strided(
+        y, shape=(n_frames, n_fft), strides=(y.strides[0] * hop_length, y.strides[0]), writeable=False
+    )
+
+
+@lru_cache(maxsize=8)
+def _hann(n_fft):
+    return np.hanning(n_fft + 1)[:-1].astype(np.float32)
+
+
+def stft_magnitude(y, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """|STFT| as (n_frames, n_fft // 2 + 1) float32."""
+    frames = frame_signal(np.asarray(y, dtype=np.float32), n_fft, hop_length)
+    return np.abs(np.fft.rfft(frames * _hann(n_fft), axis=1)).astype(np.float32)
+
+
+def _hz_to_mel(f):
+    return 2595.0 * np.log10(1.0 + f / 700.0)
+
+
+def _mel_to_hz(m):
+    return 700.0 * (10.0 ** (m / 2595.0) - 1.0)
+
+
+@lru_cache(maxsize=8)
+def mel_filterbank(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS):
+    """Triangular, area-normalized mel filters as (n_mels, n_fft // 2 + 1)."""
+    fft_freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    hz_points = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sr / 2), n_mels + 2))
+    lower, center, upper = hz_points[:-2, None], hz_points[1:-1, None], hz_points[2:, None]
+    rising = (fft_freqs - lower) / (center - lower)
+    falling = (upper - fft_freqs) / (upper - center)
+    filters = np.maximum(0.0, np.minimum(rising, falling))
+    filters *= 2.0 / (upper - lower)
+    return filters.astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def dct_matrix(n_mfcc=N_MFCC, n_mels=N_MELS):
+    """Orthonormal DCT-II basis as (n_mfcc, n_mels)."""
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    basis = np.cos(np.pi / n_mels * (n + 0.5) * k) * np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+
+def _power_to_db(S, top_db=80.0):
+    S_db = 10.0 * np.log10(np.maximum(S, 1e-10))
+    return np.maximum(S_db, S_db.max() - top_db)
+
+
+# --- Features ---
+
+def extract_features(y, sr=SAMPLE_RATE):
+    """
+    Summary timbre vector for a signal: mean of 13 MFCCs, spectral centroid (Hz)
+    and spectral rolloff (Hz) over all frames. Returns float32 (FEATURE_DIM,).
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if len(y) == 0 or not np.any(y):
+        return np.zeros(FEATURE_DIM, dtype=np.float32)
+
+    mag = stft_magnitude(y)
+    power = mag ** 2
+
+    mel = power @ mel_filterbank(sr).T
+    mfcc = _power_to_db(mel) @ dct_matrix().T
+
+    freqs = np.linspace(0, sr / 2, mag.shape[1], dtype=np.float32)
+    totals = mag.sum(axis=1)
+    voiced = totals > 0
+    centroid = (mag[voiced] @ freqs) / totals[voiced]
+
+    cumulative = np.cumsum(mag[voiced], axis=1)
+    rolloff_bins = np.argmax(cumulative >= ROLLOFF_PERCENT * cumulative[:, -1:], axis=1)
+    rolloff = freqs[rolloff_bins]
+
+    out = np.empty(FEATURE_DIM, dtype=np.float32)
+    out[:N_MFCC] = mfcc.mean(axis=0)
+    out[N_MFCC] = centroid.mean() if len(centroid) else 0.0
+    out[N_MFCC + 1] = rolloff.mean() if len(rolloff) else 0.0
+    return out
+
+
+def analyze_file(path):
+    """Decode + extract for one file; None on failure (runs inside worker processes)."""
+    try:
+        return extract_features(decode_audio(path))
+    except Exception as e:
+        print(f"Audio analysis failed for {path}: {e}")
+        return None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_analysis_pool(max_workers=None):
+    """
+    Process-wide analysis pool, created on first use. Workers are spawned, not
+    forked: the server process has threads (event loop, thread pools, SQLite
+    locks) that a fork would copy mid-state.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn'))
+        return _pool
+
+
+def shutdown_analysis_pool():
+    """Stops the pool's workers (lifespan shutdown); a later call starts a new pool."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def analyze_previews(paths, store=None, pool=None):
+    """
+    Analyses decoded preview audio in the analysis pool and writes the vectors into
+    the shared feature store ('timbre' table). Files that fail to decode are
+    stored as negative entries so they aren't retried before NEGATIVE_TTL.
+    paths: {track_id: local audio path}. Returns the number of tracks stored.
+    """
+    if store is None:
+        from feature_store import get_feature_store, TIMBRE_TABLE, TIMBRE_COLUMNS
+        store = get_feature_store(TIMBRE_TABLE, TIMBRE_COLUMNS)
+
+    items = [(tid, p) for tid, p in paths.items() if p and os.path.exists(p)]
+    if not items:
+        return 0
+
+    pool = pool if pool is not None else get_analysis_pool()
+    vectors = list(pool.map(analyze_file, [p for _, p in items], chunksize=4))
+
+    results = {tid: vec for (tid, _), vec in zip(items, vectors)}
+    store.put_many(results)
+    return sum(1 for vec in results.values() if vec is not None)
+
+
+def can_decode_previews():
+    """Spotify previews are MP3, which needs ffmpeg."""
+    return shutil.which('ffmpeg') is not None
@@ -1,17 +1,28 @@
 import os
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import CacheFileHandler, CacheHandler
 from dotenv import load_dotenv
 
 # Load .env from project root (parent of server/)
 env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
 load_dotenv(env_path)
 
+class NoTokenCache(CacheHandler):
+    """Keeps nothing: the API server holds its users' tokens in the TokenStore."""
+    def get_cached_token(self):
+        return None
+
+    def save_token_to_cache(self, token_info):
+        pass
+
 class SpotifyAuthenticator:
     """
     Handles Spotify Authentication using Authorization Code Flow.
+    The default cache is the single-user .spotify_cache file (Streamlit app);
+    the API server passes NoTokenCache().
     """
-    def __init__(self):
+    def __init__(self, cache_handler=None):
         self.client_id = os.getenv("SPOTIPY_CLIENT_ID")
         self.client_secret = os.getenv("SPOTIPY_CLIENT_SECRET")
         self.redirect_uri = os.getenv("SPOTIPY_REDIRECT_URI")
@@ -25,7 +36,7 @@ class SpotifyAuthenticator:
             client_secret=self.client_secret,
             redirect_uri=self.redirect_uri,
             scope=self.scope,
-            cache_path=".spotify_cache"
+            cache_handler=cache_handler or CacheFileHandler(cache_path=".spotify_cache")
         )
 
     def get_auth_url(self):
@@ -34,7 +45,7 @@ class SpotifyAuthenticator:
 
     def get_token_from_code(self, code):
         """Exchanges auth code for access token."""
-        return self.sp_oauth.get_access_token(code)
+        return self.sp_oauth.get_access_token(code, check_cache=False)
 
     def get_cached_token(self):
         """Retrieves cached token if valid."""
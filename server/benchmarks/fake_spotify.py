@@ -0,0 +1,149 @@
+import asyncio
+import zlib
+from collections import Counter
+
+
+def _h(*parts):
+    """Stable hash (Python's hash() is salted per process)."""
+    return zlib.crc32('|'.join(map(str, parts)).encode())
+
+
+def fake_track(i, artist_id=None):
+    artist_id = artist_id or f"ar{i % 97}"
+    return {
+        'id': f"t{i}",
+        'name': f"Track {i}",
+        'artists': [{'id': artist_id, 'name': f"Artist {artist_id}"}],
+        'preview_url': None,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/t{i}"},
+        'album': {'images': [{'url': f"https://i.scdn.co/image/a{i % 500}"}]},
+        'uri': f"spotify:track:t{i}",
+        'popularity': _h('pop', i) % 100,
+    }
+
+
+def fake_artist(i):
+    return {
+        'id': f"ar{i}",
+        'name': f"Artist ar{i}",
+        'genres': [f"genre-{_h('g', i, k) % 40}" for k in range(3)],
+        'images': [{'url': f"https://i.scdn.co/image/ar{i}"}],
+        'external_urls': {'spotify': f"https://open.spotify.com/artist/ar{i}"},
+        'popularity': _h('apop', i) % 100,
+    }
+
+
+def _artist_index(artist_id):
+    return int(artist_id[2:]) if artist_id[2:].isdigit() else _h(artist_id) % 10000
+
+
+def fake_audio_features(track_id):
+    h = _h('af', track_id)
+    return {
+        'id': track_id,
+        'danceability': (h % 100) / 100,
+        'energy': (h // 100 % 100) / 100,
+        'key': h % 12,
+        'loudness': -float(h % 30),
+        'mode': h % 2,
+        'speechiness': (h // 7 % 100) / 250,
+        'acousticness': (h // 11 % 100) / 100,
+        'instrumentalness': (h // 13 % 100) / 100,
+        'liveness': (h // 17 % 100) / 200,
+        'valence': (h // 19 % 100) / 100,
+        'tempo': 60.0 + h % 140,
+    }
+
+
+class FakeSpotify:
+    """
+    Deterministic in-process stand-in for AsyncSpotify (same method names and
+    arguments as spotipy). Every call sleeps `latency` seconds and is counted in
+    `calls`. recommendations raises like the deprecated endpoint does unless
+    recommendations_available is set.
+    """
+    def __init__(self, latency=0.0, recommendations_available=False, library_size=500):
+        self.latency = latency
+        self.recommendations_available = recommendations_available
+        self.library_size = library_size
+        self.calls = Counter()
+
+    async def _call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def reset(self):
+        self.calls.clear()
+
+    # --- Current user ---
+
+    async def current_user(self):
+        await self._call('current_user')
+        return {'id': 'bench-user', 'display_name': 'Bench User'}
+
+    async def current_user_saved_tracks(self, limit=20, offset=0, market=None):
+        await self._call('current_user_saved_tracks')
+        end = min(offset + limit, self.library_size)
+        return {
+            'items': [
+                {'added_at': f"2024-01-{i % 28 + 1:02d}T00:00:00Z", 'track': fake_track(i)}
+                for i in range(offset, end)
+            ],
+            'total': self.library_size,
+        }
+
+    async def current_user_playlists(self, limit=50, offset=0):
+        await self._call('current_user_playlists')
+        return {'items': [{'id': 'p1', 'name': 'Bench', 'snapshot_id': 's1', 'tracks': {'total': 0}}], 'total': 1}
+
+    async def current_user_top_artists(self, limit=20, offset=0, time_range='medium_term'):
+        await self._call('current_user_top_artists')
+        return {'items': [fake_artist(i) for i in range(offset, offset + limit)]}
+
+    async def current_user_top_tracks(self, limit=20, offset=0, time_range='medium_term'):
+        await self._call('current_user_top_tracks')
+        return {'items': [fake_track(i) for i in range(offset, offset + limit)]}
+
+    # --- Catalogue ---
+
+    async def new_releases(self, country=None, limit=20, offset=0):
+        await self._call('new_releases')
+        return {'albums': {'items': [
+            {'name': f"Album {i}", 'artists': [{'name': f"Artist ar{i}"}], 'images': [],
+             'external_urls': {'spotify': f"https://open.spotify.com/album/al{i}"}, 'release_date': '2024-01-01'}
+            for i in range(offset, offset + limit)
+        ]}}
+
+    async def search(self, q, limit=10, offset=0, type='track', market=None):
+        await self._call('search')
+        base = 100000 + _h('search', q) % 1000 * 1000 + offset
+        return {'tracks': {'items': [fake_track(base + i) for i in range(limit)], 'total': 1000}}
+
+    async def artist(self, artist_id):
+        await self._call('artist')
+        return fake_artist(_artist_index(artist_id))
+
+    async def artists(self, artist_ids):
+        await self._call('artists')
+        return {'artists': [fake_artist(_artist_index(a)) for a in artist_ids]}
+
+    async def artist_top_tracks(self, artist_id, country='US'):
+        await self._call('artist_top_tracks')
+        base = 500000 + _h('top', artist_id) % 1000 * 10
+        return {'tracks': [fake_track(base + i, artist_id) for i in range(10)]}
+
+    async def tracks(self, track_ids, market=None):
+        await self._call('tracks')
+        return {'tracks': [fake_track(int(t[1:])) for t in track_ids]}
+
+    async def audio_features(self, tracks=[]):
+        await self._call('audio_features')
+        return [fake_audio_features(t) for t in tracks]
+
+    async def recommendations(self, seed_artists=None, seed_genres=None, seed_tracks=None, limit=20, country=None, **kwargs):
+        await self._call('recommendations')
+        if not self.recommendations_available:
+            raise Exception("http status: 404, code: -1 - recommendations: Not Found")
+        seed = _h(seed_artists, seed_genres, seed_tracks)
+        return {'tracks': [fake_track(900000 + seed % 1000 * 100 + i) for i in range(limit)]}
@@ -0,0 +1,251 @@
+"""
+Compute-path microbenchmarks against a deterministic fake Spotify.
+
+    cd server
+    python benchmarks/run.py                          # writes benchmarks/results/latest.json
+    python benchmarks/run.py --latency 0.05 --out before.json
+    python benchmarks/run.py --baseline before.json   # exit 1 on a latency/call-count regression
+
+Each benchmark records wall time over --repeats runs, memory allocated during
+one extra run (tracemalloc) and the number of Spotify calls by method.
+Every run starts cold: fresh in-memory FeatureStore, ArtistStore and SharedCache, fresh
+SpotifyClient (request-scoped memo), so call counts are comparable.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from artist_store import ArtistStore
+from advanced_features import AdvancedFeatureEngine
+from ann_index import IVFIndex
+from feature_extraction import FeatureExtractor
+from feature_store import FeatureStore, TIMBRE_TABLE, TIMBRE_COLUMNS
+from genre_index import GenreIndex
+from normalizer import RunningNormalizer
+from recommender import RecommenderSystem
+from shared_cache import SharedCache
+from spotify_client import SpotifyClient
+from track import Track
+
+from fake_spotify import FakeSpotify, fake_artist, fake_audio_features, fake_track
+
+DEFAULT_OUT = os.path.join(HERE, 'results', 'latest.json')
+SEED = 1234
+
+
+class Context:
+    """Fresh, isolated state for one benchmark run (nothing touches data/)."""
+    def __init__(self, latency):
+        self.sp = FakeSpotify(latency=latency)
+        self.store = FeatureStore(':memory:')
+        self.client = SpotifyClient(self.sp, self.store, SharedCache(), artist_store=ArtistStore(':memory:'))
+        dim = FeatureExtractor.FEATURE_DIM
+        self.recommender = RecommenderSystem(
+            index=IVFIndex(dim), normalizer=RunningNormalizer(dim),
+            timbre_store=FeatureStore(':memory:', table=TIMBRE_TABLE, columns=TIMBRE_COLUMNS),
+        )
+
+
+def tracks(start, n):
+    return [Track.from_spotify(fake_track(i)) for i in range(start, start + n)]
+
+
+# --- Benchmarks: name -> async fn(ctx) ---
+
+async def bench_process_track(ctx):
+    extractor = FeatureExtractor()
+    for i in range(1000):
+        extractor.process_track({'id': f"t{i}"}, fake_audio_features(f"t{i}"))
+
+
+async def bench_process_tracks_batch(ctx):
+    features = [fake_audio_features(f"t{i}") for i in range(1000)]
+    FeatureExtractor().process_tracks(features)
+
+
+async def bench_prepare_data(ctx):
+    await ctx.recommender.prepare_data(tracks(0, 500), ctx.client)
+
+
+async def bench_recommend(ctx):
+    await ctx.recommender.recommend(tracks(0, 50), tracks(10000, 500), ctx.client, top_n=20)
+
+
+async def bench_recommend_via_search(ctx):
+    await ctx.client._recommend_via_search(['jazz', 'trip-hop', 'soul'], ['ar1', 'ar2'], ['t1', 't2'], 20)
+
+
+async def bench_recommend_via_search_constrained(ctx):
+    await ctx.client._recommend_via_search(
+        ['jazz', 'trip-hop'], None, None, 20,
+        target_valence=0.2, target_tempo=70, min_instrumentalness=0.3, min_popularity=20
+    )
+
+
+async def bench_get_mixed_seeds(ctx):
+    await ctx.client.get_mixed_seeds()
+
+
+async def bench_advanced_generators(ctx):
+    engine = AdvancedFeatureEngine(ctx.client)
+    top_genres = [(f"genre-{i}", 10 - i) for i in range(10)]
+    for location in AdvancedFeatureEngine.LOCATION_GENRES:
+        for weather in ('Rain', 'Sunny', 'Snow'):
+            for time_of_day in ('Morning', 'Night'):
+                engine.vibe_teleporter(location, weather, time_of_day)
+    for style in AdvancedFeatureEngine.AESTHETIC_PRESETS:
+        engine.aesthetic_generator(style)
+    engine.alternate_you(top_genres)
+
+
+async def bench_genre_index(ctx):
+    index = GenreIndex.from_artists([fake_artist(i) for i in range(5000)])
+    top_genres = index.top_genres(10)
+    index.affinity(AdvancedFeatureEngine.ALTERNATE_GENRES, index.profile(top_genres))
+
+
+BENCHMARKS = {
+    'feature_extraction.process_track_x1000': bench_process_track,
+    'feature_extraction.process_tracks_1000': bench_process_tracks_batch,
+    'recommender.prepare_data_500': bench_prepare_data,
+    'recommender.recommend_50x500': bench_recommend,
+    'spotify_client.recommend_via_search': bench_recommend_via_search,
+    'spotify_client.recommend_via_search_constrained': bench_recommend_via_search_constrained,
+    'spotify_client.get_mixed_seeds': bench_get_mixed_seeds,
+    'advanced_features.generators': bench_advanced_generators,
+    'genre_index.library_5000_artists': bench_genre_index,
+}
+
+
+# --- Runner ---
+
+def run_once(fn, latency):
+    random.seed(SEED)
+    np.random.seed(SEED)
+    ctx = Context(latency)
+    # The client's fallback paths print progress; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        asyncio.run(fn(ctx))
+        elapsed = time.perf_counter() - start
+    return elapsed, ctx.sp.calls
+
+
+def run_benchmark(fn, latency, repeats):
+    run_once(fn, latency)  # warm-up (imports, numpy/sqlite first-use costs)
+    timings = []
+    for _ in range(repeats):
+        elapsed, calls = run_once(fn, latency)
+        timings.append(elapsed * 1000)
+
+    # Separate run for allocations: tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        run_once(fn, latency)
+        net, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_ms': {
+            'min': round(min(timings), 3),
+            'median': round(statistics.median(timings), 3),
+            'mean': round(statistics.mean(timings), 3),
+        },
+        'alloc_peak_kb': round(peak / 1024, 1),
+        'alloc_net_kb': round(net / 1024, 1),
+        'spotify_calls': {'total': sum(calls.values()), 'by_method': dict(sorted(calls.items()))},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Lists regressions: slower median (beyond tolerance and min_delta_ms) or more Spotify calls."""
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if before is None:
+            continue
+        now_ms, then_ms = current['wall_ms']['median'], before['wall_ms']['median']
+        if now_ms > then_ms * (1 + tolerance) and now_ms - then_ms > min_delta_ms:
+            regressions.append(f"{name}: median {then_ms:.2f} ms -> {now_ms:.2f} ms")
+        now_calls, then_calls = current['spotify_calls']['total'], before['spotify_calls']['total']
+        if now_calls > then_calls:
+            regressions.append(f"{name}: Spotify calls {then_calls} -> {now_calls}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.01, help='fake Spotify latency per call (seconds)')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--only', action='append', help='run benchmarks whose name contains this (repeatable)')
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown of the median')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    selected = {
+        name: fn for name, fn in BENCHMARKS.items()
+        if not args.only or any(part in name for part in args.only)
+    }
+    results = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'latency_s': args.latency,
+            'repeats': args.repeats,
+        },
+        'benchmarks': {},
+    }
+    for name, fn in selected.items():
+        result = run_benchmark(fn, args.latency, args.repeats)
+        results['benchmarks'][name] = result
+        print(f"{name:<50} {result['wall_ms']['median']:>9.2f} ms  "
+              f"{result['alloc_peak_kb']:>9.1f} KiB peak  {result['spotify_calls']['total']:>4} calls")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import numpy as np
+
+from feature_extraction import FeatureExtractor
+
+# Rough value range per attribute, so every target contributes on a 0..1 scale
+ATTRIBUTE_SCALE = {'tempo': 200.0, 'loudness': 60.0, 'key': 11.0, 'popularity': 100.0}
+
+
+class ConstraintQuery:
+    """
+    Local equivalent of the recommendations endpoint's tunable attributes.
+    compile() turns target_/min_/max_ kwargs into per-column bounds and target
+    weights; evaluate() applies them to a whole candidate matrix in one
+    vectorized pass. Columns are the FeatureStore's (SPOTIFY_AUDIO_FEATURES)
+    plus 'popularity', which comes from the tracks rather than the store.
+    Attributes we have no data for (duration_ms, time_signature, ...) are
+    ignored and listed in `ignored`.
+    """
+    def __init__(self, columns, lo, hi, target, weight, ignored=()):
+        self.columns = columns
+        self.lo = lo
+        self.hi = hi
+        self.target = target
+        self.weight = weight
+        self.ignored = list(ignored)
+        # Only the columns something constrains are touched at evaluation time
+        self._bounded = np.flatnonzero(np.isfinite(lo) | np.isfinite(hi))
+        self._targeted = np.flatnonzero(weight > 0)
+
+    @classmethod
+    def compile(cls, params, columns=FeatureExtractor.SPOTIFY_AUDIO_FEATURES):
+        columns = list(columns) + ['popularity']
+        n = len(columns)
+        lo = np.full(n, -np.inf, dtype=np.float32)
+        hi = np.full(n, np.inf, dtype=np.float32)
+        target = np.zeros(n, dtype=np.float32)
+        weight = np.zeros(n, dtype=np.float32)
+        ignored = []
+
+        for name, value in params.items():
+            prefix, _, attribute = name.partition('_')
+            if prefix not in ('min', 'max', 'target') or value is None:
+                continue
+            if attribute not in columns:
+                ignored.append(name)
+                continue
+            col = columns.index(attribute)
+            value = float(value)
+            if prefix == 'min':
+                lo[col] = max(lo[col], value)
+            elif prefix == 'max':
+                hi[col] = min(hi[col], value)
+            else:
+                target[col] = value
+                weight[col] = 1.0 / ATTRIBUTE_SCALE.get(attribute, 1.0)
+        return cls(columns, lo, hi, target, weight, ignored)
+
+    def __bool__(self):
+        return bool(len(self._bounded) or len(self._targeted))
+
+    def evaluate(self, X, mask=None, popularity=None):
+        """
+        X: (n, len(columns) - 1) feature matrix (FeatureStore order); mask marks rows
+        that have features. popularity: optional length-n sequence (NaN/None = unknown).
+        Returns (ok, dist):
+          ok   - rows satisfying every min_/max_ bound; unknown values don't fail a bound
+          dist - weighted squared distance to the targets, inf for rows without features
+        """
+        n = len(X)
+        full = np.empty((n, len(self.columns)), dtype=np.float32)
+        full[:, :-1] = X
+        full[:, -1] = np.nan if popularity is None else np.asarray(popularity, dtype=np.float32)
+        if mask is not None:
+            full[~np.asarray(mask, dtype=bool), :-1] = np.nan
+
+        ok = np.ones(n, dtype=bool)
+        if len(self._bounded):
+            cols = full[:, self._bounded]
+            with np.errstate(invalid='ignore'):
+                inside = (cols >= self.lo[self._bounded]) & (cols <= self.hi[self._bounded])
+            ok = (inside | np.isnan(cols)).all(axis=1)
+
+        dist = np.zeros(n, dtype=np.float32)
+        if len(self._targeted):
+            cols = full[:, self._targeted]
+            diff = (cols - self.target[self._targeted]) * self.weight[self._targeted]
+            # Unknown values add nothing here; rows without features get inf below
+            diff = np.where(np.isnan(diff), 0, diff)
+            dist = (diff * diff).sum(axis=1)
+        if mask is not None:
+            dist[~np.asarray(mask, dtype=bool)] = np.inf
+        return ok, dist
+
+    def rank(self, X, mask=None, popularity=None, strict=True):
+        """
+        Row indices best-first: rows that satisfy the bounds ordered by distance
+        (rows without features last). With strict=False the rows that fail a
+        bound follow, also by distance, so callers can top up a short list.
+        """
+        ok, dist = self.evaluate(X, mask, popularity)
+        order = np.lexsort((dist, ~ok))
+        if strict:
+            order = order[:int(ok.sum())]
+        return order
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+
+from feature_store import DATA_DIR
+from rate_limiter import background_priority
+from snapshot import BackgroundSnapshot
+from track import Track
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'decade_pools.json')
+DEFAULT_DECADES = [int(y) for y in os.getenv('DECADE_POOL_YEARS', '1960,1970,1980,1990,2000,2010').split(',') if y.strip()]
+# Spotify search pages are at most 50 items and offsets stop at 1000
+PAGE_SIZE = 50
+MAX_OFFSET = 1000
+
+
+class DecadePools(BackgroundSnapshot):
+    """
+    Locally sampled track pools for /features/time-travel.
+    A background job pages through `year:{y}` searches for every year of each
+    configured decade (up to 1000 tracks per year) and writes a JSON snapshot
+    to data/; requests only sample from memory, excluding tracks that user was
+    already shown recently. Workers pick up a newer snapshot by its mtime.
+    """
+    def __init__(self, path=DEFAULT_PATH, decades=DEFAULT_DECADES, pages_per_year=MAX_OFFSET // PAGE_SIZE,
+                 shown_per_user=500, max_users=10000):
+        super().__init__(path)
+        self.decades = list(decades)
+        self.pages_per_year = pages_per_year
+        self.shown_per_user = shown_per_user
+        self.max_users = max_users
+
+        self.pools = {}  # decade start year -> [Track]
+        self._shown = OrderedDict()  # user_key -> {decade: (deque, set)}
+
+    # --- Serving ---
+
+    def has(self, start_year):
+        self.maybe_reload()
+        return bool(self.pools.get(start_year))
+
+    def sample(self, start_year, n, user_key=None):
+        """n random tracks from the decade's pool, skipping ones this user saw recently."""
+        pool = self.pools.get(start_year) or []
+        if not pool:
+            return []
+        n = min(n, len(pool))
+
+        order, seen = self._seen(user_key, start_year)
+        if len(pool) - len(seen) < n:
+            # The user has exhausted the pool: start over
+            order.clear()
+            seen.clear()
+
+        picked = []
+        picked_ids = set()
+        attempts = 0
+        # Rejection sampling: pools are large compared to n and the exclusion set
+        while len(picked) < n and attempts < n * 20:
+            attempts += 1
+            t = pool[random.randrange(len(pool))]
+            if t.id in seen or t.id in picked_ids:
+                continue
+            picked.append(t)
+            picked_ids.add(t.id)
+
+        if user_key is not None:
+            for t in picked:
+                order.append(t.id)
+                seen.add(t.id)
+                if len(order) > self.shown_per_user:
+                    seen.discard(order.popleft())
+        return picked
+
+    def sizes(self):
+        return {k: len(v) for k, v in self.pools.items()}
+
+    def _seen(self, user_key, start_year):
+        if user_key is None:
+            return deque(), set()
+        per_user = self._shown.get(user_key)
+        if per_user is None:
+            per_user = self._shown[user_key] = {}
+            while len(self._shown) > self.max_users:
+                self._shown.popitem(last=False)
+        else:
+            self._shown.move_to_end(user_key)
+        if start_year not in per_user:
+            per_user[start_year] = (deque(), set())
+        return per_user[start_year]
+
+    # --- Snapshot ---
+
+    def _load(self, data):
+        self.pools = {int(k): [Track(**t) for t in v] for k, v in data['pools'].items()}
+
+    def _dump(self):
+        return {'pools': {str(k): [t.to_dict() for t in v] for k, v in self.pools.items()}}
+
+    # --- Building (background) ---
+
+    async def build(self, sp):
+        """Pages through every configured decade at BACKGROUND priority and saves a snapshot."""
+        with background_priority():
+            pools = {}
+            for start_year in self.decades:
+                pools[start_year] = await self._build_decade(sp, start_year)
+                print(f"Decade pool {start_year}s: {len(pools[start_year])} tracks")
+        self.pools = {k: v for k, v in pools.items() if v} or self.pools
+        self.built_at = time.time()
+        self.save()
+
+    async def _build_decade(self, sp, start_year):
+        pages = await asyncio.gather(*(
+            self._fetch_page(sp, year, offset)
+            for year in range(start_year, start_year + 10)
+            for offset in range(0, self.pages_per_year * PAGE_SIZE, PAGE_SIZE)
+        ))
+        unique = {}
+        for page in pages:
+            for item in page:
+                if item and item.get('id'):
+                    unique.setdefault(item['id'], item)
+        return [Track.from_spotify(t) for t in unique.values()]
+
+    async def _fetch_page(self, sp, year, offset):
+        try:
+            results = await sp.search(q=f"year:{year}", type='track', limit=PAGE_SIZE, offset=offset)
+            return results['tracks']['items']
+        except Exception as e:
+            # Deep offsets past the end of the result set fail or come back empty
+            print(f"Decade pool page failed ({year}, offset {offset}): {e}")
+            return []
+
+
+_pools = None
+
+
+def get_decade_pools():
+    global _pools
+    if _pools is None:
+        _pools = DecadePools()
+        _pools.maybe_reload()
+    return _pools
@@ -1,16 +1,14 @@
 import numpy as np
-import requests
-import os
-import tempfile
 import pandas as pd
 
-# librosa is not supported on Python 3.14 yet, so we disable it.
-# import librosa 
+# librosa is not supported on Python 3.14 yet, so the same features are
+# computed with plain numpy in audio_analysis.
+import audio_analysis
 
 class FeatureExtractor:
     """
-    Handles extraction of audio features from Spotify API.
-    Raw audio analysis (Librosa) is currently disabled due to Python 3.14 incompatibility.
+    Handles extraction of audio features from Spotify API and raw preview audio.
+    Raw audio analysis uses the numpy pipeline in audio_analysis (librosa-compatible layout).
     """
     
     SPOTIFY_AUDIO_FEATURES = [
@@ -18,55 +16,95 @@ class FeatureExtractor:
         'speechiness', 'acousticness', 'instrumentalness', 
         'liveness', 'valence', 'tempo'
     ]
+    # 13 MFCC + 1 Centroid + 1 Rolloff
+    LIBROSA_FEATURES = [f'mfcc_{i}' for i in range(13)] + ['spectral_centroid', 'spectral_rolloff']
+    LIBROSA_FEATURE_DIM = len(LIBROSA_FEATURES)
+    FEATURE_DIM = len(SPOTIFY_AUDIO_FEATURES) + LIBROSA_FEATURE_DIM
 
     def __init__(self):
         pass
 
-    def download_preview(self, preview_url):
-        """Downloads the preview MP3 to a temporary file."""
+    def download_preview(self, preview_url, track_id=None):
+        """
+        Returns a local path to the preview MP3.
+        Streams through the shared PreviewCache, so each preview is downloaded once.
+        """
         if not preview_url:
             return None
-        
-        try:
-            response = requests.get(preview_url)
-            if response.status_code == 200:
-                fd, path = tempfile.mkstemp(suffix=".mp3")
-                with os.fdopen(fd, 'wb') as tmp:
-                    tmp.write(response.content)
-                return path
-        except Exception as e:
-            print(f"Error downloading preview: {e}")
-        return None
+
+        from preview_cache import get_preview_cache
+        return get_preview_cache().fetch(track_id, preview_url)
 
     def extract_librosa_features(self, file_path):
         """
-        Mock function for Librosa features.
-        Returns a zero vector since librosa is disabled.
+        MFCC/centroid/rolloff features for an audio file (numpy pipeline).
+        Returns a zero vector if the file can't be decoded.
         """
         # 13 MFCC + 1 Centroid + 1 Rolloff = 15 features
-        return np.zeros(15)
+        features = audio_analysis.analyze_file(file_path)
+        if features is None:
+            return np.zeros(self.LIBROSA_FEATURE_DIM)
+        return features
 
     def process_track(self, track_info, audio_features):
         """
-        Combines Spotify features and (Mock) Librosa features into a single vector.
+        Combines Spotify features and Librosa-style features into a single vector.
         track_info: dict containing 'preview_url', 'id', 'name'
         audio_features: dict from Spotify API
         """
-        # 1. Spotify Features
-        spotify_vector = []
-        if audio_features:
-            for feature in self.SPOTIFY_AUDIO_FEATURES:
-                spotify_vector.append(audio_features.get(feature, 0))
-        else:
-            spotify_vector = [0] * len(self.SPOTIFY_AUDIO_FEATURES)
-            
-        # 2. Librosa Features (Skipped)
-        librosa_vector = np.zeros(15)
-        
-        # Combine
-        full_vector = np.concatenate([spotify_vector, librosa_vector])
-        return full_vector
+        X, _ = self.process_tracks([audio_features])
+        return X[0]
+
+    def process_tracks(self, audio_features, mask=None, timbre=None, timbre_mask=None):
+        """
+        Batch version of process_track: fills one preallocated (n, FEATURE_DIM) float32 array.
+        audio_features can be:
+          - a list of Spotify audio-feature dicts (None/{} for missing tracks)
+          - a columnar dict {feature_name: sequence of n values}
+          - an (n, len(SPOTIFY_AUDIO_FEATURES)) array in SPOTIFY_AUDIO_FEATURES order
+            (e.g. from FeatureStore), with an optional row mask
+        timbre: optional (n, LIBROSA_FEATURE_DIM) matrix from the 'timbre' store
+        (rows outside timbre_mask stay zero).
+        Returns (X, mask) where mask marks rows that had Spotify features.
+        """
+        X, present = self._spotify_block(audio_features, mask)
+        if timbre is not None:
+            n_spotify = len(self.SPOTIFY_AUDIO_FEATURES)
+            X[:, n_spotify:] = timbre
+            if timbre_mask is not None:
+                X[~np.asarray(timbre_mask, dtype=bool), n_spotify:] = 0
+        return X, present
+
+    def _spotify_block(self, audio_features, mask):
+        n_spotify = len(self.SPOTIFY_AUDIO_FEATURES)
+
+        if isinstance(audio_features, np.ndarray):
+            n = len(audio_features)
+            X = np.zeros((n, self.FEATURE_DIM), dtype=np.float32)
+            X[:, :n_spotify] = audio_features
+            present = np.ones(n, dtype=bool) if mask is None else np.array(mask, dtype=bool)
+            X[~present, :n_spotify] = 0
+            return X, present
+
+        if isinstance(audio_features, dict):
+            n = len(next(iter(audio_features.values()), []))
+            X = np.zeros((n, self.FEATURE_DIM), dtype=np.float32)
+            for j, feature in enumerate(self.SPOTIFY_AUDIO_FEATURES):
+                if feature in audio_features:
+                    X[:, j] = np.nan_to_num(np.asarray(audio_features[feature], dtype=np.float32))
+            present = np.ones(n, dtype=bool) if mask is None else np.array(mask, dtype=bool)
+            X[~present, :n_spotify] = 0
+            return X, present
+
+        n = len(audio_features)
+        X = np.zeros((n, self.FEATURE_DIM), dtype=np.float32)
+        present = np.zeros(n, dtype=bool)
+        spotify_block = X[:, :n_spotify]
+        for i, features in enumerate(audio_features):
+            if features:
+                spotify_block[i] = [features.get(f) or 0 for f in self.SPOTIFY_AUDIO_FEATURES]
+                present[i] = True
+        return X, present
 
     def get_feature_names(self):
-        librosa_names = [f'mfcc_{i}' for i in range(13)] + ['spectral_centroid', 'spectral_rolloff']
-        return self.SPOTIFY_AUDIO_FEATURES + librosa_names
+        return self.SPOTIFY_AUDIO_FEATURES + self.LIBROSA_FEATURES
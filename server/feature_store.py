@@ -0,0 +1,170 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from feature_extraction import FeatureExtractor
+
+# data/ at the project root (parent of server/), shared by every worker process
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+DEFAULT_PATH = os.path.join(DATA_DIR, 'features.sqlite')
+
+# Spotify's audio-features endpoint accepts at most 100 IDs per call
+AUDIO_FEATURES_BATCH = 100
+# Tracks Spotify had no features for are retried after this long
+NEGATIVE_TTL = 24 * 3600
+# IDs whose fetch failed (403 from a deprecated endpoint, exhausted retries, ...) are
+# retried after this long instead of on every request
+FAILURE_TTL = int(os.getenv('FETCH_FAILURE_TTL_SECONDS', '600'))
+# SQLite's default limit on bound parameters is 999
+_SQL_CHUNK = 900
+
+# Preview-audio analysis results (written by audio_analysis.analyze_previews)
+TIMBRE_TABLE = 'timbre'
+TIMBRE_COLUMNS = FeatureExtractor.LIBROSA_FEATURES
+
+
+class FeatureStore:
+    """
+    Persistent track_id -> float32 vector store, shared across users and processes.
+    Vectors are stored as raw float32 blobs in SQLite (WAL mode, so concurrent
+    readers in other workers are never blocked) and read back as one contiguous
+    (n, d) matrix plus a boolean mask of rows that have features.
+    """
+    def __init__(self, path=DEFAULT_PATH, table='audio_features', columns=FeatureExtractor.SPOTIFY_AUDIO_FEATURES):
+        self.path = path
+        self.table = table
+        self.columns = list(columns)
+        self.dim = len(self.columns)
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "track_id TEXT PRIMARY KEY, vec BLOB, fetched_at REAL NOT NULL)"
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table} WHERE vec IS NOT NULL").fetchone()[0]
+
+    def to_vector(self, features):
+        """Spotify audio-features dict -> float32 vector in column order."""
+        return np.array([features.get(c) or 0 for c in self.columns], dtype=np.float32)
+
+    def get_many(self, track_ids):
+        """
+        Returns (X, mask, missing):
+        X is a C-contiguous float32 (n, d) matrix aligned with track_ids (zeros where unknown),
+        mask marks rows with features, missing lists IDs that should be fetched.
+        """
+        n = len(track_ids)
+        X = np.zeros((n, self.dim), dtype=np.float32)
+        mask = np.zeros(n, dtype=bool)
+        if n == 0:
+            return X, mask, []
+
+        rows = {}
+        unique_ids = list(dict.fromkeys(track_ids))
+        with self._lock:
+            for i in range(0, len(unique_ids), _SQL_CHUNK):
+                chunk = unique_ids[i:i + _SQL_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                cur = self._conn.execute(
+                    f"SELECT track_id, vec, fetched_at FROM {self.table} WHERE track_id IN ({placeholders})", chunk
+                )
+                for track_id, vec, fetched_at in cur:
+                    rows[track_id] = (vec, fetched_at)
+
+        now = time.time()
+        missing = []
+        for tid in unique_ids:
+            row = rows.get(tid)
+            if row is None or (row[0] is None and now - row[1] > NEGATIVE_TTL):
+                missing.append(tid)
+
+        for i, tid in enumerate(track_ids):
+            row = rows.get(tid)
+            if row is not None and row[0] is not None:
+                X[i] = np.frombuffer(row[0], dtype=np.float32)
+                mask[i] = True
+        return X, mask, missing
+
+    def put_many(self, items, negative_ttl=NEGATIVE_TTL):
+        """
+        items: {track_id: features dict | float vector | None}.
+        None records that Spotify has no features for the track (negative entry),
+        retried after negative_ttl (at most NEGATIVE_TTL).
+        """
+        now = time.time()
+        # Negative entries expire NEGATIVE_TTL after fetched_at: backdate shorter ones
+        negative_at = now - (NEGATIVE_TTL - min(negative_ttl, NEGATIVE_TTL))
+        records = []
+        for tid, value in items.items():
+            if not tid:
+                continue
+            if value is None:
+                records.append((tid, None, negative_at))
+                continue
+            if isinstance(value, dict):
+                blob = self.to_vector(value).tobytes()
+            else:
+                blob = np.asarray(value, dtype=np.float32).reshape(self.dim).tobytes()
+            records.append((tid, blob, now))
+        if not records:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (track_id, vec, fetched_at) VALUES (?, ?, ?)", records
+            )
+
+    async def ensure(self, track_ids, fetch, batch_size=AUDIO_FEATURES_BATCH):
+        """
+        Same as get_many, but fills misses first.
+        fetch(batch) is awaited for batches of up to batch_size IDs and must return
+        a list aligned with the batch (dict or None per track), like sp.audio_features.
+        Returns (X, mask).
+        """
+        X, mask, missing = self.get_many(track_ids)
+        if not missing:
+            return X, mask
+
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        results = await asyncio.gather(*(fetch(b) for b in batches), return_exceptions=True)
+
+        fetched, failed = {}, {}
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                # Short negative entries: requests don't re-send calls that just failed
+                print(f"Audio features fetch failed: {result}")
+                failed.update((tid, None) for tid in batch)
+                continue
+            for tid, features in zip(batch, result or []):
+                fetched[tid] = features
+        self.put_many(fetched)
+        self.put_many(failed, negative_ttl=FAILURE_TTL)
+
+        for i, tid in enumerate(track_ids):
+            features = fetched.get(tid)
+            if features:
+                X[i] = self.to_vector(features)
+                mask[i] = True
+        return X, mask
+
+
+_stores = {}
+
+
+def get_feature_store(table='audio_features', columns=FeatureExtractor.SPOTIFY_AUDIO_FEATURES):
+    """Process-wide store instance (one SQLite connection per table per worker)."""
+    if table not in _stores:
+        _stores[table] = FeatureStore(table=table, columns=columns)
+    return _stores[table]
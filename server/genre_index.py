@@ -0,0 +1,147 @@
+import numpy as np
+from scipy import sparse
+
+
+def _terms(genre):
+    # "dark jazz" -> dark, jazz; hyphenated names ("k-pop", "trip-hop") stay one term
+    return genre.lower().split()
+
+
+class GenreIndex:
+    """
+    Sparse artist x genre matrix (1 where Spotify tags the artist with the genre),
+    with the genre co-occurrence and cosine similarity matrices derived from it
+    and a genre x term matrix for matching genre names word by word (a term
+    also matches the longer terms containing it: "metal" -> "metalcore").
+    Histograms and profile distances are sparse mat-vecs, so a whole library
+    (thousands of artists) takes milliseconds.
+    """
+    def __init__(self, artist_genres, artist_ids=None):
+        columns = {}
+        rows, cols = [], []
+        for r, genres in enumerate(artist_genres):
+            for genre in dict.fromkeys(genres or ()):
+                rows.append(r)
+                cols.append(columns.setdefault(genre, len(columns)))
+        self.genres = list(columns)
+        self.artist_ids = list(artist_ids) if artist_ids is not None else None
+        self._columns = columns
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(artist_genres), len(columns))
+        )
+        self._similarity = None
+        self._term_columns = None
+        self._term_matrix = None
+        self._term_matches = {}  # candidate term -> columns of the terms containing it
+
+    @classmethod
+    def from_artists(cls, artists):
+        """Index over Spotify artist objects (duplicates by ID are counted once)."""
+        unique = {a['id']: a for a in artists if a}
+        return cls([a.get('genres') for a in unique.values()], list(unique))
+
+    def __len__(self):
+        return len(self.genres)
+
+    # --- Histograms ---
+
+    def histogram(self, weights=None):
+        """Artists per genre, or the weighted sum when weights (one per artist) are given."""
+        if weights is None:
+            return np.asarray(self.matrix.sum(axis=0)).ravel()
+        return self.matrix.T @ np.asarray(weights, dtype=np.float32)
+
+    def top_genres(self, limit=None, weights=None):
+        """[(genre, count)] most common first; ties keep first-seen order like Counter.most_common."""
+        counts = self.histogram(weights)
+        order = np.argsort(-counts, kind='stable')[:limit]
+        cast = int if weights is None else float
+        return [(self.genres[i], cast(counts[i])) for i in order if counts[i] > 0]
+
+    # --- Co-occurrence ---
+
+    @property
+    def cooccurrence(self):
+        """genre x genre: number of artists tagged with both (diagonal = artists per genre)."""
+        return (self.matrix.T @ self.matrix).tocsr()
+
+    @property
+    def similarity(self):
+        """Cosine similarity of genres by the artists they share."""
+        if self._similarity is None:
+            scale = sparse.diags(self._inv_norms())
+            self._similarity = (scale @ self.cooccurrence @ scale).tocsr()
+        return self._similarity
+
+    def similar(self, genre, limit=10):
+        """Genres that most often share artists with genre, best first."""
+        col = self._columns.get(genre)
+        if col is None:
+            return []
+        row = self.similarity.getrow(col).toarray().ravel()
+        row[col] = 0
+        order = np.argsort(-row, kind='stable')[:limit]
+        return [(self.genres[i], float(row[i])) for i in order if row[i] > 0]
+
+    # --- Profiles ---
+
+    def profile(self, weighted_genres):
+        """Vector over the index's genres from [(genre, weight)]; unknown genres are dropped."""
+        vector = np.zeros(len(self.genres), dtype=np.float32)
+        for genre, weight in weighted_genres:
+            col = self._columns.get(genre)
+            if col is not None:
+                vector[col] += weight
+        return vector
+
+    def affinity(self, candidates, profile):
+        """
+        How close each candidate genre name is to a profile vector: the profile is
+        spread to co-occurring genres, projected onto terms, and every candidate
+        scores the weight of the terms containing one of its words ("metal"
+        scores "metal", "metalcore", "deathmetal"). 0 means nothing the user
+        plays (or an artist-level neighbour of it) contains any of its words.
+        """
+        if not len(self.genres) or not candidates:
+            return np.zeros(len(candidates), dtype=np.float32)
+        columns, terms = self._terms()
+        # similarity @ profile without materializing it: D^-1 A^T A D^-1 p
+        inv_norms = self._inv_norms()
+        spread = inv_norms * (self.matrix.T @ (self.matrix @ (inv_norms * profile)))
+        term_weights = terms.T @ spread
+
+        rows, cols = [], []
+        for r, genre in enumerate(candidates):
+            for term in dict.fromkeys(_terms(genre)):
+                matches = self._matching_columns(term)
+                rows.extend([r] * len(matches))
+                cols.extend(matches)
+        rows = np.asarray(rows, dtype=np.intp)
+        return np.bincount(rows, weights=term_weights[cols], minlength=len(candidates)).astype(np.float32)
+
+    def _matching_columns(self, term):
+        matches = self._term_matches.get(term)
+        if matches is None:
+            columns, _ = self._terms()
+            matches = self._term_matches[term] = [col for t, col in columns.items() if term in t]
+        return matches
+
+    def _inv_norms(self):
+        # Binary matrix: the co-occurrence diagonal is the artist count per genre
+        norms = np.sqrt(self.histogram())
+        norms[norms == 0] = 1.0
+        return (1.0 / norms).astype(np.float32)
+
+    def _terms(self):
+        if self._term_matrix is None:
+            columns = {}
+            rows, cols = [], []
+            for r, genre in enumerate(self.genres):
+                for term in dict.fromkeys(_terms(genre)):
+                    rows.append(r)
+                    cols.append(columns.setdefault(term, len(columns)))
+            self._term_columns = columns
+            self._term_matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(self.genres), len(columns))
+            )
+        return self._term_columns, self._term_matrix
@@ -0,0 +1,463 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from async_spotify import get_client_pool
+from feature_store import DATA_DIR
+from rate_limiter import background_priority
+from recommender import get_recommender
+from spotify_client import SpotifyClient
+from track import Track
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'library.sqlite')
+# Page sizes are the endpoints' maximums
+SAVED_PAGE = 50
+PLAYLISTS_PAGE = 50
+PLAYLIST_ITEMS_PAGE = 100
+# Spotify calls in flight for one user's sync
+SYNC_CONCURRENCY = 8
+# A session's library is re-synced at most this often
+SYNC_INTERVAL = int(os.getenv('LIBRARY_SYNC_INTERVAL_SECONDS', str(15 * 60)))
+# Opt-in: a background job adds synced library tracks to the recommender's catalogue
+# index (previews are downloaded and analysed too, so it is off by default)
+LIBRARY_INDEXING = os.getenv('LIBRARY_INDEXING', '0') == '1'
+# Library tracks are added to the catalogue index this many at a time
+INDEX_BATCH = 500
+
+
+def _track_json(t):
+    return json.dumps(dict(Track.from_spotify(t).to_dict(), popularity=t.get('popularity')))
+
+
+def _is_track(t):
+    # Playlists can contain episodes and local files (no ID)
+    return bool(t) and t.get('id') and t.get('type', 'track') == 'track'
+
+
+class LibraryStore:
+    """
+    Per-user copy of the Spotify library (liked tracks, playlists and their
+    tracks) in SQLite, WAL mode like the FeatureStore.
+    sync_state keeps the liked-tracks added_at watermark; playlists keep
+    the snapshot_id they were last synced at. Playlist contents are stored per
+    user, so a followed/shared playlist is one copy per follower.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            columns = [r[1] for r in self._conn.execute("PRAGMA table_info(playlist_tracks)")]
+            if columns and 'user_id' not in columns:
+                # Contents used to be shared by playlist ID: drop them and re-sync every playlist
+                self._conn.execute("DROP TABLE playlist_tracks")
+                self._conn.execute("DELETE FROM playlists")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS saved_tracks ("
+                " user_id TEXT, track_id TEXT, added_at TEXT, track TEXT, gen INTEGER,"
+                " PRIMARY KEY (user_id, track_id));"
+                "CREATE INDEX IF NOT EXISTS saved_by_date ON saved_tracks (user_id, added_at);"
+                "CREATE TABLE IF NOT EXISTS playlists ("
+                " user_id TEXT, playlist_id TEXT, name TEXT, snapshot_id TEXT, total INTEGER,"
+                " PRIMARY KEY (user_id, playlist_id));"
+                "CREATE TABLE IF NOT EXISTS playlist_tracks ("
+                " user_id TEXT, playlist_id TEXT, position INTEGER, track_id TEXT, added_at TEXT, track TEXT,"
+                " PRIMARY KEY (user_id, playlist_id, position));"
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                " user_id TEXT PRIMARY KEY, saved_watermark TEXT, synced_at REAL);"
+            )
+
+    # --- Liked tracks ---
+
+    def saved_state(self, user_id):
+        """(number of stored liked tracks, newest added_at or None before the first full sync)."""
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM saved_tracks WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            row = self._conn.execute(
+                "SELECT saved_watermark FROM sync_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return count, row[0] if row else None
+
+    def put_saved(self, user_id, items, gen=0):
+        """items: Spotify saved-track objects ({'added_at', 'track'})."""
+        records = [
+            (user_id, i['track']['id'], i['added_at'], _track_json(i['track']), gen)
+            for i in items if _is_track(i.get('track'))
+        ]
+        if records:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO saved_tracks (user_id, track_id, added_at, track, gen)"
+                    " VALUES (?, ?, ?, ?, ?)", records
+                )
+        return len(records)
+
+    def finish_saved(self, user_id, gen=None):
+        """Records the watermark; after a full sync (gen), drops tracks that weren't seen."""
+        with self._lock, self._conn:
+            if gen is not None:
+                self._conn.execute("DELETE FROM saved_tracks WHERE user_id = ? AND gen != ?", (user_id, gen))
+            watermark = self._conn.execute(
+                "SELECT MAX(added_at) FROM saved_tracks WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO sync_state (user_id, saved_watermark, synced_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET saved_watermark = excluded.saved_watermark,"
+                " synced_at = excluded.synced_at",
+                (user_id, watermark or '', time.time())
+            )
+
+    def saved_ids_since(self, user_id, added_at):
+        """IDs of the liked tracks added strictly after added_at."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT track_id FROM saved_tracks WHERE user_id = ? AND added_at > ?", (user_id, added_at)
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def saved_tracks(self, user_id, limit=None):
+        """Liked tracks, most recently added first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT track FROM saved_tracks WHERE user_id = ? ORDER BY added_at DESC LIMIT ?",
+                (user_id, -1 if limit is None else limit)
+            ).fetchall()
+        return [Track(**json.loads(r[0])) for r in rows]
+
+    # --- Playlists ---
+
+    def playlist_snapshots(self, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT playlist_id, snapshot_id FROM playlists WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def put_playlist(self, user_id, playlist, items):
+        """Replaces a playlist's metadata and contents (items: Spotify playlist-track objects in order)."""
+        records = [
+            (user_id, playlist['id'], pos, i['track']['id'], i.get('added_at'), _track_json(i['track']))
+            for pos, i in enumerate(items) if _is_track(i.get('track'))
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM playlist_tracks WHERE user_id = ? AND playlist_id = ?", (user_id, playlist['id'])
+            )
+            self._conn.executemany(
+                "INSERT INTO playlist_tracks (user_id, playlist_id, position, track_id, added_at, track)"
+                " VALUES (?, ?, ?, ?, ?, ?)", records
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO playlists (user_id, playlist_id, name, snapshot_id, total)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (user_id, playlist['id'], playlist['name'], playlist['snapshot_id'], len(records))
+            )
+
+    def delete_playlists(self, user_id, playlist_ids):
+        with self._lock, self._conn:
+            for pid in playlist_ids:
+                self._conn.execute("DELETE FROM playlist_tracks WHERE user_id = ? AND playlist_id = ?", (user_id, pid))
+                self._conn.execute("DELETE FROM playlists WHERE user_id = ? AND playlist_id = ?", (user_id, pid))
+
+    def playlists(self, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT playlist_id, name, total FROM playlists WHERE user_id = ? ORDER BY name", (user_id,)
+            ).fetchall()
+        return [{'id': pid, 'name': name, 'total': total} for pid, name, total in rows]
+
+    def playlist_tracks(self, user_id, playlist_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT track FROM playlist_tracks WHERE user_id = ? AND playlist_id = ? ORDER BY position",
+                (user_id, playlist_id)
+            ).fetchall()
+        return [Track(**json.loads(r[0])) for r in rows]
+
+    def library_tracks(self, user_id):
+        """Every distinct track in the user's library (liked first, then playlists)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT track_id, track FROM saved_tracks WHERE user_id = ?"
+                " UNION ALL SELECT track_id, track FROM playlist_tracks WHERE user_id = ?",
+                (user_id, user_id)
+            ).fetchall()
+        unique = {}
+        for tid, track in rows:
+            if tid not in unique:
+                unique[tid] = track
+        return [Track(**json.loads(t)) for t in unique.values()]
+
+    def synced_at(self, user_id):
+        with self._lock:
+            row = self._conn.execute("SELECT synced_at FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+
+class UserLibrary:
+    """One user's synced library, as handed to SpotifyClient."""
+    def __init__(self, store, user_id):
+        self.store = store
+        self.user_id = user_id
+
+    def saved_tracks(self, limit=None):
+        return self.store.saved_tracks(self.user_id, limit)
+
+    def saved_count(self):
+        return self.store.saved_state(self.user_id)[0]
+
+    def playlists(self):
+        return self.store.playlists(self.user_id)
+
+    def tracks(self):
+        return self.store.library_tracks(self.user_id)
+
+
+class LibrarySync:
+    """
+    Pages a user's liked tracks and playlists into the LibraryStore.
+    - First run: every page fetched concurrently (SYNC_CONCURRENCY in flight),
+      streamed into the store as pages arrive.
+    - Afterwards liked tracks are read newest-first only down to the added_at
+      watermark, and only playlists whose snapshot_id changed are re-read. A
+      re-sync with no changes costs: current_user + one liked page + one page
+      per 50 playlists. If the liked count no longer adds up (removals), it
+      falls back to a full liked-tracks sync.
+    With LIBRARY_INDEXING, synced users are queued for index_forever(), which
+    adds their library tracks to the catalogue index one user at a time, off
+    the sync path.
+    Runs at BACKGROUND priority.
+    """
+    def __init__(self, store=None, interval=SYNC_INTERVAL, max_sessions=10000):
+        self.store = store if store is not None else LibraryStore()
+        self.interval = interval
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # user_key -> (user_id, synced_at)
+        self._running = {}              # user_key -> Task
+        self.syncs = 0
+        self.failures = 0
+        self.calls = 0
+        self.indexed = 0
+        self._to_index = OrderedDict()  # user_id -> access token, waiting for index_forever
+
+    # --- Serving ---
+
+    def get(self, user_key, token):
+        """The session's library if it has been synced; schedules a (re-)sync when due. Never waits."""
+        if user_key is None:
+            return None
+        session = self._sessions.get(user_key)
+        if session is None or time.time() - session[1] > self.interval:
+            self.schedule(user_key, token)
+        if session is None:
+            return None
+        self._sessions.move_to_end(user_key)
+        return UserLibrary(self.store, session[0])
+
+    def invalidate(self, user_key):
+        """Logout: forget the session (the stored library stays for the next login)."""
+        self._sessions.pop(user_key, None)
+
+    def stats(self):
+        return {
+            'sessions': len(self._sessions),
+            'syncing': len(self._running),
+            'syncs': self.syncs,
+            'failures': self.failures,
+            'calls': self.calls,
+            'indexed': self.indexed,
+        }
+
+    def schedule(self, user_key, token):
+        if user_key in self._running:
+            return self._running[user_key]
+        task = asyncio.ensure_future(self._run(user_key, token))
+        self._running[user_key] = task
+        task.add_done_callback(lambda _: self._running.pop(user_key, None))
+        return task
+
+    async def _run(self, user_key, token):
+        try:
+            sp = get_client_pool().get(token)
+            with background_priority():
+                result = await self.sync(sp)
+            if LIBRARY_INDEXING:
+                self._to_index[result['user_id']] = token
+            self.syncs += 1
+            self.calls += result['calls']
+            self._sessions[user_key] = (result['user_id'], time.time())
+            self._sessions.move_to_end(user_key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return result
+        except Exception as e:
+            print(f"Library sync failed: {e}")
+            self.failures += 1
+            return None
+
+    # --- Catalogue indexing (opt-in) ---
+
+    async def index_forever(self, interval=30):
+        """Indexes the libraries of users synced since the last pass, one user at a time."""
+        while True:
+            while self._to_index:
+                user_id, token = self._to_index.popitem(last=False)
+                try:
+                    with background_priority():
+                        self.indexed += await self.index_library(user_id, get_client_pool().get(token))
+                except Exception as e:
+                    print(f"Indexing library of {user_id} failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def index_library(self, user_id, sp):
+        """Adds the user's library tracks that aren't in the catalogue index yet; returns how many were added."""
+        recommender = get_recommender()
+        library = await asyncio.to_thread(self.store.library_tracks, user_id)
+        tracks = [t for t in library if t.id not in recommender.index]
+        if not tracks:
+            return 0
+        # Timbre for the whole library in one pass over the shared analysis pool
+        await asyncio.to_thread(recommender.analyze_timbre, tracks)
+        client = SpotifyClient(sp)
+        added = 0
+        for i in range(0, len(tracks), INDEX_BATCH):
+            try:
+                added += await recommender.index_tracks(tracks[i:i + INDEX_BATCH], client)
+            except Exception as e:
+                print(f"Indexing library tracks failed: {e}")
+                break
+        return added
+
+    # --- Sync ---
+
+    async def sync(self, sp):
+        """Syncs the token's user; returns a summary including the number of Spotify calls made."""
+        calls = [0]
+        slots = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+        async def call(method, *args, **kwargs):
+            async with slots:
+                calls[0] += 1
+                return await method(*args, **kwargs)
+
+        user = await call(sp.current_user)
+        user_id = user['id']
+        saved, playlists = await asyncio.gather(
+            self._sync_saved(call, sp, user_id),
+            self._sync_playlists(call, sp, user_id),
+        )
+        return dict(user_id=user_id, calls=calls[0], **saved, **playlists)
+
+    async def _pages(self, call, fetch, total, page_size, start, **kwargs):
+        """Fetches the pages from `start` up to `total` concurrently; yields (offset, page) as they arrive."""
+        tasks = [
+            asyncio.ensure_future(self._offset_page(call, fetch, offset, page_size, **kwargs))
+            for offset in range(start, total, page_size)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _offset_page(call, fetch, offset, page_size, **kwargs):
+        return offset, await call(fetch, limit=page_size, offset=offset, **kwargs)
+
+    async def _sync_saved(self, call, sp, user_id):
+        count, watermark = self.store.saved_state(user_id)
+        first = await call(sp.current_user_saved_tracks, limit=SAVED_PAGE, offset=0)
+        total = first.get('total', 0)
+
+        if watermark is not None:
+            # Incremental: newest first, stop at the first page that reaches the watermark
+            page, offset, added = first, 0, 0
+            while True:
+                items = page['items']
+                added += self.store.put_saved(user_id, [i for i in items if i['added_at'] >= watermark])
+                offset += SAVED_PAGE
+                if not items or items[-1]['added_at'] < watermark or offset >= total:
+                    break
+                page = await call(sp.current_user_saved_tracks, limit=SAVED_PAGE, offset=offset)
+            # The count alone misses an add plus a removal; the newest page must also
+            # match what we store above its oldest added_at
+            if self.store.saved_state(user_id)[0] == total and self._matches_first_page(user_id, first['items']):
+                self.store.finish_saved(user_id)
+                return {'saved_total': total, 'saved_full': False}
+            print(f"Liked tracks out of step for {user_id} ({total} on Spotify), full re-sync")
+
+        # Full sync: stream every page into the store under a new generation
+        gen = int(time.time() * 1000)
+        self.store.put_saved(user_id, first['items'], gen)
+        return await self._full_saved(call, sp, user_id, total, gen)
+
+    def _matches_first_page(self, user_id, items):
+        tracks = [i for i in items if _is_track(i.get('track'))]
+        if not tracks:
+            return True
+        oldest = min(i['added_at'] for i in tracks)
+        return self.store.saved_ids_since(user_id, oldest) <= {i['track']['id'] for i in tracks}
+
+    async def _full_saved(self, call, sp, user_id, total, gen):
+        pages = self._pages(call, sp.current_user_saved_tracks, total, SAVED_PAGE, SAVED_PAGE)
+        try:
+            async for _, page in pages:
+                self.store.put_saved(user_id, page['items'], gen)
+        finally:
+            await pages.aclose()
+        self.store.finish_saved(user_id, gen)
+        return {'saved_total': total, 'saved_full': True}
+
+    async def _sync_playlists(self, call, sp, user_id):
+        first = await call(sp.current_user_playlists, limit=PLAYLISTS_PAGE, offset=0)
+        playlists = list(first['items'])
+        pages = self._pages(call, sp.current_user_playlists, first.get('total', 0), PLAYLISTS_PAGE, PLAYLISTS_PAGE)
+        try:
+            async for offset, page in pages:
+                playlists.extend(page['items'])
+        finally:
+            await pages.aclose()
+
+        known = self.store.playlist_snapshots(user_id)
+        current = {p['id']: p for p in playlists if p}
+        changed = [p for pid, p in current.items() if known.get(pid) != p.get('snapshot_id')]
+        removed = [pid for pid in known if pid not in current]
+
+        await asyncio.gather(*(self._sync_playlist(call, sp, user_id, p) for p in changed))
+        self.store.delete_playlists(user_id, removed)
+        return {'playlists': len(current), 'playlists_synced': len(changed), 'playlists_removed': len(removed)}
+
+    async def _sync_playlist(self, call, sp, user_id, playlist):
+        total = (playlist.get('tracks') or {}).get('total', 0)
+        items = [None] * total
+        pages = self._pages(call, sp.playlist_items, total, PLAYLIST_ITEMS_PAGE, 0, playlist_id=playlist['id'])
+        try:
+            async for offset, page in pages:
+                for i, item in enumerate(page['items']):
+                    if offset + i < total:
+                        items[offset + i] = item
+        finally:
+            await pages.aclose()
+        self.store.put_playlist(user_id, playlist, [i for i in items if i])
+
+
+_sync = None
+
+
+def get_library_sync():
+    global _sync
+    if _sync is None:
+        _sync = LibrarySync()
+    return _sync
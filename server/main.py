@@ -1,21 +1,72 @@
 from fastapi import FastAPI, HTTPException, Request, Response, Depends
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
+from contextlib import asynccontextmanager, aclosing
 
+import asyncio
+import json
 import os
 import sys
+import time
 
 # Add current directory to path to find adjacent modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from auth import SpotifyAuthenticator
+from auth import SpotifyAuthenticator, NoTokenCache
 from spotify_client import SpotifyClient
 from advanced_features import AdvancedFeatureEngine
-import spotipy
+from audio_analysis import shutdown_analysis_pool
+from async_spotify import AppToken, close_http_client, get_client_pool, token_key, warm_http_client
+from track import to_json
+from rate_limiter import get_scheduler
+from decade_pool import get_decade_pools
+from preset_pools import get_preset_pools
+from shared_cache import get_shared_cache
+from taste import get_taste_store
+from library import LIBRARY_INDEXING, get_library_sync
+from recommender import get_recommender
+from token_store import SESSION_TTL, get_token_store
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS, RECOMMENDATION_PATH
 
-app = FastAPI(title="SonicDiscovery API")
+# Background jobs (catalogue prefetch) can be turned off, e.g. for local debugging
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "1") == "1"
+# Upper bound on panels in one /features/batch request
+MAX_BATCH_PANELS = 12
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app_token = AppToken()
+    # First user request reuses this connection instead of paying the TLS handshake
+    jobs = [asyncio.create_task(warm_http_client())]
+    # Users' access tokens are refreshed ahead of expiry, off the request path
+    jobs.append(asyncio.create_task(get_token_store().run_forever()))
+    try:
+        get_authenticator()
+    except HTTPException as e:
+        print(f"Spotify OAuth unavailable: {e.detail}")
+    if BACKGROUND_JOBS:
+        jobs.append(asyncio.create_task(get_decade_pools().run_forever(app_token)))
+        jobs.append(asyncio.create_task(get_preset_pools().run_forever(app_token)))
+    if LIBRARY_INDEXING:
+        jobs.append(asyncio.create_task(get_library_sync().index_forever()))
+    yield
+    for job in jobs:
+        job.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
+    if LIBRARY_INDEXING:
+        # Keep the catalogue index that the indexing job grew
+        try:
+            await asyncio.to_thread(get_recommender().save)
+        except Exception as e:
+            print(f"Failed to save the catalogue index: {e}")
+    # Release the shared keep-alive pool to api.spotify.com
+    await close_http_client()
+    # Preview analysis workers (only started if something analysed timbre)
+    shutdown_analysis_pool()
+
+app = FastAPI(title="SonicDiscovery API", lifespan=lifespan)
 
 origins = [
     "https://sonic-discovery-update-pi.vercel.app",  # Your actual Vercel URL
@@ -31,30 +82,151 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_route_latency(request: Request, call_next):
+    start = time.perf_counter()
+
+    def observe(status):
+        # Label by route template (bounded cardinality), not by raw path
+        route = request.scope.get('route')
+        HTTP_REQUEST_SECONDS.labels(
+            route.path if route is not None else 'unmatched', request.method, str(status)
+        ).observe(time.perf_counter() - start)
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        observe(500)
+        raise
+    # The body is still being produced (NDJSON/SSE routes stream it): stop the clock when it ends
+    body = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            observe(response.status_code)
+
+    response.body_iterator = timed_body()
+    return response
+
+def collect_runtime_metrics():
+    """Scrape-time view of the scheduler, shared cache and catalogue pools."""
+    scheduler = get_scheduler().stats()
+    cache = get_shared_cache().stats()
+    taste = get_taste_store().stats()
+    library = get_library_sync().stats()
+    clients = get_client_pool().stats()
+    tokens = get_token_store().stats()
+    now = time.time()
+    pools = {'decade': get_decade_pools(), 'preset': get_preset_pools()}
+    return [
+        ('sonic_spotify_scheduler_queue_depth', 'gauge', 'Spotify calls waiting for a scheduler slot.',
+         [({}, scheduler['queue_depth'])]),
+        ('sonic_spotify_scheduler_tokens', 'gauge', 'Tokens left in the scheduler bucket.',
+         [({}, scheduler['tokens'])]),
+        ('sonic_spotify_scheduler_paused_seconds', 'gauge', 'Remaining Retry-After pause.',
+         [({}, scheduler['paused_for'])]),
+        ('sonic_spotify_scheduler_pauses_total', 'counter', 'Retry-After pauses started.',
+         [({}, scheduler['pauses'])]),
+        ('sonic_spotify_scheduler_calls_total', 'counter', 'Calls released by the scheduler, by priority.',
+         [({'priority': p}, s['calls']) for p, s in scheduler['priorities'].items()]),
+        ('sonic_spotify_scheduler_wait_seconds_total', 'counter', 'Time calls spent waiting for a slot, by priority.',
+         [({'priority': p}, s['wait_total_s']) for p, s in scheduler['priorities'].items()]),
+        ('sonic_spotify_client_pool_size', 'gauge', 'Pooled per-token Spotify clients.',
+         [({}, clients['size'])]),
+        ('sonic_spotify_client_pool_requests_total', 'counter', 'Client pool lookups by outcome.',
+         [({'outcome': k}, clients[k]) for k in ('hits', 'misses')]),
+        ('sonic_spotify_client_pool_evictions_total', 'counter', 'Pooled clients evicted (idle or over capacity).',
+         [({}, clients['evictions'])]),
+        ('sonic_token_store_users', 'gauge', 'Users whose tokens are held for refresh.',
+         [({}, tokens['users'])]),
+        ('sonic_token_refreshes_total', 'counter', 'Background access-token refreshes by outcome.',
+         [({'outcome': 'ok'}, tokens['refreshes']), ({'outcome': 'failed'}, tokens['refresh_failures'])]),
+        ('sonic_shared_cache_entries', 'gauge', 'Entries in the shared Spotify query cache.',
+         [({}, cache['entries'])]),
+        ('sonic_shared_cache_requests_total', 'counter', 'Shared cache lookups by outcome.',
+         [({'outcome': k}, cache[k]) for k in ('hits', 'stale_hits', 'misses', 'errors_served_stale')]),
+        ('sonic_taste_snapshots', 'gauge', 'Users with a taste snapshot in memory.',
+         [({}, taste['users'])]),
+        ('sonic_taste_requests_total', 'counter', 'Taste snapshot lookups by outcome.',
+         [({'outcome': k}, taste[k]) for k in ('hits', 'misses')]),
+        ('sonic_taste_refreshes_total', 'counter', 'Background taste snapshot refreshes started.',
+         [({}, taste['refreshes'])]),
+        ('sonic_library_syncs_total', 'counter', 'Library syncs by outcome.',
+         [({'outcome': 'ok'}, library['syncs']), ({'outcome': 'failed'}, library['failures'])]),
+        ('sonic_library_sync_calls_total', 'counter', 'Spotify calls made by completed library syncs.',
+         [({}, library['calls'])]),
+        ('sonic_library_syncs_running', 'gauge', 'Library syncs in progress.',
+         [({}, library['syncing'])]),
+        ('sonic_library_tracks_indexed_total', 'counter', 'Library tracks added to the catalogue index.',
+         [({}, library['indexed'])]),
+        ('sonic_catalogue_pool_tracks', 'gauge', 'Tracks in the prefetched catalogue pools.',
+         [({'pool': name, 'key': str(key)}, size)
+          for name, pool in pools.items() for key, size in pool.sizes().items()]),
+        ('sonic_catalogue_pool_age_seconds', 'gauge', 'Age of the loaded catalogue pool snapshot.',
+         [({'pool': name}, round(now - pool.built_at, 1)) for name, pool in pools.items() if pool.built_at]),
+    ]
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
 class LoginRequest(BaseModel):
     code: str
 
 # --- Dependencies ---
+_authenticator = None
+
 def get_authenticator():
-    try:
-        return SpotifyAuthenticator()
-    except ValueError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """One SpotifyOAuth per worker (built at startup); tokens live in the TokenStore, not a cache file."""
+    global _authenticator
+    if _authenticator is None:
+        try:
+            _authenticator = SpotifyAuthenticator(cache_handler=NoTokenCache())
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return _authenticator
 
-def get_client(request: Request, auth: SpotifyAuthenticator = Depends(get_authenticator)):
+def get_token(request: Request):
     token = request.cookies.get("spotify_token")
     if not token:
         # Check header just in case
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
+    return token
+
+def get_access_token(request: Request):
+    """The session's current access token (refreshed in the background), None if the session ended; never waits."""
+    token = get_token(request)
+    return get_token_store().resolve(token) if token else None
+
+def get_user_key(request: Request):
+    """Stable, non-reversible per-session key (hash of the session ID)."""
+    token = get_token(request)
+    return token_key(token) if token else None
+
+async def get_client(request: Request, auth: SpotifyAuthenticator = Depends(get_authenticator)):
+    token = get_token(request)
     
     if not token:
          raise HTTPException(status_code=401, detail="Not authenticated")
     
+    # The cookie holds the session ID; calls use the user's current access token
+    token = get_access_token(request)
+    if not token:
+         raise HTTPException(status_code=401, detail="Session expired")
+
     try:
-        sp = spotipy.Spotify(auth=token)
-        return SpotifyClient(sp)
+        # Pooled per token (shared keep-alive connections); the SpotifyClient stays per request
+        sp = get_client_pool().get(token)
+        # Top tracks/artists/seeds/profile come from the user's taste snapshot once it's built;
+        # this never waits for a build or refresh
+        user_key = get_user_key(request)
+        taste = get_taste_store().get(user_key, token)
+        # Liked tracks and playlists come from the synced library (incremental re-sync when due)
+        library = get_library_sync().get(user_key, token)
+        return SpotifyClient(sp, taste=taste, library=library)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
@@ -65,18 +237,24 @@ def login(auth: SpotifyAuthenticator = Depends(get_authenticator)):
     return RedirectResponse(url=auth.get_auth_url())
 
 @app.get("/callback")
-def callback(code: str, auth: SpotifyAuthenticator = Depends(get_authenticator)):
+async def callback(code: str, auth: SpotifyAuthenticator = Depends(get_authenticator)):
     try:
-        token_info = auth.get_token_from_code(code)
+        # spotipy's token exchange is blocking
+        token_info = await asyncio.to_thread(auth.get_token_from_code, code)
         access_token = token_info['access_token']
+        # The browser only ever gets an opaque session ID, never the Spotify tokens
+        session_id = await get_token_store().login(token_info, get_client_pool().get(access_token))
+        if session_id is None:
+            raise RuntimeError("could not read the Spotify profile")
         
         # Redirect to Frontend Dashboard (matching domain)
-        response = RedirectResponse(url=f"https://sonic-discovery-update-pi.vercel.app/dashboard?token={access_token}")
+        response = RedirectResponse(url=f"https://sonic-discovery-update-pi.vercel.app/dashboard?token={session_id}")
         
         # Set HttpOnly cookie for production (HTTPS with cross-domain support)
         response.set_cookie(
             key="spotify_token", 
-            value=access_token, 
+            value=session_id, 
+            max_age=SESSION_TTL,
             httponly=True, 
             samesite="none",  # Required for cross-domain cookies (Vercel frontend + Render backend)
             secure=True,      # Required for HTTPS in production
@@ -87,19 +265,52 @@ def callback(code: str, auth: SpotifyAuthenticator = Depends(get_authenticator))
         raise HTTPException(status_code=400, detail=f"Auth failed: {str(e)}")
 
 @app.post("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    user_key = get_user_key(request)
+    get_taste_store().invalidate(user_key)
+    get_library_sync().invalidate(user_key)
+    token = get_token(request)
+    if token:
+        access_token = get_token_store().resolve(token)
+        if access_token:
+            get_client_pool().discard(access_token)
+        get_token_store().logout(token)
     response.delete_cookie("spotify_token")
     return {"status": "logged_out"}
 
 @app.get("/me")
-def get_profile(client: SpotifyClient = Depends(get_client)):
-    return client.get_user_profile()
+async def get_profile(client: SpotifyClient = Depends(get_client)):
+    return await client.get_user_profile()
+
+@app.post("/library/sync")
+async def sync_library(request: Request):
+    """Syncs the user's liked tracks and playlists now (incremental after the first run)."""
+    token = get_access_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    # The sync task is shared (single-flight): a client disconnect must not cancel it for everyone
+    result = await asyncio.shield(get_library_sync().schedule(get_user_key(request), token))
+    if result is None:
+        raise HTTPException(status_code=502, detail="Library sync failed")
+    return result
+
+@app.get("/health/scheduler")
+def scheduler_stats():
+    """Queue depth, wait times and 429 pauses of the outbound Spotify scheduler."""
+    return get_scheduler().stats()
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition (per worker process)."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 # --- Dashboard Routes ---
 
 @app.get("/dashboard/stats")
-def get_dashboard_stats(client: SpotifyClient = Depends(get_client)):
-    return {
+async def get_dashboard_stats(client: SpotifyClient = Depends(get_client)):
+    # The panels are independent, so fire them all at once:
+    # latency is the slowest single call instead of the sum.
+    panels = {
         "top_genres": client.get_top_genres(5),
         "top_artists": client.get_top_artists(5),
         "top_tracks": client.get_top_tracks(4),
@@ -108,31 +319,36 @@ def get_dashboard_stats(client: SpotifyClient = Depends(get_client)):
         "audio_profile": client.get_audio_profile(),
         "listening_stats": client.get_listening_stats()
     }
+    results = await asyncio.gather(*panels.values())
+    return to_json(dict(zip(panels.keys(), results)))
 
 @app.get("/dashboard/audio-profile")
-def get_audio_profile(client: SpotifyClient = Depends(get_client)):
+async def get_audio_profile(client: SpotifyClient = Depends(get_client)):
     """Returns user's audio profile based on their top tracks."""
-    profile = client.get_audio_profile()
+    profile = await client.get_audio_profile()
     if not profile:
         raise HTTPException(status_code=404, detail="Could not generate audio profile")
     return profile
 
 @app.get("/dashboard/listening-stats")
-def get_listening_stats(client: SpotifyClient = Depends(get_client)):
+async def get_listening_stats(client: SpotifyClient = Depends(get_client)):
     """Returns comprehensive listening statistics."""
-    return client.get_listening_stats()
+    return await client.get_listening_stats()
 
 # --- Feature Routes ---
 
-@app.get("/features/discover")
-def discover(client: SpotifyClient = Depends(get_client)):
+# --- Feature panels ---
+# Each panel returns a list of Track objects; the GET routes and /features/batch share them.
+
+async def discover_request(client):
     """
     Improved discovery using mixed seeds from:
     - Top tracks (listening history)
     - Top artists
     - Liked tracks (fallback)
+    Returns the get_recommendations arguments.
     """
-    seeds = client.get_mixed_seeds()
+    seeds = await client.get_mixed_seeds()
     
     # Build recommendation request with available seeds
     kwargs = {'limit': 12}
@@ -143,16 +359,18 @@ def discover(client: SpotifyClient = Depends(get_client)):
     
     # If we have no seeds at all, use genre fallback
     if not seeds['seed_tracks'] and not seeds['seed_artists']:
-        return client.get_recommendations(seed_genres=['pop', 'rock'], limit=12)
+        return {'seed_genres': ['pop', 'rock'], 'limit': 12}
     
-    return client.get_recommendations(**kwargs)
+    return kwargs
 
-@app.get("/features/mood")
-def mood_tuner(valence: float, energy: float, client: SpotifyClient = Depends(get_client)):
+async def discover_tracks(client):
+    return await client.get_recommendations(**await discover_request(client))
+
+async def mood_tracks(client, valence: float, energy: float):
     """
     Mood-based recommendations using mixed seeds.
     """
-    seeds = client.get_mixed_seeds()
+    seeds = await client.get_mixed_seeds()
     
     kwargs = {
         'limit': 12,
@@ -168,29 +386,191 @@ def mood_tuner(valence: float, energy: float, client: SpotifyClient = Depends(ge
     if not seeds['seed_tracks'] and not seeds['seed_artists']:
         kwargs['seed_genres'] = ['pop']
     
-    return client.get_recommendations(**kwargs)
+    return await client.get_recommendations(**kwargs)
+
+async def time_travel_tracks(client, year: int, user_key=None):
+    # Served from the prefetched decade pool when we have one (no Spotify call)
+    pools = get_decade_pools()
+    if pools.has(year):
+        return pools.sample(year, 12, user_key=user_key)
+    return await client.search_decade(year, year+9, limit=12)
+
+def preset_pool_tracks(seed_genres, params, limit):
+    """A preset served from the materialized pools, or None if there's no pool yet."""
+    pools = get_preset_pools()
+    if pools.has(seed_genres):
+        tracks = pools.recommend(seed_genres, params, limit)
+        if tracks:
+            RECOMMENDATION_PATH.labels('preset_pool').inc()
+            return tracks
+    return None
+
+async def preset_recommendations(client, seed_genres, params, limit):
+    """Serves a preset from the materialized pools; live recommendations if there's no pool yet."""
+    tracks = preset_pool_tracks(seed_genres, params, limit)
+    if tracks:
+        return tracks
+    return await client.get_recommendations(seed_genres=seed_genres, limit=limit, **params)
+
+async def preset_batches(client, seed_genres, params, limit):
+    """Streaming preset_recommendations."""
+    tracks = preset_pool_tracks(seed_genres, params, limit)
+    if tracks:
+        yield tracks
+        return
+    async with aclosing(client.stream_recommendations(seed_genres=seed_genres, limit=limit, **params)) as batches:
+        async for batch in batches:
+            yield batch
+
+async def vibe_tracks(client, location: str, weather: str, time: str):
+    params, seed_genres = AdvancedFeatureEngine(client).vibe_teleporter(location, weather, time)
+    return await preset_recommendations(client, seed_genres, params, 12)
+
+async def aesthetic_tracks(client, style: str):
+    params, seed_genres = AdvancedFeatureEngine(client).aesthetic_generator(style)
+    return await preset_recommendations(client, seed_genres, params, 12)
+
+async def alternate_request(client):
+    engine = AdvancedFeatureEngine(client)
+    top_genres, genre_index = await asyncio.gather(client.get_top_genres(), client.get_genre_index())
+    params, seed_genres = engine.alternate_you(top_genres, genre_index)
+    return dict(params, seed_genres=seed_genres, limit=12)
+
+async def alternate_tracks(client):
+    return await client.get_recommendations(**await alternate_request(client))
+
+# Panel name -> (function, required params with their types)
+FEATURE_PANELS = {
+    'discover': (discover_tracks, {}),
+    'mood': (mood_tracks, {'valence': float, 'energy': float}),
+    'time-travel': (time_travel_tracks, {'year': int}),
+    'vibe': (vibe_tracks, {'location': str, 'weather': str, 'time': str}),
+    'aesthetic': (aesthetic_tracks, {'style': str}),
+    'alternate': (alternate_tracks, {}),
+}
+
+# --- Streaming (NDJSON / SSE) ---
+
+STREAM_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def check_stream_format(stream):
+    if stream is not None and stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"stream must be one of: {', '.join(STREAM_MEDIA_TYPES)}")
+    return stream
+
+def stream_response(batches, limit, stream):
+    """
+    Sends each batch of tracks as soon as it is produced:
+    {"tracks": [...], "count": <sent so far>, "final": false}, one NDJSON line or SSE
+    event per batch. The batch that reaches `limit` (or an empty closing message if the
+    sources run dry first) has "final": true.
+    """
+    def encode(message):
+        data = json.dumps(message)
+        return f"event: tracks\ndata: {data}\n\n" if stream == 'sse' else data + "\n"
+
+    async def body():
+        sent = 0
+        # aclosing: a client disconnect cancels the upstream fan-out too
+        async with aclosing(batches) as it:
+            async for batch in it:
+                if not batch:
+                    continue
+                sent += len(batch)
+                final = sent >= limit
+                yield encode({'tracks': to_json(batch), 'count': sent, 'final': final})
+                if final:
+                    return
+        yield encode({'tracks': [], 'count': sent, 'final': True})
+
+    # No proxy buffering, so the first tracks reach the browser right away
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[stream], headers=headers)
+
+# --- Feature routes ---
+# discover/vibe/aesthetic/alternate accept ?stream=ndjson|sse
+
+@app.get("/features/discover")
+async def discover(stream: Optional[str] = None, client: SpotifyClient = Depends(get_client)):
+    if check_stream_format(stream):
+        kwargs = await discover_request(client)
+        return stream_response(client.stream_recommendations(**kwargs), kwargs['limit'], stream)
+    return to_json(await discover_tracks(client))
+
+@app.get("/features/mood")
+async def mood_tuner(valence: float, energy: float, client: SpotifyClient = Depends(get_client)):
+    return to_json(await mood_tracks(client, valence, energy))
 
 @app.get("/features/time-travel")
-def time_travel(year: int, client: SpotifyClient = Depends(get_client)):
-    return client.search_decade(year, year+9, limit=12)
+async def time_travel(year: int, request: Request, client: SpotifyClient = Depends(get_client)):
+    return to_json(await time_travel_tracks(client, year, user_key=get_user_key(request)))
 
 @app.get("/features/vibe")
-def vibe_teleporter(location: str, weather: str, time: str, client: SpotifyClient = Depends(get_client)):
-    engine = AdvancedFeatureEngine(client)
-    params, seed_genres = engine.vibe_teleporter(location, weather, time)
-    return client.get_recommendations(seed_genres=seed_genres, limit=12, **params)
+async def vibe_teleporter(location: str, weather: str, time: str, stream: Optional[str] = None,
+                          client: SpotifyClient = Depends(get_client)):
+    if check_stream_format(stream):
+        params, seed_genres = AdvancedFeatureEngine(client).vibe_teleporter(location, weather, time)
+        return stream_response(preset_batches(client, seed_genres, params, 12), 12, stream)
+    return to_json(await vibe_tracks(client, location, weather, time))
 
 @app.get("/features/aesthetic")
-def aesthetic(style: str, client: SpotifyClient = Depends(get_client)):
-    engine = AdvancedFeatureEngine(client)
-    params, seed_genres = engine.aesthetic_generator(style)
-    return client.get_recommendations(seed_genres=seed_genres, limit=12, **params)
+async def aesthetic(style: str, stream: Optional[str] = None, client: SpotifyClient = Depends(get_client)):
+    if check_stream_format(stream):
+        params, seed_genres = AdvancedFeatureEngine(client).aesthetic_generator(style)
+        return stream_response(preset_batches(client, seed_genres, params, 12), 12, stream)
+    return to_json(await aesthetic_tracks(client, style))
 
 @app.get("/features/alternate")
-def alternate_you(client: SpotifyClient = Depends(get_client)):
-    engine = AdvancedFeatureEngine(client)
-    top_genres = client.get_top_genres()
-    params, seed_genres = engine.alternate_you(top_genres)
-    return client.get_recommendations(seed_genres=seed_genres, limit=12, **params)
+async def alternate_you(stream: Optional[str] = None, client: SpotifyClient = Depends(get_client)):
+    if check_stream_format(stream):
+        kwargs = await alternate_request(client)
+        return stream_response(client.stream_recommendations(**kwargs), kwargs['limit'], stream)
+    return to_json(await alternate_tracks(client))
+
+class PanelRequest(BaseModel):
+    feature: str
+    params: dict = {}
+    # Key for this panel in the response (defaults to the feature name)
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    panels: List[PanelRequest]
+
+@app.post("/features/batch")
+async def features_batch(batch: BatchRequest, request: Request, client: SpotifyClient = Depends(get_client)):
+    """
+    Several feature panels in one round-trip, e.g.
+    {"panels": [{"feature": "discover"}, {"feature": "mood", "params": {"valence": 0.8, "energy": 0.4}}]}
+    All panels share one SpotifyClient, so user context (mixed seeds, top artists/genres,
+    profile) is fetched once, and the panels run concurrently.
+    Returns {panel id: tracks}; a failing panel becomes {"error": ...} without failing the rest.
+    """
+    if len(batch.panels) > MAX_BATCH_PANELS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PANELS} panels per batch")
+
+    async def run(panel):
+        if panel.feature not in FEATURE_PANELS:
+            return {'error': f"Unknown feature '{panel.feature}'"}
+        fn, required = FEATURE_PANELS[panel.feature]
+        missing = [p for p in required if p not in panel.params]
+        if missing:
+            return {'error': f"Missing params: {', '.join(missing)}"}
+        try:
+            kwargs = {p: cast(panel.params[p]) for p, cast in required.items()}
+        except (TypeError, ValueError) as e:
+            return {'error': f"Invalid params: {e}"}
+        if panel.feature == 'time-travel':
+            kwargs['user_key'] = get_user_key(request)
+        try:
+            return to_json(await fn(client, **kwargs))
+        except Exception as e:
+            print(f"Batch panel {panel.feature} failed: {e}")
+            return {'error': str(e)}
+
+    keys = [panel.id or panel.feature for panel in batch.panels]
+    if len(set(keys)) != len(keys):
+        raise HTTPException(status_code=400, detail="Duplicate panel ids; set 'id' on repeated features")
+    results = await asyncio.gather(*(run(panel) for panel in batch.panels))
+    return dict(zip(keys, results))
 
 # Run with: uvicorn main:app --reload
\ No newline at end of file
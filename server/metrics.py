@@ -0,0 +1,203 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a cached hit (ms) up to a slow fan-out with retries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def exposed_name(self):
+        return self.name
+
+    def labels(self, *values):
+        """Child for one label combination (cached, so hot paths pay one dict lookup)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self):
+        name = self.exposed_name()
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} {self.TYPE}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def exposed_name(self):
+        # Counter samples (and their HELP/TYPE lines) carry the _total suffix
+        return self.name + '_total'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Per-bucket (non-cumulative) counts; cumulated only when rendered
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        cumulative = 0
+        for bound, n in zip(self.buckets, child.counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames, values, [('le', _format_value(float(bound)))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values, [('le', '+Inf')])
+        yield f"{self.name}_bucket{labels} {child.count}"
+        yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(child.sum)}"
+        yield f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}"
+
+
+class Registry:
+    """
+    Metrics of one worker process, rendered in the Prometheus text format.
+    Recording is a dict lookup plus an increment (no locks: updates come from
+    the event loop; a rare lost increment from a worker thread is acceptable).
+    Collectors are called at scrape time for values that already live
+    elsewhere (scheduler, caches): fn() -> [(name, type, help, [(labels_dict, value)])].
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, type_, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- Shared metrics ---
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'sonic_http_request_duration_seconds', 'Route latency.', ('route', 'method', 'status')
+)
+SPOTIFY_CALL_SECONDS = REGISTRY.histogram(
+    'sonic_spotify_call_duration_seconds', 'Spotify API call latency (including scheduler wait) by spotipy method.',
+    ('method',)
+)
+SPOTIFY_CALL_ERRORS = REGISTRY.counter(
+    'sonic_spotify_call_errors', 'Failed Spotify API calls by spotipy method and HTTP status.', ('method', 'status')
+)
+SPOTIFY_RATE_LIMITED = REGISTRY.counter(
+    'sonic_spotify_rate_limited', '429 responses received from Spotify.'
+)
+RECOMMENDATION_PATH = REGISTRY.counter(
+    'sonic_recommendation_path', 'Which source served get_recommendations.', ('path',)
+)
+CLIENT_ERRORS = REGISTRY.counter(
+    'sonic_client_errors', 'Errors swallowed by SpotifyClient fallbacks, by operation.', ('operation',)
+)
@@ -0,0 +1,117 @@
+import os
+import threading
+
+import numpy as np
+
+from feature_store import DATA_DIR
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'normalizer.npz')
+# Bump when the on-disk layout changes; older snapshots are ignored
+FORMAT_VERSION = 1
+
+
+class RunningNormalizer:
+    """
+    Global z-score normalizer with streaming statistics.
+    partial_fit() merges a batch's mean/variance into the running totals
+    (Chan et al. parallel update, float64), so tracks can be folded in as they
+    enter the catalogue. Every update bumps `version`, which is saved with the
+    statistics; the ANN index keeps a frozen copy (and its version) of the stats
+    its vectors were scaled with.
+    """
+    def __init__(self, dim):
+        self.dim = dim
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self._m2 = np.zeros(dim, dtype=np.float64)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_fitted(self):
+        return self.count > 0
+
+    @property
+    def var(self):
+        if self.count < 2:
+            return np.ones(self.dim)
+        return self._m2 / self.count
+
+    @property
+    def scale(self):
+        scale = np.sqrt(self.var)
+        # Constant features (e.g. disabled librosa columns) pass through unscaled
+        scale[scale < 1e-12] = 1.0
+        return scale
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.dim)
+        n_b = len(X)
+        if n_b == 0:
+            return self
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        with self._lock:
+            n_a = self.count
+            n = n_a + n_b
+            delta = mean_b - self.mean
+            self.mean = self.mean + delta * (n_b / n)
+            self._m2 = self._m2 + m2_b + delta ** 2 * (n_a * n_b / n)
+            self.count = n
+            self.version += 1
+        return self
+
+    def frozen(self):
+        """Copy of the current statistics that later partial_fit calls don't move."""
+        with self._lock:
+            copy = RunningNormalizer(self.dim)
+            copy.count, copy.version = self.count, self.version
+            copy.mean, copy._m2 = self.mean.copy(), self._m2.copy()
+        return copy
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+    def save(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        with self._lock:
+            np.savez(
+                tmp,
+                format_version=FORMAT_VERSION,
+                version=self.version,
+                count=self.count,
+                mean=self.mean,
+                m2=self._m2,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        data = np.load(path)
+        if int(data['format_version']) != FORMAT_VERSION:
+            raise ValueError(f"Unsupported normalizer format {int(data['format_version'])}")
+        normalizer = cls(len(data['mean']))
+        normalizer.version = int(data['version'])
+        normalizer.count = int(data['count'])
+        normalizer.mean = data['mean']
+        normalizer._m2 = data['m2']
+        return normalizer
+
+
+_normalizer = None
+
+
+def get_normalizer(dim, path=DEFAULT_PATH):
+    """Process-wide normalizer, loaded from data/ when a snapshot exists."""
+    global _normalizer
+    if _normalizer is None:
+        if os.path.exists(path):
+            try:
+                _normalizer = RunningNormalizer.load(path)
+            except Exception as e:
+                print(f"Failed to load normalizer, starting fresh: {e}")
+        if _normalizer is None or _normalizer.dim != dim:
+            _normalizer = RunningNormalizer(dim)
+    return _normalizer
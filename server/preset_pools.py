@@ -0,0 +1,173 @@
+import asyncio
+import os
+import random
+import time
+
+import numpy as np
+
+from advanced_features import AdvancedFeatureEngine
+from constraints import ConstraintQuery
+from feature_extraction import FeatureExtractor
+from feature_store import DATA_DIR, get_feature_store
+from rate_limiter import background_priority
+from snapshot import BackgroundSnapshot
+from track import Track
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'preset_pools.json')
+PAGE_SIZE = 50
+PAGES_PER_GENRE = int(os.getenv('PRESET_POOL_PAGES', '10'))
+
+FEATURES = FeatureExtractor.SPOTIFY_AUDIO_FEATURES
+
+
+class PresetPools(BackgroundSnapshot):
+    """
+    Candidate pools for the static /features/vibe and /features/aesthetic presets.
+    A background job searches every seed genre the presets can produce
+    (AdvancedFeatureEngine.preset_genres), attaches Spotify audio features from the
+    FeatureStore and writes a JSON snapshot to data/. Requests rank the pooled
+    tracks against the preset's target_/min_/max_ parameters in memory (ConstraintQuery).
+    """
+    def __init__(self, path=DEFAULT_PATH, genres=None, pages_per_genre=PAGES_PER_GENRE):
+        super().__init__(path)
+        self.genres = list(genres) if genres is not None else AdvancedFeatureEngine.preset_genres()
+        self.pages_per_genre = pages_per_genre
+
+        self.pools = {}  # genre -> (tracks, X (n, len(FEATURES)) float32, mask)
+
+    # --- Serving ---
+
+    def has(self, seed_genres):
+        self.maybe_reload()
+        return any(self.pools.get(g) for g in seed_genres)
+
+    def recommend(self, seed_genres, params, limit):
+        """
+        `limit` tracks from the seed genres' pools, drawn from the 3*limit closest to
+        the preset's targets (so repeated requests don't return the same list), or
+        from all of the genres' tracks when none of them has audio features.
+        Returns [] when none of the genres has a pool.
+        """
+        tracks, X, mask = self._candidates(seed_genres)
+        if not tracks:
+            return []
+
+        query = ConstraintQuery.compile(params, FEATURES)
+        # Without any audio features (endpoint unavailable) every distance is inf and the
+        # ranking would just be the first genre's first tracks: sample from all of them instead
+        if query and mask.any():
+            order = query.rank(X, mask, [np.nan if t.popularity is None else t.popularity for t in tracks])
+            candidates = order[:limit * 3] if len(order) else np.arange(len(tracks))
+        else:
+            candidates = np.arange(len(tracks))
+        picked = random.sample(list(candidates), min(limit, len(candidates)))
+        return [tracks[i] for i in picked]
+
+    def sizes(self):
+        return {g: len(pool[0]) for g, pool in self.pools.items()}
+
+    def _candidates(self, seed_genres):
+        tracks, blocks, masks, seen = [], [], [], set()
+        for g in seed_genres:
+            pool = self.pools.get(g)
+            if not pool:
+                continue
+            pool_tracks, X, mask = pool
+            keep = []
+            for i, t in enumerate(pool_tracks):
+                if t.id not in seen:
+                    seen.add(t.id)
+                    keep.append(i)
+            tracks.extend(pool_tracks[i] for i in keep)
+            blocks.append(X[keep])
+            masks.append(mask[keep])
+        if not tracks:
+            return [], None, None
+        return tracks, np.concatenate(blocks), np.concatenate(masks)
+
+    # --- Snapshot ---
+
+    def _load(self, data):
+        pools = {}
+        for g, pool in data['pools'].items():
+            tracks = [Track(**t) for t in pool['tracks']]
+            X = np.zeros((len(tracks), len(FEATURES)), dtype=np.float32)
+            mask = np.zeros(len(tracks), dtype=bool)
+            for i, row in enumerate(pool['features']):
+                if row is not None:
+                    X[i] = row
+                    mask[i] = True
+            pools[g] = (tracks, X, mask)
+        self.pools = pools
+
+    def _dump(self):
+        return {'pools': {
+            g: {
+                'tracks': [dict(t.to_dict(), popularity=t.popularity) for t in tracks],
+                'features': [X[i].tolist() if mask[i] else None for i in range(len(tracks))],
+            }
+            for g, (tracks, X, mask) in self.pools.items()
+        }}
+
+    # --- Building (background) ---
+
+    async def build(self, sp):
+        """Pages through every preset genre at BACKGROUND priority, adds audio features and saves a snapshot."""
+        store = get_feature_store()
+        with background_priority():
+            pools = {}
+            for g in self.genres:
+                tracks = await self._build_genre(sp, g)
+                if not tracks:
+                    continue
+                X, mask = await store.ensure([t.id for t in tracks], sp.audio_features)
+                pools[g] = (tracks, X, mask)
+                print(f"Preset pool {g}: {len(tracks)} tracks, {int(mask.sum())} with features")
+        self.pools = pools or self.pools
+        self.built_at = time.time()
+        self.save()
+
+    async def _build_genre(self, sp, genre):
+        pages = await asyncio.gather(*(
+            self._fetch_page(sp, genre, offset)
+            for offset in range(0, self.pages_per_genre * PAGE_SIZE, PAGE_SIZE)
+        ))
+        unique = {}
+        for page in pages:
+            for item in page:
+                if item and item.get('id'):
+                    unique.setdefault(item['id'], item)
+        return [Track.from_spotify(t) for t in unique.values()]
+
+    async def _fetch_page(self, sp, genre, offset):
+        try:
+            results = await sp.search(q=f"genre:{genre}", type='track', limit=PAGE_SIZE, offset=offset)
+            return results['tracks']['items']
+        except Exception as e:
+            print(f"Preset pool page failed ({genre}, offset {offset}): {e}")
+            return []
+
+
+_pools = None
+
+
+def get_preset_pools():
+    global _pools
+    if _pools is None:
+        _pools = PresetPools()
+        _pools.maybe_reload()
+    return _pools
+
+
+if __name__ == '__main__':
+    # Offline build: python preset_pools.py (needs SPOTIPY_CLIENT_ID/SECRET)
+    import auth  # loads .env from the project root
+    from async_spotify import AppToken, close_http_client
+
+    async def main():
+        try:
+            await get_preset_pools().build(await AppToken().client())
+        finally:
+            await close_http_client()
+
+    asyncio.run(main())
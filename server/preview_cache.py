@@ -0,0 +1,197 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from feature_store import DATA_DIR
+
+DEFAULT_DIR = os.path.join(DATA_DIR, 'previews')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class PreviewCache:
+    """
+    Streaming preview downloader backed by a content-addressed disk cache.
+    - Files live at <dir>/<sha1[:2]>/<sha1>.mp3 where sha1 = hash of the track ID,
+      so a preview is downloaded at most once no matter how often it's analysed.
+    - Downloads stream in chunks through one pooled keep-alive session and at most
+      max_concurrent run at a time (across all callers).
+    - When the cache grows past max_bytes, least-recently-used files are evicted
+      (hits refresh the file's mtime).
+    """
+    def __init__(self, cache_dir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES, max_concurrent=8, timeout=(5, 30)):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrent)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Event
+        self._size = None     # lazily measured total bytes on disk
+        self._evicting = False
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.mp3')
+
+    def fetch(self, track_id, preview_url):
+        """Returns a local path for the preview (cached or freshly streamed), or None."""
+        if not preview_url:
+            return None
+        key = track_id or preview_url
+        path = self.path_for(key)
+
+        while True:
+            if os.path.exists(path):
+                self._touch(path)
+                return path
+            with self._lock:
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = self._in_flight[key] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+            if owner:
+                break
+            # Someone else is downloading this preview; wait and re-check the cache
+            event.wait()
+            if not os.path.exists(path):
+                return None
+
+        try:
+            with self._slots:
+                return self._download(preview_url, path)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def fetch_many(self, tracks):
+        """
+        Downloads many previews concurrently and yields (track_id, path) as each completes
+        (path is None on failure).
+        tracks: {track_id: preview_url} or an iterable of Track objects.
+        """
+        if isinstance(tracks, dict):
+            items = list(tracks.items())
+        else:
+            items = [(t.id, t.preview_url) for t in tracks]
+        items = [(tid, url) for tid, url in items if url]
+        if not items:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as pool:
+            futures = {pool.submit(self.fetch, tid, url): tid for tid, url in items}
+            for future in as_completed(futures):
+                try:
+                    path = future.result()
+                except Exception as e:
+                    print(f"Preview download failed for {futures[future]}: {e}")
+                    path = None
+                yield futures[future], path
+
+    def _download(self, url, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.part"
+        written = 0
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    return None
+                with open(tmp, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"Error downloading preview: {e}")
+            return None
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self._account(written)
+        return path
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is not None:
+                self._size += added
+            size = self._size
+        if size is None:
+            # First download: measure the cache outside the lock (a full directory scan)
+            measured = sum(size for _, size, _ in self._entries())
+            with self._lock:
+                if self._size is None:
+                    self._size = measured
+                size = self._size
+        if size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.mp3'):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def evict(self, target_ratio=0.9):
+        """
+        Deletes least-recently-used previews until the cache is under target_ratio * max_bytes.
+        The directory scan and unlinks run outside the lock (fetches keep going); the
+        lock only guards the size counter and keeps one eviction at a time.
+        """
+        with self._lock:
+            if self._evicting:
+                return
+            self._evicting = True
+            size_before = self._size or 0
+        try:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * target_ratio
+            removed = 0
+            for path, size, _ in entries:
+                if total - removed <= target:
+                    break
+                try:
+                    os.remove(path)
+                    removed += size
+                except OSError:
+                    pass
+            with self._lock:
+                # What's on disk now, plus downloads accounted while we scanned
+                self._size = total - removed + max(0, (self._size or 0) - size_before)
+        finally:
+            with self._lock:
+                self._evicting = False
+
+
+_cache = None
+
+
+def get_preview_cache():
+    """Process-wide preview cache (one pooled session per worker)."""
+    global _cache
+    if _cache is None:
+        _cache = PreviewCache()
+    return _cache
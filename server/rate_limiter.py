@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import contextmanager
+
+from feature_store import DATA_DIR
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# Priority of Spotify calls made from the current task. Request handlers run at
+# the default; prefetch/sync jobs wrap their work in background_priority().
+_priority = contextvars.ContextVar('spotify_call_priority', default=INTERACTIVE)
+
+# App-wide quota, split evenly across worker processes
+DEFAULT_RATE = float(os.getenv('SPOTIFY_RATE_LIMIT_RPS', '10'))
+DEFAULT_BURST = float(os.getenv('SPOTIFY_RATE_LIMIT_BURST', '20'))
+WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+# Longest Retry-After honoured as a global pause; longer ones are clamped (and
+# interactive calls that got them fail with the 429 instead of waiting)
+MAX_PAUSE = float(os.getenv('SPOTIFY_MAX_RETRY_AFTER_SECONDS', '30'))
+# Optional: share Retry-After pauses between workers through a file in data/
+SHARED_PAUSE_PATH = os.path.join(DATA_DIR, 'spotify_pause_until')
+SHARED_PAUSE = os.getenv('SPOTIFY_RATE_LIMIT_SHARED', '0') == '1'
+
+
+@contextmanager
+def background_priority():
+    """Runs Spotify calls made inside the block at BACKGROUND priority."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class SpotifyScheduler:
+    """
+    Outbound scheduler every Spotify API call passes through.
+    - Token bucket (rate tokens/s, up to burst) sized to the app quota.
+    - A 429's Retry-After pauses *all* calls, not just the one that got it
+      (and, with shared_pause_path, every worker that shares the file), for at
+      most max_pause seconds.
+    - Waiting calls are released in priority order (interactive before background),
+      FIFO within a priority.
+    """
+    def __init__(self, rate=DEFAULT_RATE / WORKERS, burst=DEFAULT_BURST / WORKERS, shared_pause_path=None,
+                 max_pause=MAX_PAUSE):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.shared_pause_path = shared_pause_path
+        self.max_pause = max_pause
+
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0  # wall clock, so it can be shared across processes
+        self._shared_checked_at = 0.0
+
+        self._waiters = []
+        self._live = 0  # waiters still pending (cancelled ones stay in the heap until popped)
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._wakeup = None
+
+        self._stats = {
+            p: {'calls': 0, 'wait_total': 0.0, 'wait_max': 0.0} for p in PRIORITY_NAMES
+        }
+        self._max_queue_depth = 0
+        self._pauses = 0
+        self._paused_seconds = 0.0
+
+    # --- Public API ---
+
+    async def acquire(self, priority=None):
+        """Waits for a slot; returns the seconds spent waiting."""
+        if priority is None:
+            priority = current_priority()
+        start = time.monotonic()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._live += 1
+        self._max_queue_depth = max(self._max_queue_depth, self._live)
+        self._ensure_dispatcher(loop)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelling the task cancels the future too, unless the dispatcher released it first
+            future.cancel()
+            if future.cancelled():
+                self._live -= 1
+                self._compact()
+            raise
+
+        waited = time.monotonic() - start
+        stats = self._stats[priority]
+        stats['calls'] += 1
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+        return waited
+
+    def pause(self, seconds):
+        """Global back-off after a 429 (Retry-After seconds, clamped to max_pause)."""
+        until = time.time() + min(max(0.0, float(seconds)), self.max_pause)
+        if until <= self._paused_until:
+            return
+        self._pauses += 1
+        self._paused_seconds += until - max(self._paused_until, time.time())
+        self._paused_until = until
+        if self.shared_pause_path:
+            try:
+                tmp = f"{self.shared_pause_path}.{os.getpid()}"
+                with open(tmp, 'w') as f:
+                    f.write(repr(until))
+                os.replace(tmp, self.shared_pause_path)
+            except OSError as e:
+                print(f"Failed to share rate-limit pause: {e}")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self):
+        now = time.time()
+        by_priority = {}
+        for p, s in self._stats.items():
+            by_priority[PRIORITY_NAMES[p]] = {
+                'calls': s['calls'],
+                'avg_wait_ms': round(1000 * s['wait_total'] / s['calls'], 2) if s['calls'] else 0.0,
+                'max_wait_ms': round(1000 * s['wait_max'], 2),
+                'wait_total_s': round(s['wait_total'], 3),
+            }
+        return {
+            'queue_depth': self._live,
+            'max_queue_depth': self._max_queue_depth,
+            'tokens': round(self._tokens, 2),
+            'rate_per_sec': self.rate,
+            'paused_for': round(max(0.0, self._paused_until - now), 2),
+            'pauses': self._pauses,
+            'paused_seconds_total': round(self._paused_seconds, 2),
+            'priorities': by_priority,
+        }
+
+    # --- Dispatch ---
+
+    def _ensure_dispatcher(self, loop):
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        while self._waiters:
+            delay = self._pause_remaining()
+            if delay <= 0:
+                self._refill()
+                if self._tokens >= 1:
+                    _, _, future = heapq.heappop(self._waiters)
+                    if not future.done():
+                        self._live -= 1
+                        self._tokens -= 1
+                        future.set_result(None)
+                    continue
+                delay = (1 - self._tokens) / self.rate
+
+            # Sleep until a token/pause expires, or until pause() changes the picture
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _compact(self):
+        # Many cancelled requests (e.g. disconnects during a long pause): drop their entries
+        if len(self._waiters) > 2 * self._live + 64:
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _pause_remaining(self):
+        now = time.time()
+        if self.shared_pause_path and now - self._shared_checked_at > 0.5:
+            self._shared_checked_at = now
+            try:
+                with open(self.shared_pause_path) as f:
+                    self._paused_until = max(self._paused_until, float(f.read().strip() or 0))
+            except (OSError, ValueError):
+                pass
+        return self._paused_until - now
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """Process-wide scheduler shared by every AsyncSpotify instance."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = SpotifyScheduler(shared_pause_path=SHARED_PAUSE_PATH if SHARED_PAUSE else None)
+    return _scheduler
@@ -1,47 +1,64 @@
+import json
+import os
+
 import numpy as np
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
+from audio_analysis import analyze_previews, can_decode_previews
 from feature_extraction import FeatureExtractor
+from ann_index import get_ann_index
+from normalizer import RunningNormalizer, get_normalizer
+from preview_cache import get_preview_cache
+from feature_store import DATA_DIR, get_feature_store, TIMBRE_TABLE, TIMBRE_COLUMNS
+from track import Track
+
+# Track records for the IDs in the ANN index, saved next to it
+CATALOGUE_PATH = os.path.join(DATA_DIR, 'ann_catalogue.json')
 
 class RecommenderSystem:
-    def __init__(self):
+    # The index is rescaled when the global statistics have seen this many times the tracks it was scaled with
+    RESCALE_FACTOR = 2
+    # Until the global statistics have seen this many tracks, each request is scaled by its own
+    MIN_GLOBAL_SAMPLES = 1000
+
+    def __init__(self, index=None, normalizer=None, timbre_store=None):
         self.feature_extractor = FeatureExtractor()
-        self.scaler = StandardScaler()
+        # Global running statistics, so a track scales the same way in every request
+        self.normalizer = normalizer if normalizer is not None else get_normalizer(FeatureExtractor.FEATURE_DIM)
+        # MFCC/centroid/rolloff vectors computed offline from preview audio
+        self.timbre_store = timbre_store if timbre_store is not None else get_feature_store(TIMBRE_TABLE, TIMBRE_COLUMNS)
+        # Shared candidate catalogue for index-based recommendations
+        self.index = index if index is not None else get_ann_index(FeatureExtractor.FEATURE_DIM)
+        self.catalogue = {}
+        if index is None:
+            self.load()
 
-    def prepare_data(self, tracks, spotify_client):
+    async def prepare_data(self, tracks, spotify_client):
         """
-        Extracts features for a list of tracks.
+        Extracts features for a list of Track objects.
         Returns a DataFrame of features and a list of track info.
+        Audio features come from the shared feature store; only misses hit Spotify.
         """
-        track_ids = [t['id'] for t in tracks]
-        audio_features_list = spotify_client.get_audio_features(track_ids)
-        
-        feature_vectors = []
-        valid_tracks = []
-        
-        for track, audio_feat in zip(tracks, audio_features_list):
-            # If audio_feat is None (due to API failure), use empty dict to generate zero vector
-            feat_input = audio_feat if audio_feat else {}
-            vector = self.feature_extractor.process_track(track, feat_input)
-            feature_vectors.append(vector)
-            valid_tracks.append(track)
-        
-        if not feature_vectors:
+        track_ids = [t.id for t in tracks]
+        if not track_ids:
             return pd.DataFrame(), []
 
-        X = np.array(feature_vectors)
-        return X, valid_tracks
+        # Columnar path: store matrix -> one preallocated feature array, no per-track dicts.
+        # Tracks without audio features (API failure) keep a zero vector, as before.
+        spotify_X, mask = await spotify_client.get_feature_matrix(track_ids)
+        timbre, timbre_mask, _ = self.timbre_store.get_many(track_ids)
+        X, _ = self.feature_extractor.process_tracks(spotify_X, mask, timbre, timbre_mask)
+        return X, list(tracks)
 
-    def recommend(self, source_tracks, candidate_tracks, spotify_client, top_n=10):
+    async def recommend(self, source_tracks, candidate_tracks, spotify_client, top_n=10):
         """
         Recommends tracks from candidate_tracks based on similarity to source_tracks.
         """
         # 1. Prepare Source Data (User Profile)
-        X_source, _ = self.prepare_data(source_tracks, spotify_client)
+        X_source, _ = await self.prepare_data(source_tracks, spotify_client)
         
         # 2. Prepare Candidate Data
-        X_candidates, valid_candidates = self.prepare_data(candidate_tracks, spotify_client)
+        X_candidates, valid_candidates = await self.prepare_data(candidate_tracks, spotify_client)
         
         # If we have no candidates, return empty
         if not valid_candidates:
@@ -53,14 +70,15 @@ class RecommenderSystem:
             # Just return the candidates as is (they are already "recommendations" from Spotify/Artist top tracks)
             return [{'track': t, 'score': 0.0} for t in valid_candidates][:top_n]
 
-        # 3. Normalize
-        # Fit scaler on both to ensure consistent scaling
+        # 3. Normalize with the global statistics (no per-request refit). They only learn
+        # from catalogue ingest (index_tracks); until they have seen MIN_GLOBAL_SAMPLES tracks,
+        # z-score this request's tracks instead, so raw tempo/loudness don't dominate.
         try:
-            X_combined = np.vstack([X_source, X_candidates])
-            self.scaler.fit(X_combined)
-            
-            X_source_scaled = self.scaler.transform(X_source)
-            X_candidates_scaled = self.scaler.transform(X_candidates)
+            normalizer = self.normalizer
+            if normalizer.count < self.MIN_GLOBAL_SAMPLES:
+                normalizer = RunningNormalizer(X_source.shape[1]).partial_fit(np.vstack([X_source, X_candidates]))
+            X_source_scaled = normalizer.transform(X_source)
+            X_candidates_scaled = normalizer.transform(X_candidates)
 
             # 4. Create User Profile Vector (Mean of source tracks)
             user_profile = np.mean(X_source_scaled, axis=0).reshape(1, -1)
@@ -84,11 +102,110 @@ class RecommenderSystem:
         recommendations.sort(key=lambda x: x['score'], reverse=True)
         
         # Filter out tracks that might be in source_tracks (by ID)
-        source_ids = set(t['id'] for t in source_tracks)
-        final_recs = [r for r in recommendations if r['track']['id'] not in source_ids]
+        source_ids = set(t.id for t in source_tracks)
+        final_recs = [r for r in recommendations if r['track'].id not in source_ids]
         
         # Ensure we return something even if all filtered (unlikely)
         if not final_recs:
              final_recs = recommendations
         
         return final_recs[:top_n]
+
+    # --- Index-based recommendations (large shared catalogue) ---
+
+    async def index_tracks(self, tracks, spotify_client):
+        """
+        Adds tracks to the candidate index incrementally (no rebuild).
+        Their features are folded into the global normalizer. The index scales its
+        vectors with a frozen copy of those statistics (so every stored vector and
+        every query use the same ones) and is rescaled once the global stats have
+        seen RESCALE_FACTOR times as many tracks.
+        Tracks without audio features are skipped. Timbre is whatever the timbre
+        store has: run analyze_timbre first (offline, whole catalogue at once) to fill it.
+        """
+        X, valid_tracks = await self.prepare_data(tracks, spotify_client)
+        if not valid_tracks:
+            return 0
+        has_features = np.any(X != 0, axis=1)
+        if not has_features.any():
+            return 0
+        kept = [t for t, ok in zip(valid_tracks, has_features) if ok]
+        X = X[has_features]
+        self.normalizer.partial_fit(X)
+        stats = self.index.normalizer
+        if stats is None or self.normalizer.count >= stats.count * self.RESCALE_FACTOR:
+            self.index.set_normalizer(self.normalizer)
+        self.index.add([t.id for t in kept], X)
+        for t in kept:
+            self.catalogue[t.id] = t
+        return len(kept)
+
+    def analyze_timbre(self, tracks):
+        """
+        Downloads and analyses the previews of tracks missing from the timbre store
+        (blocking: preview cache threads + the shared analysis pool). Tracks without a
+        usable preview get a negative entry. Returns the number of tracks analysed.
+        """
+        _, _, missing = self.timbre_store.get_many([t.id for t in tracks])
+        if not missing or not can_decode_previews():
+            return 0
+        missing = set(missing)
+        todo = {t.id: t.preview_url for t in tracks if t.id in missing}
+        paths = dict(get_preview_cache().fetch_many(todo))
+        stored = analyze_previews({tid: p for tid, p in paths.items() if p}, self.timbre_store)
+        unavailable = {tid: None for tid in todo if not paths.get(tid)}
+        self.timbre_store.put_many(unavailable)
+        return stored
+
+    async def build_profile(self, source_tracks, spotify_client):
+        """User profile vector (mean of source tracks) in index space, or None."""
+        X_source, _ = await self.prepare_data(source_tracks, spotify_client)
+        if len(X_source) == 0 or np.all(X_source == 0):
+            return None
+        # Scaled with the statistics the index vectors were scaled with
+        stats = self.index.normalizer or self.normalizer
+        return np.mean(stats.transform(X_source), axis=0)
+
+    def recommend_from_index(self, profile, k=10, exclude_ids=None):
+        """
+        Top-k catalogue tracks closest (cosine) to profile, via the ANN index.
+        Scans only the nearest inverted lists and uses partial top-k selection.
+        """
+        if profile is None or len(self.index) == 0:
+            return []
+        hits = self.index.search(profile, k=k, exclude=set(exclude_ids or ()))
+        return [
+            {'track': self.catalogue.get(tid) or Track(tid, None, ()), 'score': score}
+            for tid, score in hits
+        ]
+
+    def save(self, catalogue_path=CATALOGUE_PATH):
+        """Persists the catalogue index, its track records and the normalizer statistics to data/."""
+        self.index.save()
+        self.normalizer.save()
+        os.makedirs(os.path.dirname(catalogue_path), exist_ok=True)
+        tmp = catalogue_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump([t.to_dict() for t in list(self.catalogue.values())], f)
+        os.replace(tmp, catalogue_path)
+
+    def load(self, catalogue_path=CATALOGUE_PATH):
+        """Loads the track records saved with the index (the index itself loads in get_ann_index)."""
+        if not os.path.exists(catalogue_path):
+            return
+        try:
+            with open(catalogue_path) as f:
+                self.catalogue = {d['id']: Track(**d) for d in json.load(f)}
+        except Exception as e:
+            print(f"Failed to load ANN catalogue: {e}")
+
+
+_recommender = None
+
+
+def get_recommender():
+    """Process-wide recommender over the shared ANN index, normalizer and catalogue."""
+    global _recommender
+    if _recommender is None:
+        _recommender = RecommenderSystem()
+    return _recommender
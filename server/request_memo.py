@@ -0,0 +1,68 @@
+import asyncio
+
+# Largest page the paged /me/* endpoints return; fetching it once lets every
+# smaller query in the same request be served by slicing.
+MAX_PAGE_LIMIT = 50
+
+
+class RequestMemo:
+    """
+    Request-scoped memoization of Spotify calls.
+    - paged(): list endpoints keyed by (method, time_range, ...). A result fetched
+      with a large limit serves every smaller limit for the same key.
+    - once(): exact-key calls.
+    Concurrent callers for the same key await the same in-flight task.
+    """
+    def __init__(self, fetch_limit=MAX_PAGE_LIMIT):
+        self.fetch_limit = fetch_limit
+        self._paged = {}  # key -> (limit, task)
+        self._once = {}   # key -> task
+        self.hits = 0
+        self.misses = 0
+
+    async def paged(self, key, limit, fetch):
+        """
+        fetch(n) must return a Spotify paging object ({'items': [...], ...}).
+        """
+        entry = self._paged.get(key)
+        if entry is not None and entry[0] >= limit:
+            self.hits += 1
+            task = entry[1]
+        else:
+            self.misses += 1
+            fetch_limit = max(limit, self.fetch_limit)
+            task = asyncio.ensure_future(fetch(fetch_limit))
+            self._paged[key] = (fetch_limit, task)
+
+        try:
+            result = await asyncio.shield(task)
+        except Exception:
+            # Don't pin a failure for the rest of the request
+            if self._paged.get(key, (None, None))[1] is task:
+                del self._paged[key]
+            raise
+        return self._slice(result, limit)
+
+    async def once(self, key, fetch):
+        task = self._once.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._once[key] = task
+
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if self._once.get(key) is task:
+                del self._once[key]
+            raise
+
+    @staticmethod
+    def _slice(result, limit):
+        if not result or len(result.get('items', [])) <= limit:
+            return result
+        sliced = dict(result)
+        sliced['items'] = result['items'][:limit]
+        return sliced
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from rate_limiter import background_priority
+
+
+def normalize_key(*parts):
+    """Cache key for a user-independent query: case/whitespace-insensitive strings."""
+    return tuple(' '.join(p.lower().split()) if isinstance(p, str) else p for p in parts)
+
+
+class SharedCache:
+    """
+    Process-wide stale-while-revalidate cache for Spotify queries whose answer
+    doesn't depend on the user (new releases, decade/genre searches, artist top tracks).
+    - Fresh entries (age < ttl) are served directly.
+    - Stale entries (ttl <= age < ttl + stale_ttl) are served immediately and
+      refreshed in the background at BACKGROUND priority.
+    - Older entries are refetched inline, but if that fetch fails the last good
+      value is still served (Spotify outages don't empty the page).
+    - Concurrent misses for one key share a single upstream call.
+    Bounded LRU by entry count.
+    """
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, fetched_at, ttl, stale_ttl)
+        self._in_flight = {}           # key -> Future
+        self._refreshing = set()       # background refresh tasks (kept referenced)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors_served_stale = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key, fetch, ttl, stale_ttl=None):
+        """
+        fetch: zero-arg coroutine function producing the value.
+        stale_ttl defaults to ttl (serve-while-refreshing window).
+        """
+        stale_ttl = ttl if stale_ttl is None else stale_ttl
+        entry = self._entries.get(key)
+        now = time.time()
+
+        if entry is not None:
+            value, fetched_at, _, _ = entry
+            age = now - fetched_at
+            self._entries.move_to_end(key)
+            if age < ttl:
+                self.hits += 1
+                return value
+            if age < ttl + stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(key, fetch, ttl, stale_ttl)
+                return value
+
+        self.misses += 1
+        try:
+            return await self._fetch(key, fetch, ttl, stale_ttl)
+        except Exception as e:
+            if entry is not None:
+                self.errors_served_stale += 1
+                print(f"Serving last good value for {key}: {e}")
+                return entry[0]
+            raise
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'errors_served_stale': self.errors_served_stale,
+            'in_flight': len(self._in_flight),
+        }
+
+    async def _fetch(self, key, fetch, ttl, stale_ttl):
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_and_store(key, fetch, ttl, stale_ttl))
+            self._in_flight[key] = future
+        return await asyncio.shield(future)
+
+    async def _fetch_and_store(self, key, fetch, ttl, stale_ttl):
+        try:
+            value = await fetch()
+            self._entries[key] = (value, time.time(), ttl, stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def _refresh_in_background(self, key, fetch, ttl, stale_ttl):
+        if key in self._in_flight:
+            return
+
+        async def refresh():
+            with background_priority():
+                try:
+                    await self._fetch(key, fetch, ttl, stale_ttl)
+                except Exception as e:
+                    print(f"Background refresh failed for {key}: {e}")
+
+        task = asyncio.ensure_future(refresh())
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+
+_cache = None
+
+
+def get_shared_cache():
+    global _cache
+    if _cache is None:
+        _cache = SharedCache()
+    return _cache
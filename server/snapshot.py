@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import time
+
+
+class BackgroundSnapshot:
+    """
+    Base for catalogue data that a background job builds and every worker serves
+    from memory: a JSON snapshot in data/, reloaded by mtime, rebuilt on a
+    schedule by whichever worker takes the lock file.
+    Subclasses implement build(sp), _load(data) and _dump().
+    """
+    REFRESH_INTERVAL = 24 * 3600
+    # A lock older than this belongs to a crashed builder
+    STALE_LOCK_SECONDS = 3600
+
+    def __init__(self, path):
+        self.path = path
+        self.built_at = 0.0
+        self._loaded_mtime = None
+
+    async def build(self, sp):
+        raise NotImplementedError
+
+    def _load(self, data):
+        raise NotImplementedError
+
+    def sizes(self):
+        """Items per pool key (for /metrics)."""
+        raise NotImplementedError
+
+    def _dump(self):
+        raise NotImplementedError
+
+    def maybe_reload(self):
+        """Loads the on-disk snapshot if it is newer than what's in memory."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._load(data)
+            self.built_at = data.get('built_at', mtime)
+            self._loaded_mtime = mtime
+            return True
+        except Exception as e:
+            print(f"Failed to load {self.path}: {e}")
+            return False
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = self._dump()
+        data['built_at'] = self.built_at
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self._loaded_mtime = os.path.getmtime(self.path)
+
+    async def run_forever(self, app_token, interval=None):
+        """
+        Startup/periodic job: loads the snapshot and rebuilds it once it's older than
+        `interval`. Only one worker builds at a time (lock file next to the snapshot).
+        """
+        interval = interval or self.REFRESH_INTERVAL
+        while True:
+            self.maybe_reload()
+            if time.time() - self.built_at > interval and self._try_lock():
+                try:
+                    # Another worker may have finished a build between our check and the lock
+                    self.maybe_reload()
+                    if time.time() - self.built_at > interval:
+                        await self.build(await app_token.client())
+                except Exception as e:
+                    print(f"{type(self).__name__} build failed: {e}")
+                finally:
+                    self._unlock()
+            await asyncio.sleep(min(interval, 600))
+
+    def _try_lock(self):
+        lock_path = self.path + '.lock'
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        try:
+            if os.path.exists(lock_path) and time.time() - os.path.getmtime(lock_path) > self.STALE_LOCK_SECONDS:
+                os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self):
+        try:
+            os.remove(self.path + '.lock')
+        except OSError:
+            pass
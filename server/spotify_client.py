@@ -1,79 +1,221 @@
 import spotipy
 from spotipy.exceptions import SpotifyException
+import asyncio
 import random
+from contextlib import aclosing
+import numpy as np
+from request_memo import RequestMemo
+from feature_store import get_feature_store
+from artist_store import get_artist_store
+from track import Track
+from shared_cache import get_shared_cache, normalize_key
+from constraints import ConstraintQuery
+from genre_index import GenreIndex
+from metrics import RECOMMENDATION_PATH, CLIENT_ERRORS
 
 class SpotifyClient:
-    def __init__(self, sp):
+    # Max concurrent Spotify calls in one search-fallback fan-out
+    SEARCH_CONCURRENCY = 6
+    # The fan-out stops once it has this many times `limit` unique tracks
+    SEARCH_OVERSAMPLE = 2
+    # ...and this many times when target_/min_/max_ constraints will filter the pool
+    CONSTRAINED_OVERSAMPLE = 4
+
+    # Shared-cache TTLs (seconds) for user-independent queries; stale entries are
+    # served for as long again while they refresh in the background
+    NEW_RELEASES_TTL = 6 * 3600
+    GENRE_SEARCH_TTL = 6 * 3600
+    DECADE_SEARCH_TTL = 24 * 3600
+    ARTIST_TOP_TRACKS_TTL = 24 * 3600
+
+    # Hardcoded safe genres to avoid slow API call on startup (built once, not per request)
+    VALID_GENRES = frozenset({
+        'acoustic', 'afrobeat', 'alt-rock', 'alternative', 'ambient', 'anime', 
+        'black-metal', 'bluegrass', 'blues', 'bossanova', 'brazil', 'breakbeat', 
+        'british', 'cantopop', 'chicago-house', 'children', 'chill', 'classical', 
+        'club', 'comedy', 'country', 'dance', 'dancehall', 'death-metal', 
+        'deep-house', 'detroit-techno', 'disco', 'disney', 'drum-and-bass', 'dub', 
+        'dubstep', 'edm', 'electro', 'electronic', 'emo', 'folk', 'forro', 'french', 
+        'funk', 'garage', 'german', 'gospel', 'goth', 'grindcore', 'groove', 
+        'grunge', 'guitar', 'happy', 'hard-rock', 'hardcore', 'hardstyle', 
+        'heavy-metal', 'hip-hop', 'holidays', 'honky-tonk', 'house', 'idm', 
+        'indian', 'indie', 'indie-pop', 'industrial', 'iranian', 'j-dance', 'j-idol', 
+        'j-pop', 'j-rock', 'jazz', 'k-pop', 'kids', 'latin', 'latino', 'malay', 
+        'mandopop', 'metal', 'metal-misc', 'metalcore', 'minimal-techno', 'movies', 
+        'mpb', 'new-age', 'new-release', 'opera', 'pagode', 'party', 'philippines-opm', 
+        'piano', 'pop', 'pop-film', 'post-dubstep', 'power-pop', 'progressive-house', 
+        'psych-rock', 'punk', 'punk-rock', 'r-n-b', 'rainy-day', 'reggae', 'reggaeton', 
+        'road-trip', 'rock', 'rock-n-roll', 'rockabilly', 'romance', 'sad', 'salsa', 
+        'samba', 'sertanejo', 'show-tunes', 'singer-songwriter', 'ska', 'sleep', 
+        'songwriter', 'soul', 'soundtracks', 'spanish', 'study', 'summer', 'swedish', 
+        'synth-pop', 'tango', 'techno', 'trance', 'trip-hop', 'turkish', 'work-out', 
+        'world-music'
+    })
+
+    def __init__(self, sp, feature_store=None, shared_cache=None, taste=None, library=None, artist_store=None):
         self.sp = sp
-        # Hardcoded safe genres to avoid slow API call on startup
-        self.valid_genres = {
-            'acoustic', 'afrobeat', 'alt-rock', 'alternative', 'ambient', 'anime', 
-            'black-metal', 'bluegrass', 'blues', 'bossanova', 'brazil', 'breakbeat', 
-            'british', 'cantopop', 'chicago-house', 'children', 'chill', 'classical', 
-            'club', 'comedy', 'country', 'dance', 'dancehall', 'death-metal', 
-            'deep-house', 'detroit-techno', 'disco', 'disney', 'drum-and-bass', 'dub', 
-            'dubstep', 'edm', 'electro', 'electronic', 'emo', 'folk', 'forro', 'french', 
-            'funk', 'garage', 'german', 'gospel', 'goth', 'grindcore', 'groove', 
-            'grunge', 'guitar', 'happy', 'hard-rock', 'hardcore', 'hardstyle', 
-            'heavy-metal', 'hip-hop', 'holidays', 'honky-tonk', 'house', 'idm', 
-            'indian', 'indie', 'indie-pop', 'industrial', 'iranian', 'j-dance', 'j-idol', 
-            'j-pop', 'j-rock', 'jazz', 'k-pop', 'kids', 'latin', 'latino', 'malay', 
-            'mandopop', 'metal', 'metal-misc', 'metalcore', 'minimal-techno', 'movies', 
-            'mpb', 'new-age', 'new-release', 'opera', 'pagode', 'party', 'philippines-opm', 
-            'piano', 'pop', 'pop-film', 'post-dubstep', 'power-pop', 'progressive-house', 
-            'psych-rock', 'punk', 'punk-rock', 'r-n-b', 'rainy-day', 'reggae', 'reggaeton', 
-            'road-trip', 'rock', 'rock-n-roll', 'rockabilly', 'romance', 'sad', 'salsa', 
-            'samba', 'sertanejo', 'show-tunes', 'singer-songwriter', 'ska', 'sleep', 
-            'songwriter', 'soul', 'soundtracks', 'spanish', 'study', 'summer', 'swedish', 
-            'synth-pop', 'tango', 'techno', 'trance', 'trip-hop', 'turkish', 'work-out', 
-            'world-music'
-        }
+        # Per-user TasteSnapshot (built in the background); None means fetch live
+        self.taste = taste
+        # Per-user synced library (liked tracks, playlists); None until the first sync finishes
+        self.library = library
+        # Results that are the same for every user (new releases, genre/decade searches, ...)
+        self.shared = shared_cache if shared_cache is not None else get_shared_cache()
+        # Audio features never change per track, so they live in a store shared by all users
+        self.feature_store = feature_store if feature_store is not None else get_feature_store()
+        # Artist metadata, top tracks and track -> artist IDs, shared by all users
+        self.artist_store = artist_store if artist_store is not None else get_artist_store()
+        # One SpotifyClient is built per request, so this memo is request-scoped
+        self._memo = RequestMemo()
+
+    # --- Memoized /me/* fetches (shared by every method in this request) ---
+    # Served from the user's taste snapshot when there is one.
+
+    async def _top_artists(self, limit, time_range='medium_term'):
+        page = self.taste.top_artists_page(limit, time_range) if self.taste is not None else None
+        if page is not None:
+            return page
+        return await self._memo.paged(
+            ('top_artists', time_range), limit,
+            lambda n: self.sp.current_user_top_artists(limit=n, time_range=time_range)
+        )
+
+    async def _top_tracks(self, limit, time_range='medium_term'):
+        page = self.taste.top_tracks_page(limit, time_range) if self.taste is not None else None
+        if page is not None:
+            return page
+        return await self._memo.paged(
+            ('top_tracks', time_range), limit,
+            lambda n: self.sp.current_user_top_tracks(limit=n, time_range=time_range)
+        )
+
+    async def _saved_tracks(self, limit):
+        page = self.taste.saved_tracks_page(limit) if self.taste is not None else None
+        if page is not None:
+            return page
+        return await self._memo.paged(
+            ('saved_tracks',), limit,
+            lambda n: self.sp.current_user_saved_tracks(limit=n)
+        )
+
+    async def get_feature_matrix(self, track_ids):
+        """
+        Audio features for track_ids as a float32 (n, d) matrix plus a mask of rows that have features.
+        Only IDs missing from the shared store cost a round-trip (batched 100 per call).
+        """
+        return await self.feature_store.ensure(track_ids, self.sp.audio_features)
 
-    def get_user_profile(self):
-        return self.sp.current_user()
+    async def get_audio_features(self, track_ids):
+        """Audio features as dicts (None where unavailable), aligned with track_ids."""
+        X, mask = await self.get_feature_matrix(track_ids)
+        columns = self.feature_store.columns
+        return [
+            dict(zip(columns, row.tolist()), id=tid) if ok else None
+            for tid, row, ok in zip(track_ids, X, mask)
+        ]
 
-    def get_liked_tracks(self, limit=20):
+    # --- Shared (user-independent) queries ---
+
+    async def _search_tracks_shared(self, q, limit, offset=0, ttl=GENRE_SEARCH_TTL):
+        async def fetch():
+            results = await self.sp.search(q=q, type='track', limit=limit, offset=offset)
+            return [self._format_track(t) for t in results['tracks']['items']]
+        return await self.shared.get(normalize_key('search', q, limit, offset), fetch, ttl)
+
+    async def _artist_top_tracks_shared(self, artist_id, country='US'):
+        async def fetch():
+            # The persistent store outlives this process's cache (and is shared with other workers)
+            stored = self.artist_store.top_tracks(artist_id, country, self.ARTIST_TOP_TRACKS_TTL)
+            if stored is not None:
+                return stored
+            top = await self.sp.artist_top_tracks(artist_id, country=country)
+            self.artist_store.record_tracks(top['tracks'])
+            tracks = [self._format_track(t) for t in top['tracks']]
+            self.artist_store.put_top_tracks(artist_id, country, tracks)
+            return tracks
+        return await self.shared.get(
+            normalize_key('artist_top_tracks', artist_id, country), fetch, self.ARTIST_TOP_TRACKS_TTL
+        )
+
+    async def get_artists(self, artist_ids):
+        """{artist_id: artist} (name, genres, images); misses are fetched 50 per call and cached for everyone."""
+        async def fetch(batch):
+            return (await self.sp.artists(batch))['artists']
+        return await self.artist_store.ensure(artist_ids, fetch)
+
+    async def get_user_profile(self):
+        return await self.sp.current_user()
+
+    async def get_liked_tracks(self, limit=20):
+        if self.library is not None:
+            try:
+                return await asyncio.to_thread(self.library.saved_tracks, limit)
+            except Exception as e:
+                print(f"Library read failed: {e}")
+                CLIENT_ERRORS.labels('library').inc()
         try:
-            results = self.sp.current_user_saved_tracks(limit=limit)
+            results = await self._saved_tracks(limit)
             return [self._format_track(item['track']) for item in results['items']]
         except Exception:
             return []
 
-    def get_user_playlists(self):
+    async def get_user_playlists(self):
+        if self.library is not None:
+            try:
+                playlists = await asyncio.to_thread(self.library.playlists)
+                return [{'id': p['id'], 'name': p['name']} for p in playlists]
+            except Exception as e:
+                print(f"Library read failed: {e}")
+                CLIENT_ERRORS.labels('library').inc()
         try:
-            results = self.sp.current_user_playlists(limit=20)
+            results = await self.sp.current_user_playlists(limit=20)
             return [{'id': i['id'], 'name': i['name']} for i in results['items']]
         except Exception:
             return []
 
-    def get_top_genres(self, limit=10):
+    async def get_top_genres(self, limit=10):
+        if self.taste is not None and self.taste.genres is not None:
+            return self.taste.genres[:limit]
         try:
-            results = self.sp.current_user_top_artists(limit=20, time_range='medium_term')
-            genres = {}
-            for artist in results['items']:
-                for genre in artist['genres']:
-                    genres[genre] = genres.get(genre, 0) + 1
-            return sorted(genres.items(), key=lambda x: x[1], reverse=True)[:limit]
+            results = await self._top_artists(20)
+            return GenreIndex.from_artists(results['items']).top_genres(limit)
         except Exception:
             return []
 
-    def get_top_artists(self, limit=10):
+    async def get_genre_index(self):
+        """GenreIndex over the user's top artists (every time_range when the taste snapshot has them)."""
+        if self.taste is not None and self.taste.genre_index is not None:
+            return self.taste.genre_index
+
+        async def build():
+            results = await self._top_artists(50)
+            return GenreIndex.from_artists(results['items'])
         try:
-            results = self.sp.current_user_top_artists(limit=limit, time_range='medium_term')
+            return await self._memo.once('genre_index', build)
+        except Exception as e:
+            print(f"Genre index build failed: {e}")
+            CLIENT_ERRORS.labels('genre_index').inc()
+            return None
+
+    async def get_top_artists(self, limit=10):
+        try:
+            results = await self._top_artists(limit)
             return [{'name': i['name'], 'image_url': i['images'][0]['url'] if i['images'] else None, 'external_url': i['external_urls']['spotify']} for i in results['items']]
         except Exception:
             return []
 
-    def get_top_tracks(self, limit=10):
+    async def get_top_tracks(self, limit=10):
         try:
-            results = self.sp.current_user_top_tracks(limit=limit, time_range='medium_term')
+            results = await self._top_tracks(limit)
             return [self._format_track(item) for item in results['items']]
         except Exception:
             return []
 
-    def get_new_releases(self, limit=10):
+    async def get_new_releases(self, limit=10):
         try:
-            results = self.sp.new_releases(limit=limit, country='US')
+            # Same for every user: fetch the full page once into the shared cache, slice per caller
+            async def fetch():
+                return await self.sp.new_releases(limit=50, country='US')
+            results = await self.shared.get(normalize_key('new_releases', 'US'), fetch, self.NEW_RELEASES_TTL)
             # New releases are albums, so we need to format differently or pick first track? 
             # Actually, standard format requires 'track' structure. 
             # API returns albums. Let's return simplified album objects or adapt.
@@ -87,166 +229,328 @@ class SpotifyClient:
                 'image_url': i['images'][0]['url'] if i['images'] else None, 
                 'external_url': i['external_urls']['spotify'],
                 'release_date': i['release_date']
-            } for i in results['albums']['items']]
+            } for i in results['albums']['items'][:limit]]
         except Exception:
             return []
 
-    def get_recommendations(self, seed_tracks=None, seed_genres=None, seed_artists=None, limit=10, **kwargs):
-        """
-        Robust recommendation fetcher. Tries standard API, falls back to Search/TopTracks.
-        """
+    def _seed_params(self, seed_tracks, seed_genres, seed_artists):
         seeds = {}
         if seed_tracks: seeds['seed_tracks'] = seed_tracks[:5]
         elif seed_genres: seeds['seed_genres'] = seed_genres[:5]
         elif seed_artists: seeds['seed_artists'] = seed_artists[:5]
         else: seeds['seed_genres'] = ['pop']
+        return seeds
 
-        # Attempt 1: Standard API (might 404)
+    async def _standard_recommendations(self, seeds, limit, kwargs):
+        """Attempt 1: Standard API (might 404). Returns None when it fails or comes back empty."""
         try:
-            results = self.sp.recommendations(limit=limit, **seeds, **kwargs)
-            if results['tracks']: return [self._format_track(t) for t in results['tracks']]
+            results = await self.sp.recommendations(limit=limit, **seeds, **kwargs)
+            if results['tracks']:
+                RECOMMENDATION_PATH.labels('standard').inc()
+                return [self._format_track(t) for t in results['tracks']]
         except Exception as e:
             print(f"Standard Rec API failed: {e}")
+            CLIENT_ERRORS.labels('standard_recommendations').inc()
+        return None
+
+    async def get_recommendations(self, seed_tracks=None, seed_genres=None, seed_artists=None, limit=10, **kwargs):
+        """
+        Robust recommendation fetcher. Tries standard API, falls back to Search/TopTracks.
+        """
+        seeds = self._seed_params(seed_tracks, seed_genres, seed_artists)
+        recs = await self._standard_recommendations(seeds, limit, kwargs)
+        if recs:
+            return recs
 
         # Attempt 2: Search-Based Fallback (The "Manual" Way)
         print("Switching to Search-Based Recommendation Engine...")
-        return self._recommend_via_search(seed_genres, seed_artists, seed_tracks, limit)
+        return await self._recommend_via_search(seed_genres, seed_artists, seed_tracks, limit, **kwargs)
+
+    async def stream_recommendations(self, seed_tracks=None, seed_genres=None, seed_artists=None, limit=10, **kwargs):
+        """
+        Streaming get_recommendations: an async generator of lists of new, unique tracks.
+        The standard API yields once; the search fallback yields as soon as each
+        strategy returns (filtered by the target_/min_/max_ constraints) and stops,
+        cancelling the rest, once `limit` tracks have been emitted.
+        """
+        seeds = self._seed_params(seed_tracks, seed_genres, seed_artists)
+        recs = await self._standard_recommendations(seeds, limit, kwargs)
+        if recs:
+            yield recs[:limit]
+            return
+
+        print("Switching to Search-Based Recommendation Engine (streaming)...")
+        query = ConstraintQuery.compile(kwargs, self.feature_store.columns)
+        seen = set()
+        emitted = 0
+        misses = []  # candidates outside the constraints, for topping up at the end
+        try:
+            async with aclosing(self._search_batches(seed_genres, seed_artists, seed_tracks)) as batches:
+                async for batch in batches:
+                    new = []
+                    for t in batch:
+                        if t.id not in seen:
+                            seen.add(t.id)
+                            new.append(t)
+                    if query and new:
+                        new, missed = await self._split_by_constraints(new, query)
+                        misses.extend(missed)
+                    new = new[:limit - emitted]
+                    if new:
+                        emitted += len(new)
+                        yield new
+                    if emitted >= limit:
+                        break
+        except Exception as e:
+            print(f"Search Fallback failed: {e}")
+            CLIENT_ERRORS.labels('search_fallback').inc()
+
+        if emitted == 0 and not misses:
+            # Ultimate Fallback: Search "Pop"
+            RECOMMENDATION_PATH.labels('genre_pop').inc()
+            try:
+                recs = list(await self._search_tracks_shared("genre:pop", 20))
+                random.shuffle(recs)
+                yield recs[:limit]
+            except Exception as e:
+                print(f"Search Fallback failed: {e}")
+                RECOMMENDATION_PATH.labels('failed').inc()
+                CLIENT_ERRORS.labels('search_fallback').inc()
+            return
+
+        RECOMMENDATION_PATH.labels('search_fallback').inc()
+        if emitted < limit and misses:
+            # Too few tracks satisfied the constraints: top up with the closest misses
+            top_up = await self._apply_constraints(misses, query, limit - emitted)
+            if top_up:
+                yield top_up[:limit - emitted]
 
-    def _recommend_via_search(self, genres, artists, tracks, limit):
+    async def _search_batches(self, genres, artists, tracks):
+        """
+        Runs every fallback strategy concurrently (at most SEARCH_CONCURRENCY Spotify
+        calls in flight) and yields each one's tracks as soon as it completes.
+        Whatever is still running is cancelled when the consumer stops early.
+        """
+        slots = asyncio.Semaphore(self.SEARCH_CONCURRENCY)
+
+        async def call(method, *args, **kwargs):
+            async with slots:
+                return await method(*args, **kwargs)
+
+        jobs = []
+        # Strategy A: Genre Search
+        for g in genres or []:
+            jobs.append(self._genre_seed_tracks(call, g))
+        # Strategy B: Artist Top Tracks (ID or Name)
+        for a_seed in artists or []:
+            jobs.append(self._artist_seed_tracks(call, a_seed))
+        # Strategy C: Tracks -> Artists -> Top Tracks
+        if tracks:
+            jobs.append(self._track_seed_tracks(call, tracks))
+
+        tasks = [asyncio.ensure_future(job) for job in jobs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _recommend_via_search(self, genres, artists, tracks, limit, **constraints):
         """
         Manually constructs a playlist using Search and Artist Top Tracks.
+        The fan-out (_search_batches) stops once enough unique tracks are collected.
+        target_/min_/max_ constraints are applied locally (ConstraintQuery) to the
+        collected pool.
         """
-        recs = []
+        query = ConstraintQuery.compile(constraints, self.feature_store.columns)
         try:
-            # Strategy A: Genre Search
-            if genres:
-                for g in genres:
-                    # Search for tracks in this genre with a random offset for variety
-                    offset = random.randint(0, 50)
-                    q = f"genre:{g}"
-                    results = self.sp.search(q=q, type='track', limit=20, offset=offset)
-                    for t in results['tracks']['items']:
-                        recs.append(self._format_track(t))
-            
-            # Strategy B: Artist Top Tracks (ID or Name)
-            if artists:
-                for a_seed in artists:
-                    try:
-                        # Check if it's a name-based seed (from Sonic Multiverse)
-                        if a_seed.startswith("name:"):
-                            artist_name = a_seed.replace("name:", "")
-                            print(f"Searching for artist: {artist_name}")
-                            
-                            # Try 1: Specific Artist Search
-                            q = f"artist:{artist_name}"
-                            results = self.sp.search(q=q, type='track', limit=10)
-                            if results['tracks']['items']:
-                                for t in results['tracks']['items']:
-                                    recs.append(self._format_track(t))
-                            else:
-                                # Try 2: General Search (Brute Force)
-                                print(f"Specific search failed, trying general: {artist_name}")
-                                results = self.sp.search(q=artist_name, type='track', limit=10)
-                                for t in results['tracks']['items']:
-                                    recs.append(self._format_track(t))
-
-                        else:
-                            # It's an ID (standard fallback)
-                            top = self.sp.artist_top_tracks(a_seed, country='US')
-                            if top['tracks']:
-                                for t in top['tracks']:
-                                    recs.append(self._format_track(t))
-                            else:
-                                # Fallback: Search by Name if ID fails
-                                artist_info = self.sp.artist(a_seed)
-                                q = f"artist:{artist_info['name']}"
-                                results = self.sp.search(q=q, type='track', limit=10)
-                                for t in results['tracks']['items']:
-                                    recs.append(self._format_track(t))
-                    except Exception as e:
-                        print(f"Artist search error for {a_seed}: {e}")
-                        pass
-
-            # Strategy C: Tracks -> Artists -> Top Tracks
-            if tracks:
-                # Fetch full track info to get artist IDs
-                try:
-                    full_tracks = self.sp.tracks(tracks[:5])
-                    artist_ids = set()
-                    for t in full_tracks['tracks']:
-                        if t and t['artists']:
-                            artist_ids.add(t['artists'][0]['id'])
-                    
-                    for a_id in list(artist_ids)[:3]:
-                        try:
-                            top = self.sp.artist_top_tracks(a_id, country='US')
-                            for t in top['tracks']:
-                                recs.append(self._format_track(t))
-                        except:
-                            pass
-                except:
-                    pass
+            # Oversample so the shuffle still mixes strategies (and the constraints have room to filter)
+            target = limit * (self.CONSTRAINED_OVERSAMPLE if query else self.SEARCH_OVERSAMPLE)
+            pool = {}
+            async with aclosing(self._search_batches(genres, artists, tracks)) as batches:
+                async for batch in batches:
+                    for t in batch:
+                        pool.setdefault(t.id, t)
+                    if len(pool) >= target:
+                        break
+
+            recs = list(pool.values())
 
             # If still empty, Ultimate Fallback: Search "Pop"
             if not recs:
-                results = self.sp.search(q="genre:pop", type='track', limit=20)
-                for t in results['tracks']['items']:
-                    recs.append(self._format_track(t))
+                RECOMMENDATION_PATH.labels('genre_pop').inc()
+                recs = list(await self._search_tracks_shared("genre:pop", 20))
+            else:
+                RECOMMENDATION_PATH.labels('search_fallback').inc()
+
+            if query:
+                recs = await self._apply_constraints(recs, query, limit)
 
             # Shuffle and return unique tracks
             random.shuffle(recs)
-            # Deduplicate by ID
-            unique_recs = []
-            seen_ids = set()
-            for r in recs:
-                if r['id'] not in seen_ids:
-                    unique_recs.append(r)
-                    seen_ids.add(r['id'])
-            
-            return unique_recs[:limit]
+            return recs[:limit]
 
         except Exception as e:
             print(f"Search Fallback failed: {e}")
+            RECOMMENDATION_PATH.labels('failed').inc()
+            CLIENT_ERRORS.labels('search_fallback').inc()
             return []
 
-    def search_decade(self, start_year, end_year, limit=10):
-        query = f"year:{start_year}-{end_year}"
+    async def _constraint_inputs(self, recs):
+        X, mask = await self.get_feature_matrix([t.id for t in recs])
+        popularity = [np.nan if t.popularity is None else t.popularity for t in recs]
+        return X, mask, popularity
+
+    async def _apply_constraints(self, recs, query, limit):
+        """The `limit` candidates that best match the query, topped up with the closest misses if too few pass."""
+        try:
+            X, mask, popularity = await self._constraint_inputs(recs)
+        except Exception as e:
+            print(f"Constraint features unavailable: {e}")
+            CLIENT_ERRORS.labels('constraint_features').inc()
+            return recs
+        order = query.rank(X, mask, popularity, strict=False)
+        return [recs[i] for i in order[:limit]]
+
+    async def _split_by_constraints(self, recs, query):
+        """(tracks satisfying the query, best first; the rest)."""
+        try:
+            X, mask, popularity = await self._constraint_inputs(recs)
+        except Exception as e:
+            print(f"Constraint features unavailable: {e}")
+            CLIENT_ERRORS.labels('constraint_features').inc()
+            return recs, []
+        ok, dist = query.evaluate(X, mask, popularity)
+        order = np.lexsort((dist, ~ok))
+        passing = int(ok.sum())
+        return [recs[i] for i in order[:passing]], [recs[i] for i in order[passing:]]
+
+    async def _genre_seed_tracks(self, call, genre):
+        try:
+            # Search for tracks in this genre with a random offset for variety
+            # (offsets step by 10 so the shared cache gets hits across users)
+            offset = random.randrange(0, 51, 10)
+            q = f"genre:{genre}"
+            return await call(self._search_tracks_shared, q, 20, offset)
+        except Exception as e:
+            print(f"Genre search error for {genre}: {e}")
+            CLIENT_ERRORS.labels('genre_search').inc()
+            return []
+
+    async def _artist_seed_tracks(self, call, a_seed):
         try:
-            results = self.sp.search(q=query, type='track', limit=limit)
+            # Check if it's a name-based seed (from Sonic Multiverse)
+            if a_seed.startswith("name:"):
+                artist_name = a_seed.replace("name:", "")
+                print(f"Searching for artist: {artist_name}")
+
+                # Try 1: Specific Artist Search
+                q = f"artist:{artist_name}"
+                results = await call(self.sp.search, q=q, type='track', limit=10)
+                if not results['tracks']['items']:
+                    # Try 2: General Search (Brute Force)
+                    print(f"Specific search failed, trying general: {artist_name}")
+                    results = await call(self.sp.search, q=artist_name, type='track', limit=10)
+                return [self._format_track(t) for t in results['tracks']['items']]
+
+            # It's an ID (standard fallback)
+            top = await call(self._artist_top_tracks_shared, a_seed)
+            if top:
+                return top
+
+            # Fallback: Search by Name if ID fails
+            artist_info = (await call(self.get_artists, [a_seed]))[a_seed]
+            q = f"artist:{artist_info['name']}"
+            results = await call(self.sp.search, q=q, type='track', limit=10)
             return [self._format_track(t) for t in results['tracks']['items']]
+        except Exception as e:
+            print(f"Artist search error for {a_seed}: {e}")
+            CLIENT_ERRORS.labels('artist_search').inc()
+            return []
+
+    async def _track_seed_tracks(self, call, tracks):
+        try:
+            # Artist IDs of tracks we've seen before come from the store; fetch the rest
+            seeds = tracks[:5]
+            known = self.artist_store.track_artists(seeds)
+            unknown = [t for t in seeds if t not in known]
+            if unknown:
+                full_tracks = await call(self.sp.tracks, unknown)
+                self.artist_store.record_tracks(full_tracks['tracks'])
+                known.update(
+                    (t['id'], [a['id'] for a in t['artists']]) for t in full_tracks['tracks'] if t and t['artists']
+                )
+            artist_ids = []
+            for tid in seeds:
+                main_artist = known.get(tid, [None])[0]
+                if main_artist and main_artist not in artist_ids:
+                    artist_ids.append(main_artist)
+
+            results = await asyncio.gather(
+                *(call(self._artist_top_tracks_shared, a_id) for a_id in artist_ids[:3]),
+                return_exceptions=True
+            )
+            recs = []
+            for top in results:
+                if not isinstance(top, Exception):
+                    recs.extend(top)
+            return recs
+        except Exception as e:
+            print(f"Track seed lookup error: {e}")
+            CLIENT_ERRORS.labels('track_seed').inc()
+            return []
+
+    async def search_decade(self, start_year, end_year, limit=10):
+        query = f"year:{start_year}-{end_year}"
+        try:
+            return list(await self._search_tracks_shared(query, limit, ttl=self.DECADE_SEARCH_TTL))
         except Exception:
             return []
 
-    def get_mixed_seeds(self, max_seeds=5):
+    async def get_mixed_seeds(self, max_seeds=5):
         """
         Creates a diverse mix of seeds from multiple sources:
         1. Top tracks (from listening history) - most reliable
         2. Top artists 
         3. Liked tracks (fallback)
         Returns dict with seed_tracks and seed_artists lists.
+        Computed once per request (panels of /features/batch share it).
         """
+        if self.taste is not None and self.taste.mixed_seeds is not None and max_seeds == 5:
+            seeds = self.taste.mixed_seeds
+            return {k: list(v) if isinstance(v, list) else v for k, v in seeds.items()}
+        return await self._memo.once(('mixed_seeds', max_seeds), lambda: self._mixed_seeds(max_seeds))
+
+    async def _mixed_seeds(self, max_seeds):
         seed_tracks = []
         seed_artists = []
         
         # Priority 1: Top tracks (these represent actual listening behavior)
         try:
-            top_tracks = self.sp.current_user_top_tracks(limit=20, time_range='medium_term')
+            top_tracks = await self._top_tracks(20)
             seed_tracks.extend([t['id'] for t in top_tracks['items'][:10]])
+            # Seed tracks resolve to their artists later (search fallback) without sp.tracks
+            self.artist_store.record_tracks(top_tracks['items'][:10])
         except Exception as e:
             print(f"Failed to get top tracks: {e}")
+            CLIENT_ERRORS.labels('mixed_seeds_top_tracks').inc()
         
         # Priority 2: Top artists
         try:
-            top_artists = self.sp.current_user_top_artists(limit=10, time_range='medium_term')
+            top_artists = await self._top_artists(10)
             seed_artists.extend([a['id'] for a in top_artists['items'][:5]])
         except Exception as e:
             print(f"Failed to get top artists: {e}")
+            CLIENT_ERRORS.labels('mixed_seeds_top_artists').inc()
         
         # Priority 3: Liked tracks (if we still need more seeds)
         if len(seed_tracks) < 5:
             try:
-                liked = self.sp.current_user_saved_tracks(limit=20)
+                liked = await self._saved_tracks(20)
                 liked_ids = [item['track']['id'] for item in liked['items'] if item['track']]
+                self.artist_store.record_tracks(item['track'] for item in liked['items'])
                 # Add liked tracks that aren't already in seed_tracks
                 for tid in liked_ids:
                     if tid not in seed_tracks:
@@ -255,6 +559,7 @@ class SpotifyClient:
                             break
             except Exception as e:
                 print(f"Failed to get liked tracks: {e}")
+                CLIENT_ERRORS.labels('mixed_seeds_liked_tracks').inc()
         
         # Spotify API allows max 5 seeds total (tracks + artists + genres combined)
         # Prioritize tracks, then fill with artists
@@ -268,48 +573,44 @@ class SpotifyClient:
             'total_sources': len(seed_tracks) + len(seed_artists)
         }
 
-    def get_audio_profile(self):
+    async def get_audio_profile(self):
         """
         Analyzes user's top tracks to create an audio profile.
         Returns average values for energy, danceability, valence, etc.
         """
+        if self.taste is not None and self.taste.audio_profile is not None:
+            return dict(self.taste.audio_profile)
         try:
             # Get top tracks
-            top_tracks = self.sp.current_user_top_tracks(limit=50, time_range='medium_term')
+            top_tracks = await self._top_tracks(50)
             track_ids = [t['id'] for t in top_tracks['items']]
             
             if not track_ids:
                 return None
             
-            # Get audio features for these tracks
-            features = self.sp.audio_features(track_ids)
-            
-            # Calculate averages
-            valid_features = [f for f in features if f is not None]
-            if not valid_features:
+            # Get audio features for these tracks (served from the shared store when warm)
+            X, mask = await self.get_feature_matrix(track_ids)
+            if not mask.any():
                 return None
             
-            avg_energy = sum(f['energy'] for f in valid_features) / len(valid_features)
-            avg_danceability = sum(f['danceability'] for f in valid_features) / len(valid_features)
-            avg_valence = sum(f['valence'] for f in valid_features) / len(valid_features)
-            avg_acousticness = sum(f['acousticness'] for f in valid_features) / len(valid_features)
-            avg_instrumentalness = sum(f['instrumentalness'] for f in valid_features) / len(valid_features)
-            avg_tempo = sum(f['tempo'] for f in valid_features) / len(valid_features)
+            # Calculate averages
+            avg = dict(zip(self.feature_store.columns, X[mask].mean(axis=0).tolist()))
             
             return {
-                'energy': round(avg_energy * 100),
-                'danceability': round(avg_danceability * 100),
-                'valence': round(avg_valence * 100),  # Happiness
-                'acousticness': round(avg_acousticness * 100),
-                'instrumentalness': round(avg_instrumentalness * 100),
-                'tempo': round(avg_tempo),
-                'tracks_analyzed': len(valid_features)
+                'energy': round(avg['energy'] * 100),
+                'danceability': round(avg['danceability'] * 100),
+                'valence': round(avg['valence'] * 100),  # Happiness
+                'acousticness': round(avg['acousticness'] * 100),
+                'instrumentalness': round(avg['instrumentalness'] * 100),
+                'tempo': round(avg['tempo']),
+                'tracks_analyzed': int(mask.sum())
             }
         except Exception as e:
             print(f"Failed to get audio profile: {e}")
+            CLIENT_ERRORS.labels('audio_profile').inc()
             return None
 
-    def get_listening_stats(self):
+    async def get_listening_stats(self):
         """
         Returns comprehensive listening statistics.
         """
@@ -325,7 +626,7 @@ class SpotifyClient:
         
         try:
             # Top tracks count
-            top_tracks = self.sp.current_user_top_tracks(limit=50, time_range='long_term')
+            top_tracks = await self._top_tracks(50, time_range='long_term')
             stats['total_top_tracks'] = len(top_tracks['items'])
             if top_tracks['items']:
                 t = top_tracks['items'][0]
@@ -337,19 +638,17 @@ class SpotifyClient:
                 }
         except Exception as e:
             print(f"Failed to get top tracks stats: {e}")
+            CLIENT_ERRORS.labels('stats_top_tracks').inc()
         
         try:
             # Top artists count and genres
-            top_artists = self.sp.current_user_top_artists(limit=50, time_range='long_term')
+            top_artists = await self._top_artists(50, time_range='long_term')
             stats['total_top_artists'] = len(top_artists['items'])
             
-            # Collect all genres
-            all_genres = set()
-            for artist in top_artists['items']:
-                all_genres.update(artist['genres'])
-            
-            stats['unique_genres'] = list(all_genres)[:20]  # Top 20 genres
-            stats['total_genres'] = len(all_genres)
+            # Collect all genres, most common first
+            index = GenreIndex.from_artists(top_artists['items'])
+            stats['unique_genres'] = [g for g, _ in index.top_genres(20)]  # Top 20 genres
+            stats['total_genres'] = len(index)
             
             if top_artists['items']:
                 a = top_artists['items'][0]
@@ -361,10 +660,14 @@ class SpotifyClient:
                 }
         except Exception as e:
             print(f"Failed to get top artists stats: {e}")
+            CLIENT_ERRORS.labels('stats_top_artists').inc()
         
         try:
-            # Liked tracks count (approximate)
-            liked = self.sp.current_user_saved_tracks(limit=1)
+            # Liked tracks count (exact once the library is synced)
+            if self.library is not None:
+                stats['total_liked_tracks'] = await asyncio.to_thread(self.library.saved_count)
+                return stats
+            liked = await self._saved_tracks(1)
             stats['total_liked_tracks'] = liked.get('total', 0)
         except Exception:
             pass
@@ -372,13 +675,4 @@ class SpotifyClient:
         return stats
 
     def _format_track(self, track):
-        return {
-            'id': track['id'],
-            'name': track['name'],
-            'artists': [a['name'] for a in track['artists']],
-            'preview_url': track['preview_url'],
-            'external_url': track['external_urls']['spotify'],
-            'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
-            'uri': track['uri']
-        }
-
+        return Track.from_spotify(track)
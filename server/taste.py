@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from artist_store import compact_artist
+from async_spotify import get_client_pool
+from genre_index import GenreIndex
+from rate_limiter import background_priority
+from spotify_client import SpotifyClient
+
+TIME_RANGES = ('short_term', 'medium_term', 'long_term')
+# Largest page of the /me/* endpoints; every smaller query is a slice of it
+PAGE_LIMIT = 50
+TASTE_TTL = int(os.getenv('TASTE_TTL_SECONDS', str(3600)))
+TASTE_MAX_USERS = int(os.getenv('TASTE_MAX_USERS', '2000'))
+
+
+def _compact_track(t):
+    """The fields of a Spotify track object that SpotifyClient reads (a fraction of the full object)."""
+    if not t:
+        return t
+    images = t.get('album', {}).get('images') or []
+    return {
+        'id': t['id'],
+        'name': t['name'],
+        'artists': [{'id': a.get('id'), 'name': a['name']} for a in t.get('artists', [])],
+        'album': {'images': images[:1]},
+        'preview_url': t.get('preview_url'),
+        'external_urls': t.get('external_urls', {}),
+        'uri': t.get('uri'),
+        'popularity': t.get('popularity'),
+    }
+
+
+def _slice(page, limit):
+    if page is None or len(page['items']) <= limit:
+        return page
+    return dict(page, items=page['items'][:limit])
+
+
+class TasteSnapshot:
+    """
+    What one user's listening looks like, built in the background:
+    top tracks/artists for every time_range, liked tracks (first page, compacted to the
+    fields we read), plus the derived mixed seeds, genre histogram, genre index and audio profile.
+    A missing piece (its fetch failed) is None and SpotifyClient fetches it live.
+    """
+    def __init__(self, user_id, top_tracks, top_artists, saved_tracks):
+        self.user_id = user_id
+        self.top_tracks = top_tracks      # time_range -> paging object
+        self.top_artists = top_artists    # time_range -> paging object
+        self.saved_tracks = saved_tracks  # paging object
+        self.mixed_seeds = None
+        self.genres = None                # [(genre, count)] most common first
+        self.audio_profile = None
+        # GenreIndex over the top artists of every time_range (None if none were fetched)
+        self.genre_index = None
+        self.built_at = time.time()
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+    def top_tracks_page(self, limit, time_range):
+        return _slice(self.top_tracks.get(time_range), limit)
+
+    def top_artists_page(self, limit, time_range):
+        return _slice(self.top_artists.get(time_range), limit)
+
+    def saved_tracks_page(self, limit):
+        return _slice(self.saved_tracks, limit)
+
+    @classmethod
+    async def build(cls, sp, feature_store=None):
+        async def page(call, compact, **kwargs):
+            try:
+                result = await call(limit=PAGE_LIMIT, **kwargs)
+                return {'items': [compact(i) for i in result['items']], 'total': result.get('total')}
+            except Exception as e:
+                print(f"Taste snapshot fetch failed ({call.__name__}): {e}")
+                return None
+
+        def compact_saved(item):
+            return {'added_at': item.get('added_at'), 'track': _compact_track(item['track'])}
+
+        user, *pages = await asyncio.gather(
+            sp.current_user(),
+            *(page(sp.current_user_top_tracks, _compact_track, time_range=r) for r in TIME_RANGES),
+            *(page(sp.current_user_top_artists, compact_artist, time_range=r) for r in TIME_RANGES),
+            page(sp.current_user_saved_tracks, compact_saved),
+        )
+        n = len(TIME_RANGES)
+        snapshot = cls(
+            user['id'],
+            top_tracks=dict(zip(TIME_RANGES, pages[:n])),
+            top_artists=dict(zip(TIME_RANGES, pages[n:2 * n])),
+            saved_tracks=pages[2 * n],
+        )
+
+        artists = [a for page in snapshot.top_artists.values() if page for a in page['items']]
+        if artists:
+            snapshot.genre_index = GenreIndex.from_artists(artists)
+
+        # Derived views: the client's own methods, reading from the raw pages above
+        client = SpotifyClient(sp, feature_store, taste=snapshot)
+        snapshot.mixed_seeds, snapshot.genres, snapshot.audio_profile = await asyncio.gather(
+            client.get_mixed_seeds(), client.get_top_genres(limit=None), client.get_audio_profile()
+        )
+        return snapshot
+
+
+class TasteStore:
+    """
+    Bounded LRU of TasteSnapshots keyed by Spotify user ID (sessions map their token
+    hash to it). get() never waits: a missing snapshot is built, and a stale one
+    refreshed, in the background while the request carries on with live calls
+    (first request) or the stale snapshot.
+    """
+    def __init__(self, ttl=TASTE_TTL, max_users=TASTE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._snapshots = OrderedDict()  # user_id -> TasteSnapshot
+        self._sessions = OrderedDict()   # user_key -> user_id
+        self._building = {}              # user_key -> Task
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def get(self, user_key, token):
+        if user_key is None:
+            return None
+        user_id = self._sessions.get(user_key)
+        snapshot = self._snapshots.get(user_id) if user_id is not None else None
+        if snapshot is None:
+            self.misses += 1
+            self._schedule_build(user_key, token, background=False)
+            return None
+
+        self.hits += 1
+        self._sessions.move_to_end(user_key)
+        self._snapshots.move_to_end(user_id)
+        if snapshot.age > self.ttl:
+            self._schedule_build(user_key, token, background=True)
+        return snapshot
+
+    def invalidate(self, user_key):
+        """Logout: forget the session (the user's snapshot ages out of the LRU)."""
+        self._sessions.pop(user_key, None)
+
+    def put(self, user_key, snapshot):
+        self._snapshots[snapshot.user_id] = snapshot
+        self._snapshots.move_to_end(snapshot.user_id)
+        self._sessions[user_key] = snapshot.user_id
+        self._sessions.move_to_end(user_key)
+        while len(self._snapshots) > self.max_users:
+            self._snapshots.popitem(last=False)
+        # Several sessions (devices) per user are fine, but bound them too
+        while len(self._sessions) > 4 * self.max_users:
+            self._sessions.popitem(last=False)
+
+    def stats(self):
+        return {
+            'users': len(self._snapshots),
+            'sessions': len(self._sessions),
+            'building': len(self._building),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
+
+    def _schedule_build(self, user_key, token, background):
+        if user_key in self._building:
+            return
+        task = asyncio.ensure_future(self._build(user_key, token, background))
+        self._building[user_key] = task
+        task.add_done_callback(lambda _: self._building.pop(user_key, None))
+
+    async def _build(self, user_key, token, background):
+        try:
+            sp = get_client_pool().get(token)
+            if background:
+                # Refreshes queue behind interactive calls
+                self.refreshes += 1
+                with background_priority():
+                    snapshot = await TasteSnapshot.build(sp)
+            else:
+                snapshot = await TasteSnapshot.build(sp)
+            self.put(user_key, snapshot)
+        except Exception as e:
+            print(f"Taste snapshot build failed: {e}")
+
+
+_store = None
+
+
+def get_taste_store():
+    global _store
+    if _store is None:
+        _store = TasteStore()
+    return _store
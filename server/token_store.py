@@ -0,0 +1,314 @@
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from async_spotify import AppToken, get_http_client, token_key
+from feature_store import DATA_DIR
+
+# Tokens are refreshed this long before they expire (Spotify issues 1 h tokens)
+REFRESH_AHEAD = int(os.getenv('TOKEN_REFRESH_AHEAD_SECONDS', str(5 * 60)))
+# How often the background loop looks for tokens due for a refresh
+REFRESH_INTERVAL = 60
+# A worker refreshing a user's token holds this long a lease on it (other workers wait for its result)
+REFRESH_LEASE = 30
+# Sessions (the opaque IDs handed to the browser) end this long after login
+SESSION_TTL = int(os.getenv('SESSION_TTL_SECONDS', str(30 * 24 * 3600)))
+# Optional SQLite file that keeps tokens across restarts (unset: memory only).
+# Relative paths are under data/, which is git-ignored (the file holds refresh tokens).
+TOKEN_STORE_PATH = os.getenv('TOKEN_STORE_PATH')
+if TOKEN_STORE_PATH and TOKEN_STORE_PATH != ':memory:':
+    TOKEN_STORE_PATH = os.path.join(DATA_DIR, TOKEN_STORE_PATH)
+
+
+class TokenStore:
+    """
+    OAuth tokens of every logged-in user, keyed by Spotify user ID.
+    Login hands out an opaque random session ID (the cookie); Spotify tokens never
+    leave the server. Sessions map the ID's hash to the user and expire SESSION_TTL
+    after login. resolve() returns the user's current access token, which is
+    refreshed in the background REFRESH_AHEAD before it expires, so no request
+    waits for a refresh or sees an expired token.
+    With a path, tokens and sessions are written through to SQLite, loaded back
+    at startup and looked up there for sessions other workers created. Workers
+    sharing the file refresh through it: the stored row is re-read first, one
+    worker at a time holds a refresh lease, and rows are only replaced or
+    deleted if they still hold what that worker read (compare-and-swap), so a
+    worker with a stale refresh token never clobbers or drops a fresh one.
+    """
+    def __init__(self, path=None, client_id=None, client_secret=None):
+        self.client_id = client_id or os.getenv('SPOTIPY_CLIENT_ID')
+        self.client_secret = client_secret or os.getenv('SPOTIPY_CLIENT_SECRET')
+        self._tokens = {}      # user_id -> token_info (access_token, refresh_token, expires_at, ...)
+        self._sessions = {}    # token_key(session ID) -> (user_id, expires_at)
+        self._refreshing = {}  # user_id -> Task
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+        self._conn = None
+        if path:
+            if path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                columns = [r[1] for r in self._conn.execute("PRAGMA table_info(sessions)")]
+                if columns and 'expires_at' not in columns:
+                    # Sessions used to be keyed by access token: those users log in again
+                    self._conn.execute("DROP TABLE sessions")
+                self._conn.executescript(
+                    "CREATE TABLE IF NOT EXISTS tokens ("
+                    " user_id TEXT PRIMARY KEY, token TEXT NOT NULL, lease_until REAL);"
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    " session_key TEXT PRIMARY KEY, user_id TEXT NOT NULL, expires_at REAL NOT NULL);"
+                )
+                if 'lease_until' not in [r[1] for r in self._conn.execute("PRAGMA table_info(tokens)")]:
+                    self._conn.execute("ALTER TABLE tokens ADD COLUMN lease_until REAL")
+                self._tokens = {u: json.loads(t) for u, t in self._conn.execute("SELECT user_id, token FROM tokens")}
+                self._sessions = {
+                    key: (user_id, expires_at)
+                    for key, user_id, expires_at in self._conn.execute(
+                        "SELECT session_key, user_id, expires_at FROM sessions"
+                    )
+                }
+
+    def __len__(self):
+        return len(self._tokens)
+
+    # --- Sessions ---
+
+    async def login(self, token_info, sp):
+        """
+        Registers the tokens from the OAuth callback (sp is an AsyncSpotify for the
+        new access token) and returns a new session ID, or None if the user can't be read.
+        """
+        try:
+            user = await sp.current_user()
+        except Exception as e:
+            print(f"Token store login failed: {e}")
+            return None
+        self._put(user['id'], token_info)
+        session_id = secrets.token_urlsafe(32)
+        self._add_session(session_id, user['id'])
+        return session_id
+
+    def resolve(self, session_id):
+        """The current access token for a session ID; None when the session is unknown or expired. Never waits."""
+        key = token_key(session_id)
+        session = self._sessions.get(key) or self._load_session(key)
+        if session is None:
+            return None
+        user_id, expires_at = session
+        if expires_at < time.time():
+            self._end_session(key)
+            return None
+        info = self._tokens.get(user_id)
+        if info is None:
+            return None
+        if info.get('expires_at', 0) - time.time() < REFRESH_AHEAD:
+            # Normally the background loop got there first; this covers a stalled loop
+            self._schedule_refresh(user_id)
+        return info['access_token']
+
+    def logout(self, session_id):
+        """Ends the session; the user's tokens go when their last session does."""
+        self._end_session(token_key(session_id))
+
+    # --- Refresh ---
+
+    async def run_forever(self, interval=REFRESH_INTERVAL):
+        """Refreshes every token that expires within REFRESH_AHEAD, every interval seconds."""
+        while True:
+            now = time.time()
+            for key in [k for k, (_, expires_at) in self._sessions.items() if expires_at < now]:
+                self._end_session(key)
+            for user_id, info in list(self._tokens.items()):
+                if info.get('expires_at', 0) - now < REFRESH_AHEAD + interval:
+                    self._schedule_refresh(user_id)
+            await asyncio.sleep(interval)
+
+    def _schedule_refresh(self, user_id):
+        if user_id in self._refreshing:
+            return self._refreshing[user_id]
+        task = asyncio.ensure_future(self._refresh(user_id))
+        self._refreshing[user_id] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(user_id, None))
+        return task
+
+    async def _refresh(self, user_id):
+        known = self._tokens.get(user_id)
+        info, row = self._stored(user_id)
+        if not info or not info.get('refresh_token'):
+            return
+        if known is not None and info['access_token'] != known['access_token']:
+            # Another worker already refreshed; we've just picked up its token
+            return
+        if not self._claim(user_id, row):
+            # Another worker is refreshing right now
+            return
+        try:
+            response = await get_http_client().post(
+                AppToken.TOKEN_URL,
+                data={'grant_type': 'refresh_token', 'refresh_token': info['refresh_token']},
+                auth=(self.client_id, self.client_secret),
+            )
+            if response.status_code == 400 and self._error_code(response) == 'invalid_grant':
+                # Revoked or expired refresh token: the user has to log in again (unless
+                # the stored row changed meanwhile, i.e. our refresh token was just stale)
+                print(f"Token refresh rejected for {user_id}: {response.text}")
+                self.refresh_failures += 1
+                if not self._drop_user(user_id, row):
+                    self._stored(user_id)
+                return
+            # Anything else (invalid_client, 5xx, ...) is not the user's fault: keep their tokens
+            response.raise_for_status()
+            fresh = response.json()
+        except Exception as e:
+            # Retried by the next loop iteration (or request) while the old token is still valid
+            print(f"Token refresh failed for {user_id}: {e}")
+            self.refresh_failures += 1
+            self._release(user_id, row)
+            return
+        # Spotify only sometimes rotates the refresh token
+        fresh.setdefault('refresh_token', info['refresh_token'])
+        fresh['expires_at'] = int(time.time()) + fresh.get('expires_in', 3600)
+        self.refreshes += 1
+        self._put(user_id, fresh, row)
+
+    @staticmethod
+    def _error_code(response):
+        try:
+            return response.json().get('error')
+        except Exception:
+            return None
+
+    def stats(self):
+        return {
+            'users': len(self._tokens),
+            'sessions': len(self._sessions),
+            'refreshing': len(self._refreshing),
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+        }
+
+    # --- Storage ---
+
+    def _put(self, user_id, token_info, row=None):
+        """Stores token_info; with row (the stored text we refreshed from), only if it is still stored."""
+        self._tokens[user_id] = dict(token_info)
+        if row is None:
+            self._write(
+                "INSERT OR REPLACE INTO tokens (user_id, token) VALUES (?, ?)", (user_id, json.dumps(token_info))
+            )
+        elif not self._write(
+            "UPDATE tokens SET token = ?, lease_until = NULL WHERE user_id = ? AND token = ?",
+            (json.dumps(token_info), user_id, row)
+        ):
+            # Someone logged in again meanwhile: theirs is newer
+            self._stored(user_id)
+
+    def _stored(self, user_id):
+        """(token_info, stored row text) as the database has them now; updates our copy."""
+        if self._conn is None:
+            return self._tokens.get(user_id), None
+        with self._lock:
+            row = self._conn.execute("SELECT token FROM tokens WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            # Dropped by another worker (logout or revoked grant)
+            self._forget_user(user_id)
+            return None, None
+        self._tokens[user_id] = json.loads(row[0])
+        return self._tokens[user_id], row[0]
+
+    def _claim(self, user_id, row):
+        """Takes the refresh lease on the stored row; False while another worker holds it."""
+        if row is None:
+            return True
+        now = time.time()
+        return self._write(
+            "UPDATE tokens SET lease_until = ? WHERE user_id = ? AND token = ?"
+            " AND (lease_until IS NULL OR lease_until < ?)", (now + REFRESH_LEASE, user_id, row, now)
+        )
+
+    def _release(self, user_id, row):
+        if row is not None:
+            self._write("UPDATE tokens SET lease_until = NULL WHERE user_id = ? AND token = ?", (user_id, row))
+
+    def _add_session(self, session_id, user_id):
+        key = token_key(session_id)
+        expires_at = time.time() + SESSION_TTL
+        self._sessions[key] = (user_id, expires_at)
+        self._write(
+            "INSERT OR REPLACE INTO sessions (session_key, user_id, expires_at) VALUES (?, ?, ?)",
+            (key, user_id, expires_at)
+        )
+
+    def _load_session(self, key):
+        # A session another worker created since we loaded
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.user_id, s.expires_at, t.token FROM sessions s JOIN tokens t ON t.user_id = s.user_id"
+                " WHERE s.session_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        user_id, expires_at, token = row
+        self._tokens.setdefault(user_id, json.loads(token))
+        self._sessions[key] = (user_id, expires_at)
+        return user_id, expires_at
+
+    def _end_session(self, key):
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return
+        self._write("DELETE FROM sessions WHERE session_key = ?", (key,))
+        user_id = session[0]
+        if all(u != user_id for u, _ in self._sessions.values()):
+            self._tokens.pop(user_id, None)
+            # Other workers' sessions for the user keep the tokens
+            self._write(
+                "DELETE FROM tokens WHERE user_id = ? AND NOT EXISTS (SELECT 1 FROM sessions WHERE user_id = ?)",
+                (user_id, user_id)
+            )
+
+    def _drop_user(self, user_id, row=None):
+        """
+        Deletes the user's tokens and sessions. With row (the stored text this worker
+        read), only if the database still holds exactly that; returns whether it did.
+        """
+        if row is not None:
+            if not self._write("DELETE FROM tokens WHERE user_id = ? AND token = ?", (user_id, row)):
+                return False
+        else:
+            self._write("DELETE FROM tokens WHERE user_id = ?", (user_id,))
+        self._write("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        self._forget_user(user_id)
+        return True
+
+    def _forget_user(self, user_id):
+        self._tokens.pop(user_id, None)
+        for key in [k for k, (u, _) in self._sessions.items() if u == user_id]:
+            del self._sessions[key]
+
+    def _write(self, sql, params):
+        """Runs one statement; returns whether it changed a row (True without a database)."""
+        if self._conn is None:
+            return True
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount > 0
+
+
+_store = None
+
+
+def get_token_store():
+    global _store
+    if _store is None:
+        _store = TokenStore(TOKEN_STORE_PATH)
+    return _store
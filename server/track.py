@@ -0,0 +1,81 @@
+import sys
+
+_EXTERNAL_URL_PREFIX = 'https://open.spotify.com/track/'
+_URI_PREFIX = 'spotify:track:'
+
+
+class Track:
+    """
+    Compact track record used inside the client and recommender.
+    - __slots__, no per-instance dict
+    - artist names and album image URLs are interned (shared across tracks)
+    - uri/external_url are derived from the ID unless Spotify returned something non-standard
+    - popularity is kept for local min_/target_popularity constraints but not serialized
+    Converted to the JSON dict shape only at the response boundary (to_dict / to_json).
+    """
+    __slots__ = ('id', 'name', 'artists', 'preview_url', 'image_url', '_external_url', '_uri', 'popularity')
+
+    def __init__(self, id, name, artists, preview_url=None, image_url=None, external_url=None, uri=None,
+                 popularity=None):
+        self.id = id
+        self.name = name
+        self.artists = tuple(sys.intern(a) for a in artists)
+        self.preview_url = preview_url
+        self.image_url = sys.intern(image_url) if image_url else None
+        self._external_url = None if external_url == _EXTERNAL_URL_PREFIX + str(id) else external_url
+        self._uri = None if uri == _URI_PREFIX + str(id) else uri
+        self.popularity = popularity
+
+    @classmethod
+    def from_spotify(cls, track):
+        """Builds a Track from a Spotify API track object."""
+        images = track['album']['images']
+        return cls(
+            id=track['id'],
+            name=track['name'],
+            artists=[a['name'] for a in track['artists']],
+            preview_url=track['preview_url'],
+            image_url=images[0]['url'] if images else None,
+            external_url=track['external_urls']['spotify'],
+            uri=track['uri'],
+            popularity=track.get('popularity'),
+        )
+
+    @property
+    def external_url(self):
+        return self._external_url or _EXTERNAL_URL_PREFIX + self.id
+
+    @property
+    def uri(self):
+        return self._uri or _URI_PREFIX + self.id
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'artists': list(self.artists),
+            'preview_url': self.preview_url,
+            'external_url': self.external_url,
+            'image_url': self.image_url,
+            'uri': self.uri
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, Track) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.name!r})"
+
+
+def to_json(value):
+    """Recursively converts Track objects (in lists/dicts) into JSON-ready dicts."""
+    if isinstance(value, Track):
+        return value.to_dict()
+    if isinstance(value, list) or isinstance(value, tuple):
+        return [to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    return value